@@ -2,13 +2,17 @@
 Email Productivity Agent - Dark Theme Edition
 Smart Email Management System
 """
+import time
 import streamlit as st
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
 from app.models import Email, PromptConfig, Draft
 from app.services.storage import storage
 from app.services.email_processing import email_processor
 from app.services.agent import email_agent
+from app.services.llm_client import llm_client
+from app.services.compact_inbox import CompactInbox
+from app.services.chat_memory import ChatMemory
 
 
 # Page configuration
@@ -333,18 +337,24 @@ def load_custom_css():
 load_custom_css()
 
 
+# Chat messages shown at first and added by each "Load older"
+CHAT_PAGE = 20
+
+
 # Session state
 def init_session_state():
     if "emails" not in st.session_state:
-        st.session_state.emails = []
+        st.session_state.emails = CompactInbox()
     if "prompts" not in st.session_state:
         st.session_state.prompts = storage.load_prompts()
     if "drafts" not in st.session_state:
         st.session_state.drafts = storage.load_drafts()
     if "selected_email_id" not in st.session_state:
         st.session_state.selected_email_id = None
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+    if "chat_memory" not in st.session_state:
+        st.session_state.chat_memory = ChatMemory(summarize=email_agent.summarize_chat)
+    if "chat_shown" not in st.session_state:
+        st.session_state.chat_shown = CHAT_PAGE
     if "inbox_loaded" not in st.session_state:
         st.session_state.inbox_loaded = False
     if "chat_input_key" not in st.session_state:
@@ -353,19 +363,53 @@ def init_session_state():
 
 def get_selected_email() -> Optional[Email]:
     if st.session_state.selected_email_id:
-        for email in st.session_state.emails:
-            if email.id == st.session_state.selected_email_id:
-                return email
+        return st.session_state.emails.get(st.session_state.selected_email_id)
     return None
 
 
+# Sidebar choices -> days back from now (None loads everything)
+LOAD_RANGES = {"All mail": None, "Last 7 days": 7, "Last 30 days": 30, "Last 365 days": 365}
+
+
 def load_inbox():
     try:
-        emails = storage.load_inbox()
-        if emails:
+        emails = CompactInbox()
+        restored = 0
+        status = st.sidebar.empty()
+        preview = st.sidebar.empty()
+        days = LOAD_RANGES.get(st.session_state.get("load_range"))
+        start = (datetime.now() - timedelta(days=days)).isoformat(timespec="seconds") if days else None
+        emails.indexes.scope = st.session_state.get("load_range") or ""
+        failed = None
+        try:
+            for added in storage.fill_inbox(emails, start=start):
+                chunk = emails[len(emails) - added:]
+                if len(emails) == added:
+                    # Show the first page while the rest of the file streams in
+                    st.session_state.emails = emails
+                    st.session_state.inbox_loaded = True
+                    preview.markdown("\n".join(f"- {e.subject}" for e in chunk[:5]))
+                restored += email_processor.restore_results(chunk)
+                status.caption(f"📥 Loading inbox... {len(emails)} emails so far")
+        except Exception as e:
+            if not emails:
+                raise
+            # The first emails may already be shown: keep them, indexed,
+            # rather than leave a half-loaded inbox without threads or search
+            failed = e
             st.session_state.emails = emails
             st.session_state.inbox_loaded = True
-            st.success(f"✅ Successfully loaded {len(emails)} emails")
+        status.empty()
+        preview.empty()
+        if emails:
+            email_processor.index_emails(emails)
+            email_agent.index_emails(emails)
+            if failed is not None:
+                st.warning(f"⚠️ Only {len(emails)} emails were loaded before an error: {failed}")
+            else:
+                st.success(f"✅ Successfully loaded {len(emails)} emails")
+            if restored:
+                st.caption(f"💾 {restored} already processed; their saved results were restored")
         else:
             st.error("❌ No emails found")
     except Exception as e:
@@ -378,12 +422,33 @@ def process_inbox():
         return
 
     try:
-        with st.spinner("Processing emails..."):
-            st.session_state.emails = email_processor.process_emails(
-                st.session_state.emails,
-                st.session_state.prompts
-            )
-        st.success("✅ All emails processed successfully!")
+        emails = st.session_state.emails
+        total = len(emails)
+        progress = st.sidebar.progress(0.0, text="Processing emails...")
+        counters = st.sidebar.empty()
+        categorized = todos = 0
+        step = max(1, total // 200)
+        for done, email in enumerate(email_processor.iter_process_emails(emails, st.session_state.prompts), 1):
+            categorized += bool(email.category)
+            todos += email.category == "To-Do"
+            if done % step and done != total:
+                continue
+            progress.progress(done / total, text=f"Processing emails... {done}/{total}")
+            counters.caption(f"🏷️ {categorized} categorized · 📝 {todos} to-do · latest: {email.subject[:40]}")
+        progress.empty()
+        counters.empty()
+        failed = [e for e in st.session_state.emails if e.processing_error]
+        if failed:
+            st.warning(f"⚠️ {len(failed)} of {len(st.session_state.emails)} emails failed to process")
+        else:
+            st.success("✅ All emails processed successfully!")
+        stats = email_processor.last_stats
+        mode = "fused" if stats.get("fused") else "separate"
+        st.caption(f"🤖 {stats.get('llm_calls', 0)} LLM calls "
+                   f"({stats.get('calls_per_email', 0.0):.1f} per email, {mode} mode) · "
+                   f"{stats.get('recomputed', 0)} recomputed, {stats.get('duplicates', 0)} reused from "
+                   f"near-duplicates, {stats.get('threaded', 0)} from their thread, "
+                   f"{stats.get('skipped', 0)} unchanged and skipped")
     except Exception as e:
         st.error(f"❌ Error: {str(e)}")
 
@@ -403,6 +468,8 @@ def render_sidebar():
     st.sidebar.markdown("### Control Panel")
     st.sidebar.markdown("---")
 
+    st.sidebar.selectbox("📅 Mail to load", list(LOAD_RANGES), key="load_range")
+
     col1, col2 = st.sidebar.columns(2)
     with col1:
         if st.button("📥 Load Inbox", use_container_width=True, key="load_btn"):
@@ -416,17 +483,21 @@ def render_sidebar():
         st.sidebar.markdown("---")
         st.sidebar.markdown("### 📊 Statistics")
 
+        counts = st.session_state.emails.category_counts()
         total = len(st.session_state.emails)
-        categorized = len([e for e in st.session_state.emails if e.category])
-        todos = len([e for e in st.session_state.emails if e.category == "To-Do"])
+        categorized = total - counts[None]
+        todos = counts.get("To-Do", 0)
 
         st.sidebar.metric("Total Emails", total)
         st.sidebar.metric("Categorized", categorized)
         st.sidebar.metric("Action Items", todos, delta=f"{todos} pending")
 
+        cache = llm_client.cache_stats()
+        st.sidebar.caption(f"⚡ LLM cache: {cache['hits']} hits / {cache['misses']} misses")
+
         st.sidebar.markdown("---")
         st.sidebar.markdown("### 🏷️ Filter")
-        categories = list(set([e.category for e in st.session_state.emails if e.category]))
+        categories = [category for category in counts if category]
         if categories:
             selected_cats = st.sidebar.multiselect(
                 "Select categories",
@@ -458,7 +529,7 @@ def render_inbox(category_filter=None):
 
     display_emails = st.session_state.emails
     if category_filter:
-        display_emails = [e for e in display_emails if e.category in category_filter]
+        display_emails = display_emails.in_categories(category_filter)
 
     for email in display_emails:
         card_html = f"""
@@ -504,6 +575,24 @@ def render_email_detail():
     if email.category:
         st.markdown(get_category_badge(email.category), unsafe_allow_html=True)
 
+    if email.processing_error:
+        st.error(f"❌ Processing failed: {email.processing_error}")
+    elif email.duplicate_of:
+        st.caption(f"♻️ Results reused from near-duplicate email #{email.duplicate_of}")
+
+    thread = st.session_state.emails.indexes.threads.thread_of(email)
+    if len(thread) > 1:
+        with st.expander(f"🧵 Thread ({len(thread)} messages)"):
+            for message in thread:
+                marker = "👉 " if message.id == email.id else ""
+                st.markdown(f"{marker}**{message.sender}** · {message.timestamp} · {message.subject}")
+
+    similar = email_agent.similar_emails(email, st.session_state.emails)
+    if similar:
+        with st.expander(f"🔗 Similar emails ({len(similar)})"):
+            for other, score in similar:
+                st.markdown(f"**{other.subject}** · {other.sender} · {other.timestamp} · {score:.0%} similar")
+
     st.markdown("---")
 
     st.markdown("### 📄 Message")
@@ -535,7 +624,8 @@ def render_email_detail():
                 draft = email_agent.generate_reply_draft(
                     email,
                     st.session_state.prompts,
-                    tone
+                    tone,
+                    indexes=st.session_state.emails.indexes
                 )
                 storage.save_draft(draft)
                 st.session_state.drafts = storage.load_drafts()
@@ -555,10 +645,20 @@ def render_agent_chat():
     selected_email = None
     if selected != "All emails":
         email_id = selected.split(":")[0]
-        selected_email = next((e for e in st.session_state.emails if e.id == email_id), None)
+        selected_email = st.session_state.emails.get(email_id)
+
+    # Display the latest messages; older ones on request
+    memory = st.session_state.chat_memory
+    hidden = len(memory) - st.session_state.chat_shown
+    if hidden > 0:
+        if st.button(f"⬆️ Load older ({hidden} earlier messages)"):
+            st.session_state.chat_shown += CHAT_PAGE
+            st.rerun()
+    if memory.summary:
+        with st.expander("🗂️ Summary of earlier conversation"):
+            st.markdown(memory.summary)
 
-    # Display chat history
-    for msg in st.session_state.chat_history:
+    for msg in memory.recent(st.session_state.chat_shown):
         role = msg.get("role")
         content = msg.get("content")
 
@@ -589,28 +689,18 @@ def render_agent_chat():
             send_btn = st.form_submit_button("📤 Send", use_container_width=True)
 
     if send_btn and user_query:
-        # Add user message
-        st.session_state.chat_history.append({
-            "role": "user",
-            "content": user_query,
-            "timestamp": datetime.now().isoformat()
-        })
-
-        # Get agent response
+        # Get agent response; the memory holds the conversation before this question
         with st.spinner("Agent is thinking..."):
             response = email_agent.run_query(
                 user_query,
                 selected_email,
                 st.session_state.emails,
-                st.session_state.prompts
+                st.session_state.prompts,
+                memory
             )
 
-        # Add agent response
-        st.session_state.chat_history.append({
-            "role": "agent",
-            "content": response,
-            "timestamp": datetime.now().isoformat()
-        })
+        memory.add("user", user_query)
+        memory.add("agent", response)
 
         # Increment key to clear input
         st.session_state.chat_input_key += 1
@@ -625,6 +715,8 @@ def render_drafts():
     st.markdown("All drafts are stored locally and never sent automatically.")
 
     st.session_state.drafts = storage.load_drafts()
+    if storage.draft_error:
+        st.warning(f"⚠️ Drafts could not be written to disk and will be retried: {storage.draft_error}")
 
     with st.expander("➕ Create New Draft", expanded=False):
         to = st.text_input("To:")
@@ -651,6 +743,8 @@ def render_drafts():
             else:
                 st.warning("Please provide instructions")
 
+    render_bulk_replies()
+
     if st.session_state.drafts:
         st.markdown("---")
         st.markdown("### 📝 Saved Drafts")
@@ -685,6 +779,45 @@ def render_drafts():
         st.info("No drafts yet. Create one using the button above or reply to an email.")
 
 
+def render_bulk_replies():
+    emails = st.session_state.emails
+    with st.expander("📬 Bulk Reply Drafts", expanded=False):
+        if not emails:
+            st.info("Load the inbox to draft replies in bulk")
+            return
+        target = st.radio("Reply to", ["A category", "Selected emails"], horizontal=True)
+        if target == "A category":
+            categories = [category for category in emails.category_counts() if category]
+            if not categories:
+                st.info("Process the inbox to reply by category")
+                return
+            default = categories.index("To-Do") if "To-Do" in categories else 0
+            category = st.selectbox("Category", categories, index=default)
+            chosen = emails.in_categories([category])
+        else:
+            labels = st.multiselect("Emails", [f"{e.id}: {e.subject[:60]}" for e in emails])
+            chosen = [emails.get(label.split(":", 1)[0]) for label in labels]
+        tone = st.selectbox("Tone", ["professional", "friendly", "formal"], key="bulk_tone")
+
+        if st.button(f"✍️ Draft {len(chosen)} replies", disabled=not chosen):
+            with st.spinner(f"Drafting {len(chosen)} replies..."):
+                drafts = email_agent.generate_reply_drafts(chosen, st.session_state.prompts, tone,
+                                                           indexes=emails.indexes)
+                started = time.perf_counter()
+                saved = storage.save_drafts(drafts)
+                write_seconds = time.perf_counter() - started
+            stats = email_agent.last_bulk_stats
+            if saved:
+                st.success(f"✅ {len(drafts)} drafts created! Check them below.")
+            else:
+                st.error("❌ Failed to save the drafts")
+            st.caption(f"⚡ {stats['emails']} drafts in {stats['seconds']:.2f}s "
+                       f"({stats['per_second']:.0f}/s) · {stats['llm_batches']} LLM batches on "
+                       f"{stats['workers']} workers · {stats['failed']} fell back to a generic reply · "
+                       f"saved in one write ({write_seconds * 1000:.0f} ms)")
+            st.session_state.drafts = storage.load_drafts()
+
+
 def render_prompt_config():
     st.markdown("## 🧠 Prompt Configuration")
 
@@ -718,16 +851,27 @@ def render_prompt_config():
 
     with col1:
         if st.button("💾 Save Changes", use_container_width=True):
+            old = st.session_state.prompts
+            for prompt, edited in [(old.categorization_prompt, cat_prompt),
+                                   (old.action_item_prompt, action_prompt),
+                                   (old.auto_reply_prompt, reply_prompt)]:
+                if prompt != edited:
+                    llm_client.invalidate_prompt(prompt)
             st.session_state.prompts = PromptConfig(
                 categorization_prompt=cat_prompt,
                 action_item_prompt=action_prompt,
                 auto_reply_prompt=reply_prompt
             )
+            if email_processor.prompt_version(old) != email_processor.prompt_version(st.session_state.prompts):
+                email_processor.invalidate_results(old)
             save_prompts()
 
     with col2:
         if st.button("🔄 Reset to Default", use_container_width=True):
+            old = st.session_state.prompts
             st.session_state.prompts = storage.get_default_prompts()
+            if email_processor.prompt_version(old) != email_processor.prompt_version(st.session_state.prompts):
+                email_processor.invalidate_results(old)
             save_prompts()
             st.rerun()
 
@@ -12,6 +12,10 @@ class Email(BaseModel):
     timestamp: str
     category: Optional[str] = None
     actions: List[Dict[str, Any]] = []
+    processing_error: Optional[str] = None
+    fingerprints: Dict[str, str] = {}
+    duplicate_of: Optional[str] = None
+    thread_id: Optional[str] = None
 
 
 class PromptConfig(BaseModel):
@@ -1,25 +1,242 @@
 """Email agent"""
 import json
-from typing import List, Optional, Dict, Any
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Dict, Any, Sequence, Tuple
 from datetime import datetime
 from app.models import Email, PromptConfig, Draft
-from app.services.llm_client import llm_client
+from app.services.aggregates import InboxAggregates
+from app.services.chat_memory import ChatMemory, Message, extractive_summary
+from app.services.inbox_indexes import InboxIndexes, indexes_for
+from app.services.inbox_reader import chunked
+from app.services.llm_client import LOCAL_PROVIDERS, LLMError, llm_client
+from app.services.storage import storage
+
+# Emails from the whole inbox put in the context of a general question
+RELEVANT_EMAILS = 5
+# Emails listed under "Similar emails"
+SIMILAR_EMAILS = 5
+# Reciprocal rank fusion constant: how much lower ranks still count
+_RRF_K = 60
+CHAT_SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and their email assistant "
+    "with the new messages. Keep facts, decisions, emails referred to and open questions; "
+    "stay under 200 words. Respond with the summary text only."
+)
+# Emails or tasks listed in a direct answer before "... and N more"
+LISTED_ITEMS = 10
+# Other words for a category in a chat question
+CATEGORY_ALIASES = {"urgent": "Important", "junk": "Spam", "newsletters": "Newsletter"}
+
+_WORDS = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+# Plural "deadlines" only: "the deadline for X" asks about one email
+_TASKS = re.compile(r"\b(?:tasks?|action items?|deadlines|to-?do list)\b")
+_COUNT = re.compile(r"\b(?:how many|count|number of)\b")
+_LIST = re.compile(r"\b(?:show|list|which|find|what are|give me|display)\b")
+_ASKS = re.compile(r"^\s*(?:what|which|any|do i have)\b")
+# Requests to write something are left to the LLM, whatever they mention
+_WRITE = re.compile(r"\b(?:draft|reply|respond|write|compose)\b")
+# Questions about the selected email are left to the LLM
+_SELECTED = re.compile(r"\b(?:this|it)\b")
+# Words a direct answer accounts for: intents, count/list words, stopwords.
+# A question with any other word (a sender, a topic, a date) narrows the
+# answer and is left to the LLM.
+_ANSWERED_WORDS = frozenset("""
+    a all an any are by can count current did display do does each email emails find for get give got
+    have how i in inbox is items item action list mail many me messages my number of open outstanding
+    pending per please s show task tasks deadlines to-do todo tell the there upcoming what which you
+""".split())
+
+
+def new_draft_id() -> str:
+    """A draft id that sorts by creation time and is unique even for many
+    drafts created in the same second."""
+    return f"draft_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:12]}"
 
 
 class EmailAgent:
     def __init__(self):
         self.llm = llm_client
+        self.workers = int(os.getenv("DRAFT_WORKERS", str(min(8, os.cpu_count() or 1))))
+        self.last_bulk_stats: Dict[str, Any] = {}
+
+    def index_emails(self, emails: Iterable[Email]) -> int:
+        """Bring the keyword and semantic indexes in line with a freshly loaded inbox.
+
+        The indexes saved by the previous session are loaded first, so only
+        new, changed or deleted emails cost any work; they are saved again
+        if anything changed. New mailbox emails are indexed on the first
+        search instead (see `InboxIndexes.sync_search`). Returns the number
+        of changed emails.
+        """
+        inbox = indexes_for(emails)
+        if not inbox.search_loaded:
+            for index, path in self._index_files(inbox):
+                try:
+                    if path.exists():
+                        index.load(path)
+                except Exception:
+                    index.clear()
+            inbox.search_loaded = True
+        changed = inbox.sync_search(emails)
+        if changed:
+            self._save_indexes(inbox)
+        return changed
+
+    @staticmethod
+    def _index_files(indexes: InboxIndexes):
+        search_file, embeddings_file = storage.index_files(indexes.scope)
+        return (indexes.search, search_file), (indexes.embeddings, embeddings_file)
+
+    def _save_indexes(self, indexes: InboxIndexes) -> None:
+        for index, path in self._index_files(indexes):
+            try:
+                index.save(path)
+            except Exception:
+                pass
+
+    def _searchable(self, all_emails: Sequence[Email]) -> InboxIndexes:
+        """The indexes of `all_emails`, with any deferred mailbox emails indexed."""
+        indexes = indexes_for(all_emails)
+        if indexes.pending and indexes.index_pending():
+            self._save_indexes(indexes)
+        return indexes
+
+    def similar_emails(self, email: Email, all_emails: Sequence[Email],
+                       k: int = SIMILAR_EMAILS) -> List[Tuple[Email, float]]:
+        """The `k` emails closest in meaning to `email`, with their cosine similarity."""
+        lookup = self._lookup(all_emails)
+        similar = []
+        for email_id, score in self._searchable(all_emails).embeddings.similar(email.id, k):
+            found = lookup(email_id)
+            if found is not None:
+                similar.append((found, score))
+        return similar
 
     def run_query(self, user_query: str, selected_email: Optional[Email],
-                  all_emails: List[Email], prompts: PromptConfig) -> str:
+                  all_emails: List[Email], prompts: PromptConfig,
+                  memory: Optional[ChatMemory] = None) -> str:
+        """Answer a chat question; `memory` adds the conversation so far
+        (a bounded summary plus the recent turns) to the context."""
         try:
+            answer = self.answer_directly(user_query, selected_email, all_emails)
+            if answer is not None:
+                return answer
             context = self._build_context(user_query, selected_email, all_emails)
+            if memory is not None:
+                context.update(memory.context())
             prompt = self._select_prompt(user_query, prompts)
             context["query"] = user_query
             return self.llm.run_llm(prompt, context)
         except Exception as e:
             return f"Error: {str(e)}"
 
+    def summarize_chat(self, summary: str, messages: List[Message]) -> str:
+        """ChatMemory summarizer: the LLM for real providers, an extractive
+        summary for the local ones (or if the LLM call fails)."""
+        if self.llm.provider in LOCAL_PROVIDERS:
+            return extractive_summary(summary, messages)
+        response = self.llm.run_llm(CHAT_SUMMARY_PROMPT, {
+            "summary": summary,
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+        })
+        try:
+            failed = LLMError.from_response(json.loads(response)) is not None
+        except (TypeError, ValueError):
+            failed = False
+        return extractive_summary(summary, messages) if failed else response.strip()
+
+    def answer_directly(self, query: str, selected_email: Optional[Email],
+                        all_emails: Sequence[Email]) -> Optional[str]:
+        """Answer questions listing or counting tasks, or counting or listing
+        a category, from the inbox aggregates; None for anything else,
+        including such questions narrowed by a sender, topic or date.
+        """
+        text = query.lower()
+        aggregates = indexes_for(all_emails).aggregates
+        if not all_emails or _WRITE.search(text) or (selected_email is not None and _SELECTED.search(text)):
+            return None
+        words = _WORDS.findall(text)
+        names = self._category_names(aggregates)
+        categories = {self._category_of(word, names) for word in words} - {None}
+        if any(word not in _ANSWERED_WORDS and self._category_of(word, names) is None for word in words):
+            return None
+        short = len(words) <= 3
+        if _TASKS.search(text):
+            if _COUNT.search(text) or _LIST.search(text) or _ASKS.search(text) or short:
+                return self._tasks_answer(aggregates, all_emails)
+            return None
+        if len(categories) != 1:
+            if not categories and _COUNT.search(text) and "email" in text:
+                return self._counts_answer(aggregates)
+            return None
+        category = categories.pop()
+        if _COUNT.search(text):
+            count = aggregates.count(category)
+            return f"You have {count} {category} email{'s' if count != 1 else ''}."
+        if _LIST.search(text) or short:
+            return self._category_answer(aggregates, category, all_emails)
+        return None
+
+    @staticmethod
+    def _category_names(aggregates: InboxAggregates) -> Dict[str, str]:
+        names = {name.lower().replace("-", ""): name for name in aggregates.counts() if name}
+        names.update((name.lower().replace("-", ""), name) for name in CATEGORY_ALIASES.values())
+        return names
+
+    @staticmethod
+    def _category_of(word: str, names: Dict[str, str]) -> Optional[str]:
+        """The category `word` names (plural or alias allowed), if any."""
+        if word in CATEGORY_ALIASES:
+            return CATEGORY_ALIASES[word]
+        word = word.replace("-", "")
+        return names.get(word) or names.get(word.rstrip("s"))
+
+    @staticmethod
+    def _counts_answer(aggregates: InboxAggregates) -> str:
+        counts = aggregates.counts()
+        lines = [f"- {name}: {count}" for name, count in sorted(counts.items(), key=lambda item: -item[1]) if name]
+        if counts.get(None):
+            lines.append(f"- Not yet categorized: {counts[None]}")
+        return f"**{sum(counts.values())} emails:**\n\n" + "\n".join(lines)
+
+    def _tasks_answer(self, aggregates: InboxAggregates, all_emails: Sequence[Email]) -> str:
+        total = aggregates.action_count()
+        if not total:
+            return "You have no pending tasks in the processed emails."
+        lookup = self._lookup(all_emails)
+        lines = []
+        for i, (email_id, action) in enumerate(aggregates.actions(LISTED_ITEMS), 1):
+            email = lookup(email_id)
+            source = f" — {email.subject}" if email is not None else ""
+            lines.append(f"{i}. {action.get('task', 'Task')} (Due: {action.get('deadline') or 'no deadline'}){source}")
+        if total > len(lines):
+            lines.append(f"... and {total - len(lines)} more")
+        return "**Your pending tasks:**\n\n" + "\n".join(lines)
+
+    def _category_answer(self, aggregates: InboxAggregates, category: str,
+                         all_emails: Sequence[Email]) -> str:
+        total = aggregates.count(category)
+        if not total:
+            return f"You have no {category} emails."
+        lookup = self._lookup(all_emails)
+        lines = []
+        for i, email_id in enumerate(aggregates.ids(category, LISTED_ITEMS), 1):
+            email = lookup(email_id)
+            if email is not None:
+                lines.append(f"{i}. {email.subject} - {email.sender}")
+        if total > len(lines):
+            lines.append(f"... and {total - len(lines)} more")
+        return f"**{total} {category} email{'s' if total != 1 else ''}:**\n\n" + "\n".join(lines)
+
+    @staticmethod
+    def _lookup(all_emails: Sequence[Email]):
+        lookup = getattr(all_emails, "get", None)
+        return lookup if lookup is not None else {email.id: email for email in all_emails}.get
+
     def _build_context(self, query: str, selected_email: Optional[Email],
                       all_emails: List[Email]) -> Dict[str, Any]:
         context = {}
@@ -29,41 +246,154 @@ class EmailAgent:
                 "email_body": selected_email.body,
                 "email_category": selected_email.category,
             }
+            history = self._thread_history(selected_email, indexes_for(all_emails))
+            if history:
+                context["thread_history"] = history
+        elif all_emails:
+            relevant = self._relevant_emails(query, all_emails)
+            if relevant:
+                context["relevant_emails"] = relevant
         return context
 
+    def _relevant_emails(self, query: str, all_emails: Sequence[Email]) -> List[Dict[str, Any]]:
+        """The inbox emails that best match `query`, best first.
+
+        Keyword (BM25) and semantic matches are merged by reciprocal rank,
+        so an email found by both ranks first and a paraphrase the keyword
+        index misses still gets in.
+        """
+        lookup = self._lookup(all_emails)
+        indexes = self._searchable(all_emails)
+        fused: Dict[str, float] = {}
+        for hits in (indexes.search.search(query, RELEVANT_EMAILS),
+                     indexes.embeddings.search(query, RELEVANT_EMAILS)):
+            for rank, (email_id, _) in enumerate(hits):
+                fused[email_id] = fused.get(email_id, 0.0) + 1 / (_RRF_K + rank + 1)
+        relevant = []
+        for email_id, score in sorted(fused.items(), key=lambda item: -item[1])[:RELEVANT_EMAILS]:
+            email = lookup(email_id)
+            if email is None:
+                continue
+            relevant.append({
+                "id": email.id,
+                "sender": email.sender,
+                "subject": email.subject,
+                "timestamp": email.timestamp,
+                "category": email.category,
+                "body": email.body[:1000],
+                "score": round(score, 4),
+            })
+        return relevant
+
+    @staticmethod
+    def _thread_history(email: Email, indexes: InboxIndexes) -> List[Dict[str, Any]]:
+        """Earlier messages of `email`'s thread, oldest first."""
+        history = []
+        for message in indexes.threads.thread_of(email):
+            if message.id == email.id:
+                break
+            history.append({
+                "sender": message.sender,
+                "timestamp": message.timestamp,
+                "body": message.body[:1000],
+            })
+        return history
+
     def _select_prompt(self, query: str, prompts: PromptConfig) -> str:
         if "draft" in query.lower() or "reply" in query.lower():
             return prompts.auto_reply_prompt
         return "You are an email assistant. Answer based on context."
 
-    def generate_reply_draft(self, email: Email, prompts: PromptConfig,
-                            tone: str = "professional") -> Draft:
+    def generate_reply_draft(self, email: Email, prompts: PromptConfig, tone: str = "professional",
+                             indexes: Optional[InboxIndexes] = None) -> Draft:
+        """A reply draft for `email`; `indexes` (the inbox's, for its thread) default to the shared ones."""
+        indexes = indexes or indexes_for(None)
+        response = self.llm.run_llm(prompts.auto_reply_prompt, self._reply_context(email, tone, indexes))
+        return self._reply_draft(email, self._parse_reply(response))
+
+    def generate_reply_drafts(self, emails: Sequence[Email], prompts: PromptConfig,
+                              tone: str = "professional",
+                              indexes: Optional[InboxIndexes] = None) -> List[Draft]:
+        """Reply drafts for many emails (a category, or any selection), in input order.
+
+        Emails go to the LLM in batches of `llm.batch_size` contexts per
+        call, and batches run on a pool of DRAFT_WORKERS threads, which also
+        overlaps reading lazily loaded bodies. Nothing is saved here; pass
+        the drafts to `storage.save_drafts` to write them all at once.
+        `last_bulk_stats` reports the throughput.
+        """
+        started = time.perf_counter()
+        indexes = indexes or indexes_for(emails)
+        chunks = list(chunked(emails, max(1, self.llm.batch_size)))
+
+        def run(chunk: List[Email]) -> List[Tuple[Draft, bool]]:
+            contexts = [self._reply_context(email, tone, indexes) for email in chunk]
+            responses = self.llm.run_llm_batch(prompts.auto_reply_prompt, contexts)
+            results = []
+            for email, response in zip(chunk, responses):
+                data = self._parse_reply(response)
+                results.append((self._reply_draft(email, data), data is not None))
+            return results
+
+        workers = max(1, min(self.workers, len(chunks)))
+        if workers == 1:
+            results = [result for chunk in chunks for result in run(chunk)]
+        else:
+            with ThreadPoolExecutor(workers, thread_name_prefix="reply-drafts") as pool:
+                results = [result for done in pool.map(run, chunks) for result in done]
+        seconds = time.perf_counter() - started
+        self.last_bulk_stats = {
+            "emails": len(results),
+            "failed": sum(not ok for _, ok in results),
+            "llm_batches": len(chunks),
+            "workers": workers,
+            "seconds": seconds,
+            "per_second": len(results) / seconds if seconds else 0.0,
+        }
+        return [draft for draft, _ in results]
+
+    def _reply_context(self, email: Email, tone: str, indexes: InboxIndexes) -> Dict[str, Any]:
         context = {
             "email_subject": email.subject,
             "email_body": email.body,
             "email_sender": email.sender,
             "tone": tone
         }
-        response = self.llm.run_llm(prompts.auto_reply_prompt, context)
+        history = self._thread_history(email, indexes)
+        if history:
+            context["thread_history"] = history
+        return context
+
+    @staticmethod
+    def _parse_reply(response: str) -> Optional[Dict[str, Any]]:
+        """The reply in `response`; None for an error payload or anything without a body."""
         try:
             data = json.loads(response)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(data, dict) or LLMError.from_response(data) is not None or "body" not in data:
+            return None
+        return data
+
+    @staticmethod
+    def _reply_draft(email: Email, data: Optional[Dict[str, Any]]) -> Draft:
+        if data is None:
             return Draft(
-                id=f"draft_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                email_id=email.id,
-                subject=data.get("subject", f"Re: {email.subject}"),
-                body=data.get("body", ""),
-                metadata={"suggested_follow_ups": data.get("suggested_follow_ups", [])},
-                created_at=datetime.now().isoformat()
-            )
-        except:
-            return Draft(
-                id=f"draft_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                id=new_draft_id(),
                 email_id=email.id,
                 subject=f"Re: {email.subject}",
                 body="Thank you for your email. I will respond shortly.",
                 metadata={},
                 created_at=datetime.now().isoformat()
             )
+        return Draft(
+            id=new_draft_id(),
+            email_id=email.id,
+            subject=data.get("subject", f"Re: {email.subject}"),
+            body=data.get("body", ""),
+            metadata={"suggested_follow_ups": data.get("suggested_follow_ups", [])},
+            created_at=datetime.now().isoformat()
+        )
 
     def generate_new_draft(self, prompts: PromptConfig, instruction: str,
                           to: str = "", subject: str = "") -> Draft:
@@ -73,7 +403,7 @@ class EmailAgent:
         try:
             data = json.loads(response)
             return Draft(
-                id=f"draft_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                id=new_draft_id(),
                 email_id=None,
                 subject=data.get("subject", subject or "New Email"),
                 body=data.get("body", ""),
@@ -82,7 +412,7 @@ class EmailAgent:
             )
         except:
             return Draft(
-                id=f"draft_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                id=new_draft_id(),
                 email_id=None,
                 subject=subject or "New Email",
                 body=instruction,
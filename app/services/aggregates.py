@@ -0,0 +1,124 @@
+"""Inbox aggregates"""
+import threading
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.models import Email
+
+# (has no deadline, deadline, email id, position in the email's actions)
+ActionKey = Tuple[bool, str, str, int]
+
+
+def _as_action(action: Any) -> Dict[str, Any]:
+    return action if isinstance(action, dict) else {"task": str(action), "deadline": None}
+
+
+def _action_key(email_id: str, position: int, action: Dict[str, Any]) -> ActionKey:
+    deadline = action.get("deadline") if isinstance(action, dict) else None
+    deadline = deadline if isinstance(deadline, str) and deadline.strip() else None
+    # ISO dates sort as strings; actions without a deadline go last
+    return deadline is None, deadline or "", email_id, position
+
+
+class InboxAggregates:
+    """Category counts, per-category ids and actions ordered by deadline.
+
+    `update` is called with each email as processing finishes it and only
+    undoes and redoes that email's own contribution, so the aggregates
+    stay current without a rescan. Counts are O(1) to read, the first k
+    ids of a category or the k most pressing actions O(k).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._categories: Dict[str, Optional[str]] = {}
+            self._ids: Dict[Optional[str], Dict[str, None]] = {}
+            self._actions: List[ActionKey] = []
+            self._action_items: Dict[str, List[Dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._categories)
+
+    def rebuild(self, emails: Iterable[Email]) -> None:
+        """Recompute everything from `emails` (e.g. a freshly loaded inbox)."""
+        categories: Dict[str, Optional[str]] = {}
+        ids: Dict[Optional[str], Dict[str, None]] = {}
+        actions: List[ActionKey] = []
+        action_items: Dict[str, List[Dict[str, Any]]] = {}
+        for email in emails:
+            categories[email.id] = email.category
+            ids.setdefault(email.category, {})[email.id] = None
+            if email.actions:
+                items = action_items[email.id] = [_as_action(a) for a in email.actions]
+                actions.extend(_action_key(email.id, i, a) for i, a in enumerate(items))
+        actions.sort()
+        with self._lock:
+            self._categories, self._ids = categories, ids
+            self._actions, self._action_items = actions, action_items
+
+    def update(self, email: Email) -> None:
+        with self._lock:
+            self._discard(email.id)
+            self._categories[email.id] = email.category
+            self._ids.setdefault(email.category, {})[email.id] = None
+            if email.actions:
+                items = self._action_items[email.id] = [_as_action(a) for a in email.actions]
+                for position, action in enumerate(items):
+                    insort(self._actions, _action_key(email.id, position, action))
+
+    def update_many(self, emails: Iterable[Email]) -> None:
+        for email in emails:
+            self.update(email)
+
+    def remove(self, email_id: str) -> None:
+        with self._lock:
+            self._discard(email_id)
+
+    def _discard(self, email_id: str) -> None:
+        if email_id not in self._categories:
+            return
+        category = self._categories.pop(email_id)
+        ids = self._ids.get(category)
+        if ids is not None:
+            ids.pop(email_id, None)
+            if not ids:
+                del self._ids[category]
+        for position, action in enumerate(self._action_items.pop(email_id, ())):
+            key = _action_key(email_id, position, action)
+            at = bisect_left(self._actions, key)
+            if at < len(self._actions) and self._actions[at] == key:
+                del self._actions[at]
+
+    def counts(self) -> Dict[Optional[str], int]:
+        """Emails per category (None for not yet categorised)."""
+        with self._lock:
+            return {category: len(ids) for category, ids in self._ids.items()}
+
+    def count(self, category: Optional[str]) -> int:
+        return len(self._ids.get(category, ()))
+
+    def ids(self, category: Optional[str], limit: Optional[int] = None) -> List[str]:
+        """Ids of the emails in `category`, in the order they were added."""
+        with self._lock:
+            ids = self._ids.get(category, {})
+            if limit is None:
+                return list(ids)
+            result = []
+            for email_id in ids:
+                if len(result) >= limit:
+                    break
+                result.append(email_id)
+            return result
+
+    def action_count(self) -> int:
+        return len(self._actions)
+
+    def actions(self, limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """(email id, action) pairs, earliest deadline first."""
+        with self._lock:
+            keys = self._actions if limit is None else self._actions[:limit]
+            return [(email_id, self._action_items[email_id][position]) for _, _, email_id, position in keys]
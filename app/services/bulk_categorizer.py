@@ -0,0 +1,124 @@
+"""Bulk keyword categorizer"""
+import json
+from itertools import chain, repeat
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from app.services.keyword_matcher import (
+    CATEGORY_RULES, DEFAULT_CATEGORY, FULL_SCOPE_GROUPS, KEYWORD_GROUPS
+)
+
+
+class BulkCategorizer:
+    """Categorizes whole inboxes with the mock cascade using array operations.
+
+    Each chunk of emails is lowercased and encoded into one byte buffer (body +
+    subject per email, separated by NUL) viewed as a NumPy array. Positions
+    whose first two bytes start any rule keyword are found in one pass over
+    the buffer, then narrowed to each keyword by comparing its remaining
+    bytes, which gives an (email, keyword) term matrix. Group hits, rule
+    matches and the first matching rule of the cascade are computed on that
+    matrix, so there is no Python work per keyword and email. Labels are
+    identical to `LLMClient._mock_categorize`, including substring matches
+    inside longer words and spam phrases spanning the end of the body and
+    the subject.
+    """
+
+    def __init__(self, groups: Dict[str, List[str]] = KEYWORD_GROUPS,
+                 rules=CATEGORY_RULES, default=DEFAULT_CATEGORY,
+                 full_scope=FULL_SCOPE_GROUPS, chunk_size: int = 20000):
+        self.rules = rules
+        self.default = default
+        self.chunk_size = chunk_size
+        used = sorted({group for rule_groups, _, _ in rules for group in rule_groups})
+        # One term per (keyword, scope); full-scope terms also see the subject
+        self.terms: List[Tuple[str, bool]] = sorted(
+            {(kw, group in full_scope) for group in used for kw in groups[group]}
+        )
+        self._patterns = [np.frombuffer(kw.encode("utf-8"), dtype=np.uint8).astype(np.uint16)
+                          for kw, _ in self.terms]
+        self._longest = max(len(p) for p in self._patterns)
+        self._bigram_table = np.zeros(1 << 16, dtype=bool)
+        for pattern in self._patterns:
+            if len(pattern) > 1:
+                self._bigram_table[pattern[0] << 8 | pattern[1]] = True
+        index = {term: i for i, term in enumerate(self.terms)}
+        group_index = {group: i for i, group in enumerate(used)}
+        self._term_groups = np.zeros((len(self.terms), len(used)), dtype=np.uint16)
+        for group in used:
+            for kw in groups[group]:
+                self._term_groups[index[(kw, group in full_scope)], group_index[group]] = 1
+        self._rule_groups = [[group_index[g] for g in rule_groups] for rule_groups, _, _ in rules]
+        self.labels = [category for _, category, _ in rules] + [default[0]]
+        self._responses = [
+            json.dumps({"category": category, "reason": reason})
+            for category, reason in [(c, r) for _, c, r in rules] + [default]
+        ]
+
+    def term_matrix(self, bodies: Sequence[str], subjects: Sequence[str]) -> np.ndarray:
+        """Boolean (email, term) matrix of keyword occurrences for one chunk."""
+        n = len(bodies)
+        lower_bodies = [body.lower().encode("utf-8") for body in bodies]
+        lower_subjects = [subject.lower().encode("utf-8") for subject in subjects]
+        body_len = np.fromiter(map(len, lower_bodies), dtype=np.int64, count=n)
+        subject_len = np.fromiter(map(len, lower_subjects), dtype=np.int64, count=n)
+        starts = np.zeros(n, dtype=np.int64)
+        np.cumsum(body_len[:-1] + subject_len[:-1] + 1, out=starts[1:])
+        body_ends = starts + body_len
+        data = b"".join(chain.from_iterable(zip(lower_bodies, lower_subjects, repeat(b"\0"))))
+        del lower_bodies, lower_subjects
+        # Padding lets every keyword be compared at every position
+        text = np.frombuffer(data + b"\0" * self._longest, dtype=np.uint8)
+
+        bigrams = (text[:-1].astype(np.uint16) << 8) | text[1:]
+        candidates = np.flatnonzero(self._bigram_table[bigrams])
+        candidate_codes = bigrams[candidates]
+        del bigrams
+
+        matrix = np.zeros((n, len(self.terms)), dtype=bool)
+        for col, (keyword, full) in enumerate(self.terms):
+            pattern = self._patterns[col]
+            if len(pattern) == 1:
+                pos = np.flatnonzero(text == pattern[0])
+            else:
+                pos = candidates[candidate_codes == (pattern[0] << 8 | pattern[1])]
+                for offset in range(2, len(pattern)):
+                    pos = pos[text[pos + offset] == pattern[offset]]
+            if not len(pos):
+                continue
+            rows = np.searchsorted(starts, pos, side="right") - 1
+            if not full:
+                # NUL separators keep matches inside one email; body terms
+                # must also end before the subject starts
+                rows = rows[pos + len(pattern) <= body_ends[rows]]
+            matrix[rows, col] = True
+        return matrix
+
+    def categorize_codes(self, bodies: Sequence[str], subjects: Sequence[str]) -> np.ndarray:
+        """Index into `labels` for every email."""
+        codes = np.empty(len(bodies), dtype=np.int8)
+        for start in range(0, len(bodies), self.chunk_size):
+            stop = start + self.chunk_size
+            terms = self.term_matrix(bodies[start:stop], subjects[start:stop])
+            group_hits = (terms.view(np.uint8) @ self._term_groups) > 0
+            matches = np.ones((len(terms), len(self.rules) + 1), dtype=bool)
+            for i, groups in enumerate(self._rule_groups):
+                matches[:, i] = group_hits[:, groups].all(axis=1)
+            codes[start:stop] = matches.argmax(axis=1)
+        return codes
+
+    def categorize(self, bodies: Sequence[str], subjects: Sequence[str]) -> List[str]:
+        labels = np.array(self.labels, dtype=object)
+        return labels[self.categorize_codes(bodies, subjects)].tolist()
+
+    def category_responses(self, contexts: Iterable[Dict[str, Any]]) -> List[str]:
+        """Categorization responses for LLM contexts, as the mock returns them."""
+        contexts = list(contexts)
+        codes = self.categorize_codes([c.get("email_body", "") for c in contexts],
+                                      [c.get("email_subject", "") for c in contexts])
+        responses = self._responses
+        return [responses[code] for code in codes.tolist()]
+
+
+bulk_categorizer = BulkCategorizer()
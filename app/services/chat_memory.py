@@ -0,0 +1,99 @@
+"""Chat memory"""
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+Message = Dict[str, Any]
+# (summary so far, messages to fold in) -> new summary
+Summarizer = Callable[[str, List[Message]], str]
+
+# Characters of one message sent to the LLM verbatim
+MESSAGE_CHARS = 2000
+# Characters of one message kept in the extractive summary
+LINE_CHARS = 160
+
+
+def extractive_summary(summary: str, messages: List[Message]) -> str:
+    """Append one line per message: the LLM-free summarizer."""
+    lines = [summary] if summary else []
+    for message in messages:
+        who = "User" if message.get("role") == "user" else "Agent"
+        text = " ".join(str(message.get("content", "")).split())
+        if len(text) > LINE_CHARS:
+            text = text[:LINE_CHARS - 1] + "…"
+        lines.append(f"- {who}: {text}")
+    return "\n".join(lines)
+
+
+class ChatMemory:
+    """A chat transcript with a fixed window of recent turns and a rolling
+    summary of everything older.
+
+    The last `window` messages are kept for the LLM verbatim. Once
+    `fold` more have piled up, the oldest ones beyond the window are
+    folded into the summary in one `summarize` call that sees only the
+    previous summary and those messages, so each fold costs the same
+    however long the session has run. The summary is capped at
+    `summary_chars`, dropping its oldest lines first, so `context()` stays
+    bounded. The full transcript is still kept for display, which pages
+    through it with `recent`.
+    """
+
+    def __init__(self, window: int = 10, fold: int = 6, summary_chars: int = 4000,
+                 summarize: Optional[Summarizer] = None):
+        self.window = window
+        self.fold = fold
+        self.summary_chars = summary_chars
+        self.summarize = summarize or extractive_summary
+        self.messages: List[Message] = []
+        self.summary = ""
+        # Messages folded into the summary so far, oldest first
+        self.summarized = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def add(self, role: str, content: str) -> Message:
+        message = {"role": role, "content": content, "timestamp": datetime.now().isoformat()}
+        self.messages.append(message)
+        if len(self.messages) - self.summarized >= self.window + self.fold:
+            self._fold()
+        return message
+
+    def _fold(self) -> None:
+        end = len(self.messages) - self.window
+        older = self.messages[self.summarized:end]
+        try:
+            summary = self.summarize(self.summary, older)
+        except Exception:
+            summary = extractive_summary(self.summary, older)
+        self.summary = self._cap(summary)
+        self.summarized = end
+
+    def _cap(self, summary: str) -> str:
+        if len(summary) <= self.summary_chars:
+            return summary
+        lines = summary.split("\n")
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > self.summary_chars:
+            lines.pop(0)
+        return "\n".join(lines)[-self.summary_chars:]
+
+    def context(self) -> Dict[str, Any]:
+        """What the LLM is sent about the conversation so far."""
+        context: Dict[str, Any] = {}
+        if self.summary:
+            context["chat_summary"] = self.summary
+        recent = self.messages[self.summarized:]
+        if recent:
+            context["recent_messages"] = [
+                {"role": m["role"], "content": str(m["content"])[:MESSAGE_CHARS]} for m in recent
+            ]
+        return context
+
+    def recent(self, limit: int) -> List[Message]:
+        """The last `limit` messages, oldest first."""
+        return self.messages[-limit:] if limit > 0 else []
+
+    def clear(self) -> None:
+        self.messages = []
+        self.summary = ""
+        self.summarized = 0
@@ -0,0 +1,215 @@
+"""Compact columnar inbox"""
+import weakref
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+from pydantic import PrivateAttr
+
+from app.models import Email
+from app.services.inbox_indexes import InboxIndexes
+from app.services.mailbox import MailboxEmail
+
+# Fields kept in sparse per-row dicts: most emails hold the default
+_SPARSE = ("actions", "processing_error", "fingerprints", "duplicate_of", "thread_id")
+
+
+class EmailView(Email):
+    """An Email backed by one row of a CompactInbox.
+
+    Assigning a field writes it through to the inbox's columns, so the
+    processor and the UI can keep updating emails in place.
+    """
+
+    _inbox: Any = PrivateAttr(default=None)
+    _row: int = PrivateAttr(default=-1)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in Email.model_fields and self._inbox is not None:
+            self._inbox._write(self._row, name, value)
+
+
+class LazyEmailView(EmailView, MailboxEmail):
+    """A view of a row whose body still lives in an mbox file or Maildir."""
+
+
+class CompactInbox(Sequence[Email]):
+    """Emails stored column by column instead of one pydantic model each.
+
+    Senders and recipients are interned into one string table and stored
+    as uint32 codes; categories are int16 codes (-1 for uncategorised).
+    Actions, errors, fingerprints and the like live in sparse per-row
+    dicts. Indexing or iterating returns `Email` views built on access;
+    a view stays shared while anything references it, and assignments to
+    it update the columns. `indexes` holds the threads, aggregates and
+    search indexes built over this inbox.
+    """
+
+    def __init__(self):
+        self.indexes = InboxIndexes()
+        self.ids: List[str] = []
+        self.subjects: List[str] = []
+        self.timestamps: List[str] = []
+        # A str, or the (source, key) of a body not yet read from a mailbox
+        self.bodies: List[Any] = []
+        self.senders = array("I")
+        self.recipients = array("I")
+        self.categories = array("h")
+        self.strings: List[str] = []
+        self.category_names: List[str] = []
+        self._string_codes: Dict[str, int] = {}
+        self._category_codes: Dict[str, int] = {}
+        self._rows: Dict[str, int] = {}
+        self._sparse: Dict[str, Dict[int, Any]] = {name: {} for name in _SPARSE}
+        self._views: "weakref.WeakValueDictionary[int, EmailView]" = weakref.WeakValueDictionary()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Email, List[Email]]:
+        if isinstance(index, slice):
+            return [self.view(row) for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("inbox index out of range")
+        return self.view(index)
+
+    def __iter__(self) -> Iterator[Email]:
+        for row in range(len(self)):
+            yield self.view(row)
+
+    def get(self, email_id: str) -> Optional[Email]:
+        row = self._rows.get(email_id)
+        return None if row is None else self.view(row)
+
+    def _intern(self, value: str) -> int:
+        code = self._string_codes.get(value)
+        if code is None:
+            code = self._string_codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def _category_code(self, category: Optional[str]) -> int:
+        if category is None:
+            return -1
+        code = self._category_codes.get(category)
+        if code is None:
+            code = self._category_codes[category] = len(self.category_names)
+            self.category_names.append(category)
+        return code
+
+    def append(self, email: Email) -> None:
+        row = len(self.ids)
+        self._rows[email.id] = row
+        self.ids.append(email.id)
+        self.senders.append(self._intern(email.sender))
+        self.recipients.append(self._intern(email.recipient))
+        self.subjects.append(email.subject)
+        self.timestamps.append(email.timestamp)
+        if getattr(email, "lazy_body", False):
+            self.bodies.append((email._source, email._key))
+        else:
+            self.bodies.append(email.body)
+        self.categories.append(self._category_code(email.category))
+        for name in _SPARSE:
+            value = getattr(email, name)
+            if value:
+                self._sparse[name][row] = value
+
+    def extend(self, emails: Iterable[Email]) -> None:
+        for email in emails:
+            self.append(email)
+
+    def extend_records(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Trusted load: add raw inbox records without pydantic validation.
+
+        Records must already have the Email field types (as in a file this
+        app wrote); a missing required field raises KeyError.
+        """
+        intern, category_code = self._intern, self._category_code
+        rows, sparse = self._rows, self._sparse
+        for record in records:
+            row = len(self.ids)
+            rows[record["id"]] = row
+            self.ids.append(record["id"])
+            self.senders.append(intern(record["sender"]))
+            self.recipients.append(intern(record["recipient"]))
+            self.subjects.append(record["subject"])
+            self.timestamps.append(record["timestamp"])
+            self.bodies.append(record["body"])
+            self.categories.append(category_code(record.get("category")))
+            for name in _SPARSE:
+                value = record.get(name)
+                if value:
+                    sparse[name][row] = value
+
+    def view(self, row: int) -> Email:
+        """The Email at `row`, shared with any live view of the same row."""
+        view = self._views.get(row)
+        if view is not None:
+            return view
+        sparse = self._sparse
+        code = self.categories[row]
+        fields = dict(
+            id=self.ids[row],
+            sender=self.strings[self.senders[row]],
+            recipient=self.strings[self.recipients[row]],
+            subject=self.subjects[row],
+            timestamp=self.timestamps[row],
+            category=None if code < 0 else self.category_names[code],
+            actions=sparse["actions"].get(row, []),
+            processing_error=sparse["processing_error"].get(row),
+            fingerprints=sparse["fingerprints"].get(row, {}),
+            duplicate_of=sparse["duplicate_of"].get(row),
+            thread_id=sparse["thread_id"].get(row),
+        )
+        body = self.bodies[row]
+        if isinstance(body, str):
+            view = EmailView.model_construct(body=body, **fields)
+        else:
+            view = LazyEmailView.model_construct(**fields)
+            view._source, view._key = body
+        view._inbox = self
+        view._row = row
+        self._views[row] = view
+        return view
+
+    def _write(self, row: int, name: str, value: Any) -> None:
+        if name == "category":
+            self.categories[row] = self._category_code(value)
+        elif name == "sender":
+            self.senders[row] = self._intern(value)
+        elif name == "recipient":
+            self.recipients[row] = self._intern(value)
+        elif name == "id":
+            self._rows.pop(self.ids[row], None)
+            self._rows[value] = row
+            self.ids[row] = value
+        elif name == "subject":
+            self.subjects[row] = value
+        elif name == "timestamp":
+            self.timestamps[row] = value
+        elif name == "body":
+            self.bodies[row] = value
+        elif value:
+            self._sparse[name][row] = value
+        else:
+            self._sparse[name].pop(row, None)
+
+    def category_counts(self) -> Dict[Optional[str], int]:
+        """Emails per category (None for uncategorised), without building views."""
+        counts = np.bincount(np.frombuffer(self.categories, dtype=np.int16) + 1,
+                             minlength=len(self.category_names) + 1)
+        result: Dict[Optional[str], int] = {None: int(counts[0])}
+        for code, name in enumerate(self.category_names):
+            if counts[code + 1]:
+                result[name] = int(counts[code + 1])
+        return result
+
+    def in_categories(self, categories: Iterable[str]) -> List[Email]:
+        """Views of the emails in any of `categories`."""
+        codes = [self._category_codes[c] for c in categories if c in self._category_codes]
+        column = np.frombuffer(self.categories, dtype=np.int16)
+        return [self.view(int(row)) for row in np.flatnonzero(np.isin(column, codes))]
@@ -0,0 +1,279 @@
+"""Draft stores"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+from app.models import Draft
+
+# Draft id -> the draft to save, or None to delete it
+Changes = Dict[str, Optional[Draft]]
+
+# strict: each change written and synced before the call returns;
+# balanced: written behind, coalesced, and synced; fast: written behind,
+# syncing left to the OS
+DURABILITY_MODES = ("strict", "balanced", "fast")
+
+
+def _merge(drafts: List[Draft], changes: Changes) -> List[Draft]:
+    """`drafts` with `changes` applied; saved drafts move to the end."""
+    return [d for d in drafts if d.id not in changes] + [d for d in changes.values() if d is not None]
+
+
+class JSONDraftStore:
+    """All drafts in one JSON file, rewritten on every change.
+
+    Simple and human-readable, which suits the demo, but every save or
+    delete is O(n) and concurrent writers can lose each other's changes.
+    Writes go to a temp file that is renamed over the original, so a crash
+    leaves either the old or the new file, never a torn one; with `fsync`
+    the data and the rename are flushed to disk first.
+    """
+
+    def __init__(self, path: Path, fsync: bool = True):
+        self.path = Path(path)
+        self.fsync = fsync
+
+    def load_all(self) -> List[Draft]:
+        if not self.path.exists():
+            return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return [Draft(**d) for d in json.load(f)]
+
+    def get(self, draft_id: str) -> Optional[Draft]:
+        return next((d for d in self.load_all() if d.id == draft_id), None)
+
+    def for_email(self, email_id: str) -> List[Draft]:
+        return [d for d in self.load_all() if d.email_id == email_id]
+
+    def save(self, draft: Draft) -> None:
+        self.apply({draft.id: draft})
+
+    def delete(self, draft_id: str) -> None:
+        self.apply({draft_id: None})
+
+    def apply(self, changes: Changes) -> None:
+        """Apply many saves and deletes with one rewrite of the file."""
+        self._write(_merge(self.load_all(), changes))
+
+    def _write(self, drafts: List[Draft]) -> None:
+        temp = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump([d.model_dump() for d in drafts], f, indent=2)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(temp, self.path)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+        if self.fsync:
+            # Persist the rename itself
+            directory = os.open(self.path.parent, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+
+class SQLiteDraftStore:
+    """Drafts in a SQLite database in WAL mode.
+
+    Each draft is one row keyed by id, with an index on email_id, so saves,
+    deletes and lookups touch a single row and concurrent sessions can
+    write safely. Rows keep save order: re-saving a draft moves it to the
+    end, as in the JSON store. Drafts from `legacy_json` are imported the
+    first time the database is opened; the JSON file is left untouched,
+    and one that cannot be parsed is skipped rather than retried.
+    With `fsync` every commit is synced to disk (synchronous=FULL);
+    otherwise WAL's NORMAL mode may lose the last commits on power loss
+    but never corrupts the database.
+    """
+
+    def __init__(self, path: Path, legacy_json: Optional[Path] = None, fsync: bool = False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS drafts ("
+            "id TEXT PRIMARY KEY, email_id TEXT, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS drafts_email ON drafts (email_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        if legacy_json is not None:
+            self._migrate(Path(legacy_json))
+
+    def _migrate(self, legacy_json: Path) -> None:
+        with self._lock, self._db:
+            # BEGIN IMMEDIATE so two processes starting together import once
+            self._db.execute("BEGIN IMMEDIATE")
+            done = self._db.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone()
+            if done is None:
+                note = str(legacy_json)
+                try:
+                    drafts = JSONDraftStore(legacy_json).load_all() if legacy_json.exists() else []
+                except (ValueError, TypeError) as e:
+                    # A malformed legacy file must not block drafts; it is left on disk
+                    drafts, note = [], f"{legacy_json} (skipped: {e})"
+                    print(f"[DRAFTS] Could not import {legacy_json}: {e}")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO drafts (id, email_id, data) VALUES (?, ?, ?)",
+                    [(d.id, d.email_id, d.model_dump_json()) for d in drafts]
+                )
+                self._db.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (note,))
+
+    def load_all(self) -> List[Draft]:
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM drafts ORDER BY rowid").fetchall()
+        return [Draft.model_validate_json(data) for data, in rows]
+
+    def get(self, draft_id: str) -> Optional[Draft]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM drafts WHERE id = ?", (draft_id,)).fetchone()
+        return Draft.model_validate_json(row[0]) if row else None
+
+    def for_email(self, email_id: str) -> List[Draft]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM drafts WHERE email_id = ? ORDER BY rowid", (email_id,)
+            ).fetchall()
+        return [Draft.model_validate_json(data) for data, in rows]
+
+    def save(self, draft: Draft) -> None:
+        with self._lock, self._db:
+            # REPLACE deletes the old row, so the draft gets a new, last rowid
+            self._db.execute(
+                "INSERT OR REPLACE INTO drafts (id, email_id, data) VALUES (?, ?, ?)",
+                (draft.id, draft.email_id, draft.model_dump_json())
+            )
+
+    def delete(self, draft_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+
+    def apply(self, changes: Changes) -> None:
+        """Apply many saves and deletes in one transaction."""
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM drafts WHERE id = ?",
+                                 [(draft_id,) for draft_id, d in changes.items() if d is None])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO drafts (id, email_id, data) VALUES (?, ?, ?)",
+                [(d.id, d.email_id, d.model_dump_json()) for d in changes.values() if d is not None]
+            )
+
+
+class WriteBehindDraftStore:
+    """Queues saves and deletes and writes them on a background thread.
+
+    Callers return as soon as a change is queued. Changes to the same
+    draft coalesce, and everything queued during a burst (`delay`
+    seconds) reaches the underlying store in one `apply`, i.e. one file
+    rewrite or one transaction. Reads see queued changes. `flush` writes
+    the queue synchronously and is also run at interpreter exit. A failed
+    write keeps its changes queued, is retried, and is reported through
+    `last_error` and by `flush`. `on_flush`, if set, is called with each
+    batch once it has been written.
+    """
+
+    def __init__(self, store: Union[JSONDraftStore, SQLiteDraftStore], delay: float = 0.05):
+        self.store = store
+        self.delay = delay
+        self.last_error: Optional[Exception] = None
+        self.on_flush: Optional[Callable[[Changes], None]] = None
+        self._pending: Changes = {}
+        self._inflight: Changes = {}
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        atexit.register(self._flush_quietly)
+
+    def _queue(self, draft_id: str, draft: Optional[Draft]) -> None:
+        self.apply({draft_id: draft})
+
+    def apply(self, changes: Changes) -> None:
+        """Queue many saves and deletes; they reach the store in one write."""
+        with self._cond:
+            for draft_id, draft in changes.items():
+                # Re-inserting keeps the queue in the order changes were last made
+                self._pending.pop(draft_id, None)
+                self._pending[draft_id] = draft
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="draft-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def save(self, draft: Draft) -> None:
+        self._queue(draft.id, draft)
+
+    def delete(self, draft_id: str) -> None:
+        self._queue(draft_id, None)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.delay)
+            try:
+                self.flush()
+            except Exception:
+                # Kept queued; back off before retrying
+                time.sleep(1.0)
+
+    def flush(self) -> None:
+        """Write everything queued so far; raises if the write fails."""
+        with self._io_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return
+            try:
+                self.store.apply(batch)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                with self._cond:
+                    self._pending = {**{k: v for k, v in batch.items() if k not in self._pending},
+                                     **self._pending}
+                raise
+            else:
+                if self.on_flush is not None:
+                    self.on_flush(batch)
+            finally:
+                with self._cond:
+                    self._inflight = {}
+
+    def _flush_quietly(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def _overlay(self) -> Changes:
+        with self._cond:
+            return {**self._inflight, **self._pending}
+
+    def load_all(self) -> List[Draft]:
+        overlay = self._overlay()
+        return _merge(self.store.load_all(), overlay) if overlay else self.store.load_all()
+
+    def get(self, draft_id: str) -> Optional[Draft]:
+        overlay = self._overlay()
+        if draft_id in overlay:
+            return overlay[draft_id]
+        return self.store.get(draft_id)
+
+    def for_email(self, email_id: str) -> List[Draft]:
+        overlay = self._overlay()
+        # A queued draft now replying to another email drops out of this list
+        changed = {k: v if v is not None and v.email_id == email_id else None for k, v in overlay.items()}
+        return _merge(self.store.for_email(email_id), changed)
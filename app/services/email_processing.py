@@ -1,51 +1,620 @@
 """Email processing"""
+import hashlib
 import json
-from typing import List, Dict, Any
+import math
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Deque, Iterable, Iterator, List, Dict, Any, Optional, Sequence, Set, Tuple
 from app.models import Email, PromptConfig
-from app.services.llm_client import llm_client
+from app.services.inbox_indexes import InboxIndexes, indexes_for
+from app.services.llm_client import FUSED_PROMPT_HEADER, LOCAL_PROVIDERS, LLMError, llm_client
+from app.services.result_store import ResultStore
+from app.services.storage import storage
+from app.services.threads import normalize_subject
+
+# (category, actions, error, LLM calls made) for one email
+Outcome = Tuple[Optional[str], List[Dict[str, Any]], Optional[str], int]
+
+# Which stages an email needs: (categorization, action extraction)
+Stages = Tuple[bool, bool]
+
+PROCESSING_MODES = ("serial", "threads", "processes")
+
+
+def _normalize_actions(items: List[Any]) -> List[Dict[str, Any]]:
+    """Action dicts from a provider's list: a bare string becomes its task,
+    anything else that is not a dict is dropped."""
+    actions = []
+    for item in items:
+        if isinstance(item, dict):
+            actions.append(item)
+        elif isinstance(item, str) and item.strip():
+            actions.append({"task": item.strip(), "deadline": None})
+    return actions
+
+
+def build_fused_prompt(prompts: PromptConfig) -> str:
+    """One prompt asking for the category and the action items together."""
+    return (
+        f"{FUSED_PROMPT_HEADER} Respond with one JSON object: "
+        "{ \"category\": \"...\", \"reason\": \"...\", "
+        "\"actions\": [ { \"task\": \"...\", \"deadline\": \"...\" }, ... ] }.\n\n"
+        f"Categorization instructions: {prompts.categorization_prompt}\n\n"
+        f"Action item instructions: {prompts.action_item_prompt}"
+    )
+
+
+def _fingerprint(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+
+def content_fingerprint(email: Email) -> str:
+    return _fingerprint(email.sender, email.subject, email.body)
+
+
+def source_fingerprint(email: Email) -> str:
+    """Stands in for `content_fingerprint` of a mailbox email without reading
+    its body; empty for emails whose body is in memory."""
+    if not getattr(email, "lazy_body", False):
+        return ""
+    return _fingerprint(email.sender, email.subject, email.body_stamp())
 
 
 class EmailProcessor:
     def __init__(self):
         self.llm = llm_client
+        self.mode = os.getenv("PROCESSING_MODE", "serial")
+        self.workers = int(os.getenv("PROCESSING_WORKERS", str(min(8, os.cpu_count() or 1))))
+        self.fused = os.getenv("FUSED_PROCESSING", "False") == "True"
+        self.dedupe = os.getenv("NEAR_DUPLICATES", "False") == "True"
+        self.threaded = os.getenv("THREAD_PROCESSING", "False") == "True"
+        self.persist = os.getenv("PERSIST_RESULTS", "True") == "True"
+        self.last_stats: Dict[str, Any] = {}
+        self._executors: Dict[Tuple[str, int], Executor] = {}
 
     def process_emails(self, emails: List[Email], prompts: PromptConfig) -> List[Email]:
-        processed = []
+        for _ in self._iter_batches(emails, prompts):
+            pass
+        return list(emails)
+
+    def iter_process_emails(self, emails: Iterable[Email], prompts: PromptConfig) -> Iterator[Email]:
+        """Process `emails`, yielding each one as soon as it is done.
+
+        Emails are updated in place and yielded in completion order, so the
+        first results arrive after one batch however large the inbox is.
+        `last_stats` is kept up to date while iterating.
+        """
+        for batch in self._iter_batches(emails, prompts):
+            yield from batch
+
+    def index_emails(self, emails: Iterable[Email]) -> None:
+        """(Re)build the near-duplicate, thread and aggregate indexes of a
+        freshly loaded inbox (its own `indexes` for a CompactInbox).
+
+        Emails with lazily loaded bodies (mbox/Maildir) are only threaded
+        here; they join the near-duplicate index when processed, so loading
+        a large mailbox does not read every body. For a CompactInbox the
+        indexes keep ids and look emails up through its `get`, so they do
+        not hold a view of every email.
+        """
+        indexes = indexes_for(emails)
+        if not isinstance(emails, Sequence):
+            emails = list(emails)
+        indexes.lookup = getattr(emails, "get", None)
+        indexes.duplicates.clear()
+        indexes.duplicates.insert_many(
+            (email.id, email.body, indexes.ref(email)) for email in emails
+            if not getattr(email, "lazy_body", False)
+        )
+        indexes.threads.clear()
+        indexes.threads.resolve = indexes.lookup
+        indexes.threads.insert_many(emails)
+        indexes.aggregates.rebuild(emails)
+
+    @property
+    def results(self) -> Optional[ResultStore]:
+        """Where results are persisted across restarts (None if PERSIST_RESULTS=False)."""
+        return storage.result_store if self.persist else None
+
+    def restore_results(self, emails: List[Email]) -> int:
+        """Give freshly loaded emails their stored results; returns how many matched.
+
+        Restored emails carry their fingerprints, so processing skips them
+        without an LLM call unless their prompts have changed since.
+        """
+        if self.results is None:
+            return 0
+        try:
+            return self.results.restore(emails, content_fingerprint, source_fingerprint)
+        except Exception:
+            return 0
+
+    def invalidate_results(self, prompts: Optional[PromptConfig] = None) -> int:
+        """Forget stored results produced with `prompts` (all stored results if None)."""
+        if self.results is None:
+            return 0
+        return self.results.invalidate(self.prompt_version(prompts) if prompts is not None else None)
+
+    def prompt_version(self, prompts: PromptConfig) -> str:
+        """Fingerprint of the provider, model and processing prompts."""
+        stage_prints = self.stage_fingerprints(prompts)
+        return _fingerprint(stage_prints["categorization"], stage_prints["actions"])
+
+    def stage_fingerprints(self, prompts: PromptConfig) -> Dict[str, str]:
+        """Fingerprints of the inputs, other than content, behind each stage."""
+        return {
+            "categorization": _fingerprint(self.llm.provider, self.llm.model, prompts.categorization_prompt),
+            "actions": _fingerprint(self.llm.provider, self.llm.model, prompts.action_item_prompt),
+        }
+
+    def _stages(self, email: Email, content: str, stage_prints: Dict[str, str]) -> Stages:
+        """Stages whose inputs changed since `email` was last processed."""
+        done = email.fingerprints
+        if email.processing_error or done.get("content") != content:
+            return True, True
+        return (done.get("categorization") != stage_prints["categorization"],
+                done.get("actions") != stage_prints["actions"])
+
+    def _iter_batches(self, emails: Iterable[Email], prompts: PromptConfig) -> Iterator[List[Email]]:
+        """Process `emails` and yield them batch by batch as they complete.
+
+        Emails whose content and prompts are unchanged since they were last
+        processed are yielded without any LLM call, and so are emails that
+        copy their results from another one (see `_plan`). Only the stages
+        whose inputs changed are re-run for the rest. `emails` is consumed
+        lazily and at most a few batches are in flight at once, so memory
+        does not grow with the size of the inbox.
+
+        "serial" runs batches one after another, "threads" overlaps them on
+        a thread pool (for I/O-bound real providers) and "processes" spreads
+        them over worker processes (for the CPU-bound local mock). A batch
+        that fails only marks its own emails as failed.
+        """
+        mode = self.mode if self.mode in PROCESSING_MODES else "serial"
+        if mode == "processes" and self.llm.provider not in LOCAL_PROVIDERS:
+            mode = "threads"
+        fused = self.fused
+        indexes = indexes_for(emails)
+        stage_prints = self.stage_fingerprints(prompts)
+        self.last_stats = {"mode": mode, "fused": fused, "emails": 0, "skipped": 0,
+                           "duplicates": 0, "threaded": 0, "recomputed": 0, "failed": 0, "llm_calls": 0,
+                           "calls_per_email": 0.0, "fused_fallbacks": 0}
+
+        size = max(1, self.llm.batch_size)
+        if mode == "processes" and hasattr(emails, "__len__"):
+            # Fewer, larger tasks keep pickling overhead down
+            size = max(size, math.ceil(len(emails) / (self.workers * 4)))
+
+        prompts_data = prompts.model_dump()
+        results = self.results
+        version = self.prompt_version(prompts)
+
+        def save(batch_emails: List[Email]) -> None:
+            if results is None:
+                return
+            try:
+                results.save_many(((email, content_fingerprint(email)) for email in batch_emails
+                                   if email.processing_error is None), version, source_fingerprint)
+            except Exception:
+                # The store only saves work; a failed write costs a reprocess later
+                pass
+
+        def run(batch):
+            batch_emails = [email for email, _, _ in batch]
+            category_contexts = self._category_contexts(batch_emails)
+            action_contexts = self._action_contexts(batch_emails)
+            stages = [stages for _, _, stages in batch]
+            if mode == "serial":
+                return self._outcomes(category_contexts, action_contexts, prompts, fused, stages)
+            try:
+                if mode == "processes":
+                    return self._executor(mode).submit(_process_contexts, category_contexts, action_contexts,
+                                                       stages, prompts_data, fused)
+                return self._executor(mode).submit(self._outcomes_for, category_contexts, action_contexts,
+                                                   stages, prompts, fused)
+            except Exception as e:
+                # e.g. a broken process pool; fail this batch only
+                failed = Future()
+                failed.set_exception(e)
+                return failed
+
+        # Emails waiting for results of another email in this run (a
+        # near-duplicate, or the newest message of their thread), by its id
+        queued: Set[str] = set()
+        followers: Dict[str, List[Tuple[Email, str, str]]] = {}
+        orphans: List[Tuple[Email, str, Stages]] = []
+
+        def release(email: Email, copied: List[Email]) -> None:
+            queued.discard(email.id)
+            for follower, content, kind in followers.pop(email.id, ()):
+                if email.processing_error is None:
+                    copied.append(self._inherit(follower, content, email, stage_prints, kind))
+                    self.last_stats[kind] += 1
+                    release(follower, copied)
+                else:
+                    orphans.append((follower, content, (True, True)))
+
+        def finish(batch, outcomes):
+            applied = self._apply(batch, outcomes, stage_prints)
+            copied: List[Email] = []
+            for email in applied:
+                release(email, copied)
+            self._count(len(copied), 0)
+            save(applied + copied)
+            indexes.aggregates.update_many(applied + copied)
+            return applied + copied
+
+        pending: Deque[Tuple[list, Future]] = deque()
+        window = self.workers * 2
+
+        def dispatch(batch):
+            if mode == "serial":
+                yield finish(batch, run(batch))
+                return
+            pending.append((batch, run(batch)))
+            while len(pending) > window or (pending and pending[0][1].done()):
+                done, future = pending.popleft()
+                yield finish(done, self._result(future, len(done)))
+
+        for kind, batch in self._plan(emails, indexes, stage_prints, size, queued, followers):
+            if kind == "work":
+                yield from dispatch(batch)
+            else:
+                self.last_stats[kind] += len(batch)
+                self._count(len(batch), 0)
+                if kind != "skipped":
+                    save(batch)
+                indexes.aggregates.update_many(batch)
+                yield batch
+        # Followers of failed emails are processed themselves once every
+        # batch they could have been waiting on is done
+        while pending or orphans:
+            while pending:
+                done, future = pending.popleft()
+                yield finish(done, self._result(future, len(done)))
+            while orphans:
+                batch = orphans[:size]
+                del orphans[:size]
+                yield from dispatch(batch)
+
+    def _plan(self, emails: Iterable[Email], indexes: InboxIndexes, stage_prints: Dict[str, str], size: int,
+              queued: Set[str], followers: Dict[str, List[Tuple[Email, str, str]]]) -> Iterator[Tuple[str, list]]:
+        """Split `emails` into ("skipped" | "duplicates" | "threaded", emails)
+        and ("work", items) batches.
+
+        An email that needs work may instead copy the results of another
+        email: with thread processing on, older messages take the category
+        of their thread's newest message (which alone is processed, and has
+        its actions extracted); with near-duplicate detection on, an email
+        copies the category and actions of a near-duplicate from the same
+        sender with the same subject. If that other email is `queued` in
+        this run, the email waits in `followers` for it.
+        """
+        batches: Dict[str, list] = {"skipped": [], "duplicates": [], "threaded": [], "work": []}
+        planned: Set[str] = set()
+
+        def source(email: Email, key: str, other: Any) -> bool:
+            other = indexes.deref(other)
+            if other is None:
+                return False
+            # Similar bodies under another sender or subject are different mail
+            # (a prize scam can reuse a colleague's wording)
+            if other.sender != email.sender or normalize_subject(other.subject) != normalize_subject(email.subject):
+                return False
+            if key in queued:
+                return True
+            if self.threaded and indexes.threads.newest(other) is not other:
+                return False
+            return other.processing_error is None and self._current(other, indexes, stage_prints)
+
+        def follow(email: Email, content: str, leader: Email, kind: str) -> None:
+            if leader.id in queued:
+                queued.add(email.id)
+                followers.setdefault(leader.id, []).append((email, content, kind))
+            else:
+                batches[kind].append(self._inherit(email, content, leader, stage_prints, kind))
+
+        def place(email: Email) -> None:
+            if self.threaded:
+                planned.add(email.id)
+            content = self._content_key(email, indexes)
+            stages = self._stages(email, content, stage_prints)
+            if not any(stages):
+                batches["skipped"].append(email)
+                return
+
+            if self.threaded:
+                newest = indexes.threads.newest(email)
+                if newest is not email:
+                    if newest.id not in planned:
+                        place(newest)
+                    if newest.id in queued or (newest.processing_error is None
+                                               and self._current(newest, indexes, stage_prints)):
+                        follow(email, content, newest, "threaded")
+                        return
+
+            if self.dedupe:
+                indexes.duplicates.insert(email.id, email.body, indexes.ref(email))
+                found = indexes.duplicates.find(email.id, lambda key, other: source(email, key, other))
+                if found is not None:
+                    follow(email, content, indexes.deref(found[1]), "duplicates")
+                    return
+
+            queued.add(email.id)
+            batches["work"].append((email, content, stages))
+
         for email in emails:
+            if email.id not in planned:
+                place(email)
+            for kind, batch in batches.items():
+                if len(batch) >= size:
+                    yield kind, batch
+                    batches[kind] = []
+        for kind, batch in batches.items():
+            if batch:
+                yield kind, batch
+
+    def _content_key(self, email: Email, indexes: InboxIndexes) -> str:
+        """Content fingerprint, plus the email's place in its thread when
+        thread processing is on (a new reply changes what the others need)."""
+        content = content_fingerprint(email)
+        if not self.threaded:
+            return content
+        return _fingerprint(content, "newest", indexes.threads.newest(email).id)
+
+    def _current(self, email: Email, indexes: InboxIndexes, stage_prints: Dict[str, str]) -> bool:
+        """Whether `email` holds results for its content and both current prompts."""
+        done = email.fingerprints
+        return (done.get("categorization") == stage_prints["categorization"]
+                and done.get("actions") == stage_prints["actions"]
+                and done.get("content") == self._content_key(email, indexes))
+
+    def _inherit(self, email: Email, content: str, source: Email, stage_prints: Dict[str, str],
+                 kind: str = "duplicates") -> Email:
+        """Give `email` the results of `source`: its near-duplicate, or the
+        newest message of its thread (category only; older messages carry
+        no actions of their own)."""
+        email.category = source.category
+        if kind == "duplicates":
+            email.actions = [dict(action) for action in source.actions]
+            email.duplicate_of = source.id
+        else:
+            email.actions = []
+            email.duplicate_of = None
+        email.processing_error = None
+        email.fingerprints = {"content": content, **stage_prints}
+        return email
+
+    def _outcomes_for(self, category_contexts: List[Dict[str, Any]], action_contexts: List[Dict[str, Any]],
+                      stages: List[Stages], prompts: PromptConfig, fused: bool) -> List[Outcome]:
+        return self._outcomes(category_contexts, action_contexts, prompts, fused, stages)
+
+    def _outcomes(self, category_contexts: List[Dict[str, Any]], action_contexts: List[Dict[str, Any]],
+                  prompts: PromptConfig, fused: bool = False,
+                  stages: Optional[List[Stages]] = None) -> List[Outcome]:
+        """Run the needed stages for a batch; one outcome per email, in order."""
+        stages = stages or [(True, True)] * len(category_contexts)
+        outcomes: List[Optional[Outcome]] = [None] * len(category_contexts)
+        for needed in [(True, True), (True, False), (False, True)]:
+            index = [i for i, s in enumerate(stages) if s == needed]
+            if not index:
+                continue
+            cc = [category_contexts[i] for i in index]
+            ac = [action_contexts[i] for i in index]
+            if needed == (True, True):
+                results = (self._fused_outcomes(cc, ac, prompts) if fused
+                           else self._separate_outcomes(cc, ac, prompts))
+            elif needed[0]:
+                results = [(value, [], self._describe(error), 1) for value, error in
+                           self._stage(prompts.categorization_prompt, cc, self._load_category)]
+            else:
+                results = [(None, value or [], self._describe(error), 1) for value, error in
+                           self._stage(prompts.action_item_prompt, ac, self._load_actions)]
+            for i, outcome in zip(index, results):
+                outcomes[i] = outcome
+        return outcomes
+
+    def _stage(self, prompt: str, contexts: List[Dict[str, Any]], load) -> List[Tuple[Any, Optional[Exception]]]:
+        """(parsed value, error) per context for one stage."""
+        try:
+            responses = self.llm.run_llm_batch(prompt, contexts)
+        except Exception as e:
+            return [(None, e)] * len(contexts)
+        results = []
+        for response in responses:
             try:
-                result = self.categorize_email(email, prompts.categorization_prompt)
-                email.category = result.get("category", "Important")
-                email.actions = self.extract_actions(email, prompts.action_item_prompt)
-                processed.append(email)
-            except:
-                email.category = "Important"
-                email.actions = []
-                processed.append(email)
-        return processed
+                results.append((load(response), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    def _separate_outcomes(self, category_contexts: List[Dict[str, Any]],
+                           action_contexts: List[Dict[str, Any]], prompts: PromptConfig) -> List[Outcome]:
+        categories = self._stage(prompts.categorization_prompt, category_contexts, self._load_category)
+        actions = self._stage(prompts.action_item_prompt, action_contexts, self._load_actions)
+        return [
+            (category, email_actions or [], self._describe(category_error or action_error), 2)
+            for (category, category_error), (email_actions, action_error) in zip(categories, actions)
+        ]
+
+    def _fused_outcomes(self, category_contexts: List[Dict[str, Any]],
+                        action_contexts: List[Dict[str, Any]], prompts: PromptConfig) -> List[Outcome]:
+        """One LLM call per email; malformed answers fall back to two calls."""
+        fused = self._stage(build_fused_prompt(prompts), category_contexts, self._load_fused)
+        outcomes: List[Optional[Outcome]] = []
+        retry = []
+        for i, (value, error) in enumerate(fused):
+            if error is None:
+                outcomes.append((value[0], value[1], None, 1))
+            else:
+                outcomes.append(None)
+                retry.append(i)
+
+        if retry:
+            fallback = self._separate_outcomes([category_contexts[i] for i in retry],
+                                               [action_contexts[i] for i in retry], prompts)
+            for i, (category, actions, error, calls) in zip(retry, fallback):
+                outcomes[i] = (category, actions, error, calls + 1)
+        return outcomes
+
+    def _result(self, future: Future, count: int) -> List[Outcome]:
+        try:
+            return future.result()
+        except Exception as e:
+            return [(None, [], self._describe(e), 0)] * count
+
+    def _apply(self, batch: List[Tuple[Email, str, Stages]], outcomes: List[Outcome],
+               stage_prints: Dict[str, str]) -> List[Email]:
+        """Write outcomes onto the emails of a batch and record fingerprints."""
+        stats = self.last_stats
+        applied = []
+        for (email, content, (categorize, extract)), (category, actions, error, calls) in zip(batch, outcomes):
+            fingerprints = dict(email.fingerprints) if email.fingerprints.get("content") == content else {}
+            if categorize:
+                email.category = category
+                fingerprints.pop("categorization", None)
+            if extract:
+                email.actions = actions
+                fingerprints.pop("actions", None)
+            email.processing_error = error
+            email.duplicate_of = None
+            if error is None:
+                fingerprints["content"] = content
+                if categorize:
+                    fingerprints["categorization"] = stage_prints["categorization"]
+                if extract:
+                    fingerprints["actions"] = stage_prints["actions"]
+            email.fingerprints = fingerprints
+            stats["failed"] += error is not None
+            stats["fused_fallbacks"] += stats["fused"] and categorize and extract and calls > 2
+            self._count(1, calls)
+            applied.append(email)
+        stats["recomputed"] += len(applied)
+        return applied
+
+    def _count(self, emails: int, calls: int) -> None:
+        stats = self.last_stats
+        stats["emails"] += emails
+        stats["llm_calls"] += calls
+        stats["calls_per_email"] = stats["llm_calls"] / stats["emails"] if stats["emails"] else 0.0
+
+    @staticmethod
+    def _describe(error: Optional[Exception]) -> Optional[str]:
+        if error is None:
+            return None
+        error_type = getattr(error, "error_type", type(error).__name__)
+        return f"{error_type}: {error}"
+
+    def _executor(self, mode: str) -> Executor:
+        key = (mode, self.workers)
+        if key not in self._executors:
+            if mode == "processes":
+                # spawn: forking the multi-threaded Streamlit server is unsafe
+                self._executors[key] = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executors[key] = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="email-processing"
+                )
+        return self._executors[key]
 
     def categorize_email(self, email: Email, prompt: str) -> Dict[str, Any]:
-        context = {
+        response = self.llm.run_llm(prompt, self._category_context(email))
+        return self._parse_category(response)
+
+    def extract_actions(self, email: Email, prompt: str) -> List[Dict[str, Any]]:
+        response = self.llm.run_llm(prompt, self._action_context(email))
+        return self._parse_actions(response)
+
+    def categorize_batch(self, emails: List[Email], prompt: str) -> List[Dict[str, Any]]:
+        responses = self.llm.run_llm_batch(prompt, self._category_contexts(emails))
+        return [self._parse_category(r) for r in responses]
+
+    def extract_actions_batch(self, emails: List[Email], prompt: str) -> List[List[Dict[str, Any]]]:
+        responses = self.llm.run_llm_batch(prompt, self._action_contexts(emails))
+        return [self._parse_actions(r) for r in responses]
+
+    @staticmethod
+    def _category_context(email: Email) -> Dict[str, Any]:
+        return {
             "email_subject": email.subject,
             "email_body": email.body,
             "email_sender": email.sender
         }
-        response = self.llm.run_llm(prompt, context)
-        try:
-            return json.loads(response)
-        except:
-            return {"category": "Important", "reason": "Error"}
 
-    def extract_actions(self, email: Email, prompt: str) -> List[Dict[str, Any]]:
-        context = {
+    @staticmethod
+    def _action_context(email: Email) -> Dict[str, Any]:
+        return {
             "email_subject": email.subject,
             "email_body": email.body
         }
-        response = self.llm.run_llm(prompt, context)
+
+    def _category_contexts(self, emails: List[Email]) -> List[Dict[str, Any]]:
+        return [self._category_context(e) for e in emails]
+
+    def _action_contexts(self, emails: List[Email]) -> List[Dict[str, Any]]:
+        return [self._action_context(e) for e in emails]
+
+    @staticmethod
+    def _load_category(response: str) -> str:
+        """Strict parse: raises instead of defaulting, so failures are recorded."""
+        data = json.loads(response)
+        error = LLMError.from_response(data)
+        if error:
+            raise error
+        if not isinstance(data, dict) or not data.get("category"):
+            raise ValueError("categorization response has no category")
+        return data["category"]
+
+    @staticmethod
+    def _load_actions(response: str) -> List[Dict[str, Any]]:
+        data = json.loads(response)
+        error = LLMError.from_response(data)
+        if error:
+            raise error
+        if not isinstance(data, list):
+            raise ValueError("action extraction response is not a list")
+        return _normalize_actions(data)
+
+    @staticmethod
+    def _load_fused(response: str) -> Tuple[str, List[Dict[str, Any]]]:
+        data = json.loads(response)
+        error = LLMError.from_response(data)
+        if error:
+            raise error
+        if not isinstance(data, dict) or not data.get("category") or not isinstance(data.get("actions"), list):
+            raise ValueError("fused response needs a category and an action list")
+        return data["category"], _normalize_actions(data["actions"])
+
+    @staticmethod
+    def _parse_category(response: str) -> Dict[str, Any]:
+        try:
+            result = json.loads(response)
+            return result if isinstance(result, dict) else {"category": "Important", "reason": "Error"}
+        except:
+            return {"category": "Important", "reason": "Error"}
+
+    @staticmethod
+    def _parse_actions(response: str) -> List[Dict[str, Any]]:
         try:
             actions = json.loads(response)
-            return actions if isinstance(actions, list) else []
+            return _normalize_actions(actions) if isinstance(actions, list) else []
         except:
             return []
 
 
+def _process_contexts(category_contexts: List[Dict[str, Any]], action_contexts: List[Dict[str, Any]],
+                      stages: List[Stages], prompts_data: Dict[str, str], fused: bool) -> List[Outcome]:
+    """Process-pool entry point; runs with the worker's own LLM client."""
+    return email_processor._outcomes(category_contexts, action_contexts,
+                                     PromptConfig(**prompts_data), fused, stages)
+
+
 email_processor = EmailProcessor()
@@ -0,0 +1,343 @@
+"""Local semantic search over the inbox"""
+import hashlib
+import math
+import os
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.models import Email
+
+# Characters of body text vectorised per email; the opening of an email
+# says most about what it is
+BODY_CHARS = 2000
+# Rows scored per matrix product, to bound temporary memory
+_CHUNK = 16384
+# ASCII punctuation and whitespace become spaces; UTF-8 bytes of
+# non-ASCII letters pass through
+_SEPARATORS = bytes(b if chr(b).isalnum() or b >= 0x80 else 0x20 for b in range(256))
+
+
+class HashingVectorizer:
+    """Fixed-size vectors from hashed character n-grams, without a vocabulary.
+
+    Text is lowercased, every run of non-alphanumeric characters becomes
+    one space and each character n-gram (spaces included, so word
+    boundaries count) is hashed into one of `dim` signed buckets. Counts
+    are dampened with log1p and rows L2-normalised, so a dot product is a
+    cosine similarity. Shared n-grams make paraphrases and inflected forms
+    ("meeting"/"meetings") land close together. Hashing is done in NumPy
+    over a whole batch of texts at once.
+    """
+
+    def __init__(self, dim: int = 256, n: int = 3):
+        self.dim = dim
+        self.n = n
+
+    def transform(self, texts: Sequence[str]) -> np.ndarray:
+        """One float32 row per text."""
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        encoded = [text.lower().encode("utf-8").translate(_SEPARATORS) for text in texts]
+        lengths = np.fromiter((len(b) + 1 for b in encoded), dtype=np.int64, count=len(encoded))
+        # Texts joined by NUL; n-grams spanning a NUL are dropped below
+        data = np.frombuffer(b"\0".join(encoded) + b"\0", dtype=np.uint8)
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        # Collapse runs of spaces into one
+        keep = (data != 0x20) | np.concatenate(([True], data[:-1] != 0x20))
+        data, rows = data[keep].astype(np.uint64), rows[keep]
+        n = self.n
+        if len(data) < n:
+            return out
+        grams = len(data) - n + 1
+        hashed = np.zeros(grams, dtype=np.uint64)
+        valid = np.ones(grams, dtype=bool)
+        for i in range(n):
+            window = data[i:i + grams]
+            hashed = hashed * np.uint64(1099511628211) + window
+            valid &= window != 0
+        # Fibonacci hashing: the top bits pick the bucket, the next one the sign
+        hashed *= np.uint64(11400714819323198485)
+        buckets = (hashed >> np.uint64(40)) % np.uint64(self.dim)
+        signs = np.where((hashed >> np.uint64(39)) & np.uint64(1), 1.0, -1.0)
+        rows = rows[:grams]
+        flat = (rows[valid] * self.dim + buckets[valid].astype(np.int64))
+        out += np.bincount(flat, weights=signs[valid], minlength=out.size).reshape(out.shape).astype(np.float32)
+        np.copysign(np.log1p(np.abs(out)), out, out=out)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def _text(email: Email) -> str:
+    return f"{email.subject}\n{email.body[:BODY_CHARS]}"
+
+
+def _key(email: Email) -> int:
+    # A lazily loaded body is keyed on its place in the mailbox, not read
+    text = f"{email.subject}\n\0{email.body_stamp()}" if getattr(email, "lazy_body", False) else _text(email)
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") >> 1
+
+
+class EmbeddingIndex:
+    """Email vectors in one float32 matrix, searched by cosine similarity.
+
+    Rows are appended as emails arrive; an email whose subject and body
+    are unchanged keeps its row, a changed one is re-vectorised in place
+    and a removed one is zeroed. Search is a batched matrix product plus
+    `argpartition` top-k.
+
+    Past `ivf_min` emails an IVF coarse quantiser is trained (spherical
+    k-means, about sqrt(n) lists): each row is filed under its nearest
+    centroid and a query scores only the rows of its `nprobe` nearest
+    lists, trading a little recall for latency on large inboxes.
+    """
+
+    def __init__(self, vectorizer: Optional[HashingVectorizer] = None, ivf_min: int = 50000, nprobe: int = 16):
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self.ivf_min = ivf_min
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._matrix = np.zeros((0, self.vectorizer.dim), dtype=np.float32)
+        self._size = 0
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, Tuple[int, int]] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[array] = []
+        self._trained_on = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, email_id: str) -> bool:
+        return email_id in self._rows
+
+    @property
+    def ivf(self) -> bool:
+        return self._centroids is not None
+
+    def current(self, email: Email) -> bool:
+        """Whether `email` is indexed as it is now."""
+        known = self._rows.get(email.id)
+        return known is not None and known[1] == _key(email)
+
+    def insert_many(self, emails: Iterable[Email], batch_size: int = 4096) -> int:
+        """Index new or changed emails; returns how many were (re)vectorised."""
+        changed = 0
+        batch: List[Tuple[Email, int]] = []
+        for email in emails:
+            key = _key(email)
+            known = self._rows.get(email.id)
+            if known is not None and known[1] == key:
+                continue
+            batch.append((email, key))
+            if len(batch) >= batch_size:
+                changed += self._insert(batch)
+                batch = []
+        if batch:
+            changed += self._insert(batch)
+        self._maybe_train()
+        return changed
+
+    def _insert(self, batch: List[Tuple[Email, int]]) -> int:
+        vectors = self.vectorizer.transform([_text(email) for email, _ in batch])
+        with self._lock:
+            for (email, key), vector in zip(batch, vectors):
+                known = self._rows.get(email.id)
+                if known is not None:
+                    row = known[0]
+                else:
+                    row = self._size
+                    self._grow(row + 1)
+                    self._size += 1
+                    self._ids.append(email.id)
+                self._matrix[row] = vector
+                self._rows[email.id] = (row, key)
+                if self._centroids is not None:
+                    # A changed row may stay listed under its old centroid
+                    # too; search dedupes candidates
+                    self._lists[int(np.argmax(self._centroids @ vector))].append(row)
+        return len(batch)
+
+    def _grow(self, size: int) -> None:
+        if size > len(self._matrix):
+            grown = np.zeros((max(size, 2 * len(self._matrix), 1024), self.vectorizer.dim), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+
+    def remove(self, email_id: str) -> None:
+        with self._lock:
+            known = self._rows.pop(email_id, None)
+            if known is not None:
+                self._matrix[known[0]] = 0
+                self._ids[known[0]] = None
+
+    def sync(self, emails: Iterable[Email]) -> int:
+        """Make the index match `emails`; returns how many emails changed."""
+        seen = set()
+
+        def tracked():
+            for email in emails:
+                seen.add(email.id)
+                yield email
+
+        changed = self.insert_many(tracked())
+        return changed + self.retain(seen)
+
+    def retain(self, email_ids: Set[str]) -> int:
+        """Remove every email not in `email_ids`; returns how many were removed."""
+        gone = [i for i in self._rows if i not in email_ids]
+        for email_id in gone:
+            self.remove(email_id)
+        return len(gone)
+
+    def _maybe_train(self) -> None:
+        live = len(self._rows)
+        if live >= self.ivf_min and (self._centroids is None or live > 4 * self._trained_on):
+            self.train()
+
+    def train(self, lists: Optional[int] = None, iterations: int = 8, seed: int = 0) -> None:
+        """Fit the IVF coarse quantiser and file every row under its nearest centroid."""
+        with self._lock:
+            matrix = self._matrix[:self._size]
+            alive = np.flatnonzero(np.fromiter((i is not None for i in self._ids), dtype=bool, count=self._size))
+            if not len(alive):
+                return
+            lists = max(1, min(lists or int(math.sqrt(len(alive))), len(alive)))
+            rng = np.random.default_rng(seed)
+            sample = matrix[rng.choice(alive, size=min(len(alive), 64 * lists), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+            for _ in range(iterations):
+                nearest = self._nearest(sample, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, nearest, sample)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                # An empty list keeps its old centroid
+                centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+            nearest = self._nearest(matrix[alive], centroids)
+            order = np.argsort(nearest, kind="stable")
+            bounds = np.searchsorted(nearest[order], np.arange(lists + 1))
+            rows = alive[order].astype(np.uint32)
+            self._lists = [array("I", rows[bounds[i]:bounds[i + 1]].tobytes()) for i in range(lists)]
+            self._centroids = centroids
+            self._trained_on = len(alive)
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        nearest = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), _CHUNK):
+            nearest[start:start + _CHUNK] = np.argmax(vectors[start:start + _CHUNK] @ centroids.T, axis=1)
+        return nearest
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """The `k` most similar (email id, cosine) pairs for `query`, best first."""
+        return self.search_vectors(self.vectorizer.transform([query]), k)[0]
+
+    def search_many(self, queries: Sequence[str], k: int = 5) -> List[List[Tuple[str, float]]]:
+        return self.search_vectors(self.vectorizer.transform(list(queries)), k)
+
+    def similar(self, email_id: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Emails most similar to an indexed one, excluding itself."""
+        known = self._rows.get(email_id)
+        if known is None:
+            return []
+        vector = self._matrix[known[0]:known[0] + 1].copy()
+        return [hit for hit in self.search_vectors(vector, k + 1)[0] if hit[0] != email_id][:k]
+
+    def search_vectors(self, queries: np.ndarray, k: int = 5) -> List[List[Tuple[str, float]]]:
+        with self._lock:
+            if not self._rows:
+                return [[] for _ in queries]
+            if self._centroids is None:
+                return [self._top(row, None, k) for row in self._scores(queries)]
+            probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :self.nprobe]
+            results = []
+            for query, lists in zip(queries, probes):
+                candidates = np.unique(np.concatenate([np.frombuffer(self._lists[i], dtype=np.uint32)
+                                                       for i in lists]))
+                results.append(self._top(self._matrix[candidates] @ query, candidates, k))
+            return results
+
+    def _scores(self, queries: np.ndarray) -> Iterable[np.ndarray]:
+        matrix = self._matrix[:self._size]
+        for start in range(0, len(queries), 64):
+            block = np.empty((min(64, len(queries) - start), self._size), dtype=np.float32)
+            for row in range(0, self._size, _CHUNK * 4):
+                block[:, row:row + _CHUNK * 4] = queries[start:start + 64] @ matrix[row:row + _CHUNK * 4].T
+            yield from block
+
+    def _top(self, scores: np.ndarray, rows: Optional[np.ndarray], k: int) -> List[Tuple[str, float]]:
+        # Over-fetch: removed rows score 0 but may still be picked
+        need = min(len(scores), k + 8)
+        if not need:
+            return []
+        top = np.argpartition(-scores, need - 1)[:need] if need < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        hits = []
+        for position in top:
+            row = int(position if rows is None else rows[position])
+            email_id = self._ids[row]
+            if email_id is not None and scores[position] > 0:
+                hits.append((email_id, float(scores[position])))
+                if len(hits) == k:
+                    break
+        return hits
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def save(self, path: Path) -> None:
+        """Write the index to `path` (NumPy .npz), atomically."""
+        path = Path(path)
+        with self._lock:
+            ids = [email_id or "" for email_id in self._ids]
+            data = dict(
+                params=np.array([self.vectorizer.dim, self.vectorizer.n, self._trained_on]),
+                matrix=self._matrix[:self._size],
+                ids=np.frombuffer("\0".join(ids).encode("utf-8"), dtype=np.uint8),
+                keys=np.array([self._rows[i][1] if i else 0 for i in self._ids], dtype=np.int64),
+            )
+            if self._centroids is not None:
+                data["centroids"] = self._centroids
+                data["list_sizes"] = np.array([len(rows) for rows in self._lists], dtype=np.int64)
+                data["list_rows"] = np.frombuffer(b"".join(rows.tobytes() for rows in self._lists), dtype=np.uint32)
+        temp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        try:
+            np.savez(temp, **data)
+            os.replace(temp, path)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+
+    def load(self, path: Path) -> None:
+        """Replace the index with one written by `save`; raises ValueError
+        if it was built with different vectoriser settings."""
+        with np.load(Path(path)) as data:
+            dim, n, trained_on = data["params"].tolist()
+            if (dim, n) != (self.vectorizer.dim, self.vectorizer.n):
+                raise ValueError(f"{path} was built with dim={dim}, n={n}")
+            matrix = data["matrix"]
+            ids = bytes(data["ids"]).decode("utf-8").split("\0") if len(data["ids"]) else []
+            keys = data["keys"].tolist()
+            centroids, lists = None, []
+            if "centroids" in data:
+                centroids = data["centroids"]
+                rows, start = data["list_rows"], 0
+                for end in np.cumsum(data["list_sizes"]).tolist():
+                    lists.append(array("I", rows[start:end].tobytes()))
+                    start = end
+        with self._lock:
+            self._matrix = matrix
+            self._size = len(matrix)
+            self._ids = [email_id or None for email_id in ids]
+            self._rows = {email_id: (row, keys[row]) for row, email_id in enumerate(self._ids) if email_id}
+            self._centroids, self._lists, self._trained_on = centroids, lists, trained_on
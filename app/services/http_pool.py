@@ -0,0 +1,100 @@
+"""HTTP connection pool"""
+import http.client
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+
+class HTTPConnectionPool:
+    """Keep-alive HTTP(S) connections to one host, shared between threads.
+
+    Connections are taken from an idle stack for each request and put back
+    afterwards, so consecutive requests reuse the same TCP/TLS session
+    instead of reconnecting. At most `max_connections` idle connections are
+    kept; extra ones opened under load are closed when released.
+    """
+
+    def __init__(self, base_url: str, max_connections: int = 8, timeout: float = 30.0):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        with self._lock:
+            self.connections_opened += 1
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    @staticmethod
+    def _set_timeout(conn: http.client.HTTPConnection, deadline: float) -> None:
+        """Bound the next socket operations by the time left until `deadline`."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("HTTP request deadline exceeded")
+        conn.timeout = remaining
+        if conn.sock is not None:
+            conn.sock.settimeout(remaining)
+
+    def _acquire(self) -> Optional[http.client.HTTPConnection]:
+        with self._lock:
+            return self._idle.pop() if self._idle else None
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_connections:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def post_json(self, path: str, payload: Dict[str, Any],
+                  headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> Any:
+        """POST `payload` as JSON and return the decoded reply. Connecting,
+        sending and reading, a retry included, only get the time left of
+        `timeout` seconds (by default the pool's) from the start."""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        body = json.dumps(payload).encode("utf-8")
+        request_headers = {"Content-Type": "application/json", **(headers or {})}
+        conn = self._acquire()
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._connect()
+            try:
+                self._set_timeout(conn, deadline)
+                conn.request("POST", self.base_path + path, body=body, headers=request_headers)
+                self._set_timeout(conn, deadline)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                if not reused:
+                    raise
+                # An idle keep-alive connection was closed by the server; retry once
+                conn, reused = None, False
+            except Exception:
+                conn.close()
+                raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status}: {data[:200].decode('utf-8', 'replace')}")
+        return json.loads(data)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
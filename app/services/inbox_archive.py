@@ -0,0 +1,154 @@
+"""Compressed, block-indexed inbox archive"""
+import json
+import lzma
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+ARCHIVE_SUFFIX = ".emlz"
+
+_MAGIC = b"EMLZ1\n"
+# Trailer: footer offset, footer length, magic
+_TRAILER = struct.Struct("<QQ6s")
+_CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+def write_archive(records: Iterable[Dict[str, Any]], path: Path, block_size: int = 256,
+                  codec: str = "zlib") -> int:
+    """Write inbox `records` as an archive at `path`; returns the email count.
+
+    Records are sorted by timestamp so each block covers a narrow date
+    range, then written `block_size` at a time as independently
+    compressed JSON Lines blocks. A compressed footer lists, per block,
+    its offset, length, date range and email ids. The file is written
+    to a temp name and renamed into place.
+    """
+    compress = _CODECS[codec][0]
+    path = Path(path)
+    records = sorted(records, key=lambda r: r.get("timestamp") or "")
+    blocks: List[Dict[str, Any]] = []
+    temp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(temp, "wb") as f:
+            f.write(_MAGIC)
+            for start in range(0, len(records), block_size):
+                chunk = records[start:start + block_size]
+                data = compress("\n".join(json.dumps(r) for r in chunk).encode("utf-8"))
+                blocks.append({
+                    "offset": f.tell(),
+                    "length": len(data),
+                    "first": chunk[0].get("timestamp") or "",
+                    "last": chunk[-1].get("timestamp") or "",
+                    "ids": [r["id"] for r in chunk],
+                })
+                f.write(data)
+            footer = zlib.compress(json.dumps({"codec": codec, "blocks": blocks}).encode("utf-8"))
+            offset = f.tell()
+            f.write(footer)
+            f.write(_TRAILER.pack(offset, len(footer), _MAGIC))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+    return len(records)
+
+
+def is_archive(path: Path) -> bool:
+    path = Path(path)
+    if path.suffix.lower() == ARCHIVE_SUFFIX:
+        return True
+    if not path.is_file():
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+
+class InboxArchive:
+    """Read side of an archive written by `write_archive`.
+
+    Opening reads only the trailer and footer. Looking up an email by id
+    or a date range decompresses just the blocks that can hold it; the
+    most recently used blocks are kept decompressed.
+    """
+
+    def __init__(self, path: Path, cached_blocks: int = 8):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{self.path} is not an inbox archive")
+            f.seek(-_TRAILER.size, os.SEEK_END)
+            offset, length, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{self.path} is truncated")
+            f.seek(offset)
+            footer = json.loads(zlib.decompress(f.read(length)))
+        self.codec = footer["codec"]
+        self._decompress = _CODECS[self.codec][1]
+        self.blocks: List[Dict[str, Any]] = footer["blocks"]
+        self._block_of: Dict[str, int] = {
+            email_id: number for number, block in enumerate(self.blocks) for email_id in block["ids"]
+        }
+        self._cache: "OrderedDict[int, List[Dict[str, Any]]]" = OrderedDict()
+        self._cached_blocks = cached_blocks
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._block_of)
+
+    def __contains__(self, email_id: str) -> bool:
+        return email_id in self._block_of
+
+    def block(self, number: int) -> List[Dict[str, Any]]:
+        """The records of one block, decompressed on first use."""
+        with self._lock:
+            records = self._cache.get(number)
+            if records is not None:
+                self._cache.move_to_end(number)
+                return records
+        with open(self.path, "rb") as f:
+            records = self._read(f, self.blocks[number])
+        with self._lock:
+            self._cache[number] = records
+            while len(self._cache) > self._cached_blocks:
+                self._cache.popitem(last=False)
+        return records
+
+    def _read(self, f, block: Dict[str, Any]) -> List[Dict[str, Any]]:
+        f.seek(block["offset"])
+        data = self._decompress(f.read(block["length"]))
+        return [json.loads(line) for line in data.decode("utf-8").split("\n")]
+
+    def get(self, email_id: str) -> Optional[Dict[str, Any]]:
+        number = self._block_of.get(email_id)
+        if number is None:
+            return None
+        return next((r for r in self.block(number) if r["id"] == email_id), None)
+
+    def between(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Records with `start` <= timestamp <= `end`, oldest first.
+
+        Timestamps are ISO 8601 strings and compared as such; blocks whose
+        range lies outside the bounds are never read.
+        """
+        for number, block in enumerate(self.blocks):
+            if (start is not None and block["last"] < start) or (end is not None and block["first"] > end):
+                continue
+            for record in self.block(number):
+                timestamp = record.get("timestamp") or ""
+                if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                    yield record
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # Bypasses the block cache: a full scan would only evict it
+        with open(self.path, "rb") as f:
+            for block in self.blocks:
+                yield from self._read(f, block)
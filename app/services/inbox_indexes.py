@@ -0,0 +1,87 @@
+"""Per-inbox indexes"""
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from app.models import Email
+from app.services.aggregates import InboxAggregates
+from app.services.embeddings import EmbeddingIndex, HashingVectorizer
+from app.services.near_duplicates import SimHashIndex
+from app.services.search_index import SearchIndex
+from app.services.threads import ThreadIndex
+
+
+class InboxIndexes:
+    """Everything derived from one loaded inbox: threads, near-duplicate
+    candidates, aggregates, and the keyword and semantic search indexes.
+
+    Each CompactInbox owns one, so two browser sessions, or two loaded
+    date ranges, never see each other's threads, counts or search hits.
+    The processor and the agent find it through `indexes_for`.
+    """
+
+    def __init__(self):
+        self.threads = ThreadIndex()
+        # Payloads are Emails, or their ids when `lookup` resolves them
+        self.duplicates: SimHashIndex[Any] = SimHashIndex(
+            float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.95"))
+        )
+        self.aggregates = InboxAggregates()
+        self.search = SearchIndex()
+        self.embeddings = EmbeddingIndex(
+            HashingVectorizer(int(os.getenv("EMBEDDING_DIM", "256"))),
+            ivf_min=int(os.getenv("EMBEDDING_IVF_MIN", "50000")),
+        )
+        self.lookup: Optional[Callable[[str], Optional[Email]]] = None
+        # What was loaded into the inbox (e.g. its date range); saved search
+        # indexes are kept per scope, see StorageService.index_files
+        self.scope = ""
+        # Whether the search indexes saved by an earlier session were read
+        self.search_loaded = False
+        # Mailbox emails left out of the search indexes until first needed
+        self.pending: Dict[str, Email] = {}
+
+    def sync_search(self, emails: Iterable[Email]) -> int:
+        """Bring the keyword and semantic indexes in line with `emails`;
+        returns how many emails were (re)indexed or removed.
+
+        A mailbox email already indexed as it is costs no read. New or
+        changed ones are not read here either: they wait in `pending` for
+        `index_pending`, so loading a mailbox reads no bodies.
+        """
+        seen: Set[str] = set()
+        eager: List[Email] = []
+        self.pending = {}
+        for email in emails:
+            seen.add(email.id)
+            if getattr(email, "lazy_body", False) and not (self.search.current(email)
+                                                           and self.embeddings.current(email)):
+                self.pending[email.id] = email
+            else:
+                eager.append(email)
+        return max(self.search.insert_many(eager) + self.search.retain(seen),
+                   self.embeddings.insert_many(eager) + self.embeddings.retain(seen))
+
+    def index_pending(self, batch_size: int = 500) -> int:
+        """Index the emails `sync_search` deferred, reading each body once."""
+        pending, self.pending = list(self.pending.values()), {}
+        for start in range(0, len(pending), batch_size):
+            loaded = [email.with_body() for email in pending[start:start + batch_size]]
+            self.search.insert_many(loaded)
+            self.embeddings.insert_many(loaded)
+        return len(pending)
+
+    def ref(self, email: Email) -> Any:
+        return email if self.lookup is None else email.id
+
+    def deref(self, payload: Any) -> Optional[Email]:
+        return self.lookup(payload) if isinstance(payload, str) else payload
+
+
+# For plain lists of emails (scripts, tests), which cannot carry their own
+shared_indexes = InboxIndexes()
+
+
+def indexes_for(emails: Any) -> InboxIndexes:
+    """The indexes of `emails`: its own for a CompactInbox, the shared ones otherwise."""
+    indexes = getattr(emails, "indexes", None)
+    return indexes if isinstance(indexes, InboxIndexes) else shared_indexes
@@ -0,0 +1,84 @@
+"""Date-partitioned inbox storage"""
+import json
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from app.services.inbox_reader import iter_records
+
+GRANULARITIES = {"month": 7, "day": 10}
+UNDATED = "undated"
+
+_PARTITION = re.compile(r"^(\d{4}-\d{2}(?:-\d{2})?|undated)\.jsonl$")
+
+
+def in_range(timestamp: str, start: Optional[str], end: Optional[str]) -> bool:
+    """Whether an ISO 8601 `timestamp` lies in [start, end]; None is unbounded."""
+    return (start is None or timestamp >= start) and (end is None or timestamp <= end)
+
+
+def is_partitioned(path: Path) -> bool:
+    path = Path(path)
+    return path.is_dir() and any(_PARTITION.match(p.name) for p in path.iterdir())
+
+
+class PartitionedInbox:
+    """An inbox directory with one JSON Lines file per month (or day).
+
+    Files are named by the period they hold ("2025-11.jsonl" or
+    "2025-11-25.jsonl"; emails without a timestamp go to
+    "undated.jsonl"). Reads for a time range open only the partitions
+    that overlap it, and new mail is appended to its own partition, so
+    older partitions are never rewritten.
+    """
+
+    def __init__(self, root: Path, granularity: str = "month"):
+        self.root = Path(root)
+        self.granularity = granularity
+        self._width = GRANULARITIES[granularity]
+
+    def key(self, timestamp: Optional[str]) -> str:
+        return timestamp[:self._width] if timestamp and len(timestamp) >= self._width else UNDATED
+
+    def partitions(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Path]:
+        """Partition files that can hold emails in [start, end], oldest first."""
+        if not self.root.is_dir():
+            return []
+        found = []
+        for path in self.root.iterdir():
+            match = _PARTITION.match(path.name)
+            if not match:
+                continue
+            key = match.group(1)
+            if key == UNDATED:
+                # Undated mail has no place in a bounded range
+                if start is None and end is None:
+                    found.append(path)
+                continue
+            # A partition covers every timestamp starting with its key
+            if (start is None or key >= start[:len(key)]) and (end is None or key <= end[:len(key)]):
+                found.append(path)
+        return sorted(found, key=lambda p: (p.stem == UNDATED, p.stem))
+
+    def iter_records(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        bounded = start is not None or end is not None
+        for path in self.partitions(start, end):
+            for record in iter_records(path):
+                if not bounded or in_range(record.get("timestamp") or "", start, end):
+                    yield record
+
+    def append(self, records: Iterable[Dict[str, Any]], fsync: bool = True) -> int:
+        """Append records to their partitions; returns how many were written."""
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for record in records:
+            groups[self.key(record.get("timestamp"))].append(json.dumps(record))
+        self.root.mkdir(parents=True, exist_ok=True)
+        for key, lines in groups.items():
+            with open(self.root / f"{key}.jsonl", "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+        return sum(len(lines) for lines in groups.values())
@@ -0,0 +1,128 @@
+"""Streaming inbox reader"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, TypeVar
+from app.models import Email
+from app.services.inbox_archive import InboxArchive, is_archive
+
+T = TypeVar("T")
+
+JSON_LINES_SUFFIXES = (".jsonl", ".ndjson")
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def iter_json_lines(f: TextIO) -> Iterator[Dict[str, Any]]:
+    """Records of a JSON Lines file, one per non-blank line."""
+    for number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {number}: {e}") from None
+
+
+def iter_json_array(f: TextIO, block_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """Elements of a top-level JSON array, parsed as the file is read.
+
+    The file is read `block_size` characters at a time and each element is
+    decoded with `JSONDecoder.raw_decode` as soon as it is complete, so only
+    the current block and element are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        block = f.read(block_size)
+        if not block:
+            eof = True
+            return False
+        buffer = buffer[pos:] + block
+        pos = 0
+        return True
+
+    def skip(chars: str) -> None:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    skip(_WHITESPACE)
+    if buffer[pos:pos + 1] != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    expect_comma = False
+    while True:
+        skip(_WHITESPACE)
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if buffer[pos] == "]":
+            return
+        if expect_comma:
+            if buffer[pos] != ",":
+                raise ValueError(f"Expected ',' or ']' at offset {pos}")
+            pos += 1
+            skip(_WHITESPACE)
+        while True:
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+                # A number cut at the block boundary ("12" of "123", "-4500." of
+                # "-4500.0") decodes but is incomplete until a delimiter follows
+                if eof or (end < len(buffer) and buffer[end] in _DELIMITERS):
+                    break
+            except ValueError:
+                if eof:
+                    raise
+            fill()
+        pos = end
+        expect_comma = True
+        yield record
+
+
+def iter_records(path: Path, block_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """Records of a JSON array, JSON Lines or archive inbox file, streamed."""
+    path = Path(path)
+    if is_archive(path):
+        yield from InboxArchive(path)
+        return
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.suffix.lower() in JSON_LINES_SUFFIXES:
+            yield from iter_json_lines(f)
+            return
+        # Sniff: a JSON Lines file starts with an object, an array with "["
+        head = f.read(64).lstrip(_WHITESPACE)
+        f.seek(0)
+        if head.startswith("{"):
+            yield from iter_json_lines(f)
+        else:
+            yield from iter_json_array(f, block_size)
+
+
+def chunked(items: Iterable[T], chunk_size: int) -> Iterator[List[T]]:
+    chunk: List[T] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_record_chunks(path: Path, chunk_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+    """Raw records of an inbox file in lists of up to `chunk_size`."""
+    return chunked(iter_records(path), chunk_size)
+
+
+def iter_email_chunks(path: Path, chunk_size: int = 500) -> Iterator[List[Email]]:
+    """`Email`s of an inbox file in lists of up to `chunk_size`."""
+    for records in iter_record_chunks(path, chunk_size):
+        yield [Email(**record) for record in records]
@@ -0,0 +1,121 @@
+"""Keyword matcher"""
+from typing import Dict, FrozenSet, List, Tuple
+
+
+# Keyword groups used by the mock LLM. Groups are checked against the
+# lowercased body, except the full-scope ones (spam) which are checked
+# against body + subject.
+KEYWORD_GROUPS: Dict[str, List[str]] = {
+    "finance": ["$", "budget", "payment", "cost", "funding"],
+    "finance_urgent": ["urgent", "asap", "immediately", "confirm"],
+    "meeting": ["meeting", "schedule", "calendar", "appointment", "call"],
+    "urgent": ["urgent", "asap", "critical", "immediate", "deadline"],
+    "newsletter": ["unsubscribe", "newsletter", "weekly", "digest"],
+    "spam": [
+        "click here", "win", "prize", "lottery", "congratulations",
+        "verify account", "limited offer", "act now", "claim"
+    ],
+    "action_meeting": ["meeting", "schedule"],
+    "action_review": ["review", "feedback"],
+    "action_submit": ["submit", "send", "share", "upload"],
+    "action_rsvp": ["rsvp"],
+    "reply_meeting": ["meeting", "schedule"],
+    "reply_partnership": ["partnership", "collaboration"],
+    "summary_finance": ["$", "budget"],
+    "summary_meeting": ["meeting"],
+    "summary_deadline": ["deadline", "urgent"],
+}
+
+FULL_SCOPE_GROUPS = ("spam",)
+
+# The mock categorization cascade: the first rule whose groups are all hit
+# decides the category, otherwise DEFAULT_CATEGORY applies.
+CATEGORY_RULES: Tuple[Tuple[Tuple[str, ...], str, str], ...] = (
+    (("finance", "finance_urgent"), "To-Do", "Financial matter requiring immediate action"),
+    (("meeting",), "To-Do", "Meeting request requiring response"),
+    (("urgent",), "Important", "Marked as urgent or time-sensitive"),
+    (("newsletter",), "Newsletter", "Newsletter or promotional content"),
+    (("spam",), "Spam", "Contains spam indicators and urgency tactics"),
+)
+DEFAULT_CATEGORY = ("Important", "Requires attention")
+
+# The mock action extraction: one (task, deadline) per group hit, in order.
+ACTION_RULES: Tuple[Tuple[str, str, str], ...] = (
+    ("action_meeting", "Confirm meeting attendance and schedule", "2025-11-28"),
+    ("action_review", "Review and provide feedback", "2025-11-30"),
+    ("action_submit", "Complete and submit required items", "2025-11-30"),
+    ("action_rsvp", "RSVP for event", "2025-11-27"),
+)
+
+
+class KeywordHits:
+    """Lazy set of the keyword groups hit by one email.
+
+    Membership tests (`"spam" in hits`) search the lowercased text on first
+    use and remember the answer, so a group asked about by several stages
+    sharing the hit set is searched for once, and groups a cascade never
+    reaches are never searched.
+    """
+
+    __slots__ = ("_rules", "_body", "_subject", "_overlap", "_groups")
+
+    def __init__(self, matcher: "KeywordMatcher", body: str, subject: str):
+        self._rules = matcher.rules
+        self._body = body
+        self._subject = subject
+        self._overlap = matcher.overlap
+        self._groups: Dict[Tuple[Tuple[str, ...], bool], bool] = {}
+
+    def __contains__(self, group: str) -> bool:
+        # Keyed by rule, so groups with identical keyword lists share a search
+        rule = self._rules[group]
+        hit = self._groups.get(rule)
+        if hit is None:
+            body = self._body
+            for kw in rule[0]:
+                if kw in body:
+                    hit = True
+                    break
+            else:
+                # Full-scope groups see body + subject; a match not inside the
+                # body ends in the subject, so the body's tail is enough
+                hit = False
+                if rule[1]:
+                    tail = body[max(0, len(body) - self._overlap):] + self._subject
+                    hit = any(kw in tail for kw in rule[0])
+            self._groups[rule] = hit
+        return hit
+
+    def all(self) -> FrozenSet[str]:
+        """Evaluate every group and return the ones that were hit."""
+        return frozenset(g for g in self._rules if g in self)
+
+
+class KeywordMatcher:
+    """Matches the mock LLM keyword groups against emails.
+
+    The keyword lists are compiled once into a rule table. Hit sets are not
+    memoised across calls, since a memo would keep the bodies of recent
+    emails alive; stages that look at the same email share one hit set by
+    passing it along (see `LLMClient._mock_fused`).
+    """
+
+    def __init__(self, groups: Dict[str, List[str]], full_scope=FULL_SCOPE_GROUPS):
+        self.groups = groups
+        self.rules: Dict[str, Tuple[Tuple[str, ...], bool]] = {
+            group: (tuple(keywords), group in full_scope)
+            for group, keywords in groups.items()
+        }
+        self.overlap = max((len(kw) for g in full_scope for kw in groups[g]),
+                           default=1) - 1
+
+    def match(self, body: str, subject: str = "") -> FrozenSet[str]:
+        """Return every group hit by already lowercased `body` and `subject`."""
+        return KeywordHits(self, body, subject).all()
+
+    def match_email(self, body: str, subject: str) -> KeywordHits:
+        """Lazy hit set for a raw (not lowercased) email."""
+        return KeywordHits(self, body.lower(), subject.lower())
+
+
+keyword_matcher = KeywordMatcher(KEYWORD_GROUPS)
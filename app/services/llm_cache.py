@@ -0,0 +1,122 @@
+"""LLM response cache"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def cache_key(provider: str, model: str, prompt: str, context: Dict[str, Any]) -> str:
+    """Hash of (provider, model, prompt, canonicalised context)."""
+    canonical = json.dumps(
+        [provider, model, prompt, context],
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-memory LRU of LLM responses with an optional SQLite store.
+
+    Entries remember the hash of the prompt that produced them, so all
+    responses for one prompt can be invalidated when it is edited. When
+    `path` is set, entries are also written to disk and looked up there on
+    a memory miss, so the cache survives restarts.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, prompt_hash TEXT NOT NULL, response TEXT NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_prompt ON responses (prompt_hash)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT prompt_hash, response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[1]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, prompt: str, response: str) -> None:
+        digest = prompt_hash(prompt)
+        with self._lock:
+            self._remember(key, digest, response)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, prompt_hash, response) "
+                    "VALUES (?, ?, ?)", (key, digest, response)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, digest: str, response: str) -> None:
+        self._entries[key] = (digest, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_prompt(self, prompt: str) -> int:
+        """Drop every cached response produced by `prompt`."""
+        digest = prompt_hash(prompt)
+        with self._lock:
+            stale = [k for k, (d, _) in self._entries.items() if d == digest]
+            for key in stale:
+                del self._entries[key]
+            removed = len(stale)
+            if self._db is not None:
+                cur = self._db.execute(
+                    "DELETE FROM responses WHERE prompt_hash = ?", (digest,)
+                )
+                self._db.commit()
+                removed = max(removed, cur.rowcount)
+            return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "persistent": self._db is not None,
+        }
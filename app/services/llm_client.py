@@ -1,7 +1,50 @@
 """LLM Client"""
+import asyncio
 import json
 import os
-from typing import Dict, Any
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Coroutine, List, Optional, Tuple
+from app.services.bulk_categorizer import bulk_categorizer
+from app.services.http_pool import HTTPConnectionPool
+from app.services.keyword_matcher import (
+    ACTION_RULES, CATEGORY_RULES, DEFAULT_CATEGORY, KeywordHits, keyword_matcher
+)
+from app.services.llm_cache import ResponseCache, cache_key
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# Fused prompts (categorization + action extraction in one call) start with
+# this header, which is how the mock recognises them.
+FUSED_PROMPT_HEADER = "Categorize the email and extract its tasks in a single response."
+
+# Providers answered in-process. "local" is the mock with bulk categorization
+# on the vectorised engine and no response cache (recomputing is cheaper).
+LOCAL_PROVIDERS = ("mock", "local")
+
+# The mock's categorization responses, serialised once, and its action
+# responses, serialised the first time each combination of actions is seen
+_CATEGORY_RESPONSES = {
+    (category, reason): json.dumps({"category": category, "reason": reason})
+    for category, reason in [(c, r) for _, c, r in CATEGORY_RULES] + [DEFAULT_CATEGORY]
+}
+_ACTION_RESPONSES: Dict[Tuple[Tuple[str, str], ...], str] = {}
+
+
+class LLMError(Exception):
+    """A provider call failed; `error_type` names the original exception."""
+
+    def __init__(self, message: str, error_type: str = "LLMError"):
+        super().__init__(message)
+        self.error_type = error_type
+
+    @classmethod
+    def from_response(cls, data: Any) -> Optional["LLMError"]:
+        """The error carried by a failed run_llm response, if any."""
+        if isinstance(data, dict) and data.get("status") == "failed" and "error" in data:
+            return cls(data["error"], data.get("error_type", "LLMError"))
+        return None
 
 
 class LLMClient:
@@ -10,177 +53,386 @@ class LLMClient:
         self.provider = os.getenv("LLM_PROVIDER", "mock")
         self.model = os.getenv("LLM_MODEL", "gpt-4")
         self.debug = os.getenv("DEBUG", "True") == "True"
+        self.cache_enabled = os.getenv("LLM_CACHE", "True") == "True"
+        self.cache = ResponseCache(
+            max_entries=int(os.getenv("LLM_CACHE_SIZE", "2048")),
+            path=("data/llm_cache.sqlite"
+                  if os.getenv("LLM_CACHE_PERSIST", "False") == "True" else None)
+        )
+        self.batch_size = int(os.getenv("LLM_BATCH_SIZE", "4096" if self.provider == "local" else "16"))
+        self.base_url = os.getenv("LLM_BASE_URL", DEFAULT_BASE_URL)
+        self.max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        self.timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+        self._pool: Optional[HTTPConnectionPool] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
 
     def run_llm(self, prompt: str, context: Dict[str, Any]) -> str:
+        key, cached = self._cache_lookup(prompt, context)
+        if cached is not None:
+            return cached
         try:
-            return self.mock_llm_call(prompt, context)
+            response = self._call_provider(prompt, context)
+        except Exception as e:
+            return self._error_response(e)
+        if key is not None:
+            self.cache.put(key, prompt, response)
+        return response
+
+    async def arun_llm(self, prompt: str, context: Dict[str, Any]) -> str:
+        """Async run_llm: real requests share the connection pool and are
+        bounded by LLM_MAX_CONCURRENCY, each with an LLM_TIMEOUT deadline."""
+        key, cached = self._cache_lookup(prompt, context)
+        if cached is not None:
+            return cached
+        try:
+            if self.provider in LOCAL_PROVIDERS:
+                response = self.mock_llm_call(prompt, context)
+            else:
+                response = await self._bounded(self.real_llm_call, prompt, context)
         except Exception as e:
-            if self.debug:
-                print(f"[LLM ERROR] {str(e)}")
-            return json.dumps({"error": str(e), "status": "failed"})
+            return self._error_response(e)
+        if key is not None:
+            self.cache.put(key, prompt, response)
+        return response
+
+    async def arun_llm_many(self, prompt: str, contexts: List[Dict[str, Any]]) -> List[str]:
+        return list(await asyncio.gather(*(self.arun_llm(prompt, c) for c in contexts)))
+
+    def run_llm_many(self, prompt: str, contexts: List[Dict[str, Any]]) -> List[str]:
+        """Sync wrapper around arun_llm_many for the Streamlit code."""
+        return self._run_sync(self.arun_llm_many(prompt, contexts))
+
+    def run_llm_batch(self, prompt: str, contexts: List[Dict[str, Any]],
+                      batch_size: Optional[int] = None) -> List[str]:
+        """Run one prompt over many contexts; responses keep the input order.
+
+        Cached contexts are answered from the cache, the rest are sent to the
+        provider `batch_size` at a time, so per-call overhead is paid once
+        per batch instead of once per context. Batches for a real provider
+        are sent concurrently.
+        """
+        size = max(1, batch_size or self.batch_size)
+        responses: List[Optional[str]] = [None] * len(contexts)
+        keys: List[Optional[str]] = [None] * len(contexts)
+        pending = []
+        for i, context in enumerate(contexts):
+            keys[i], responses[i] = self._cache_lookup(prompt, context)
+            if responses[i] is None:
+                pending.append(i)
+
+        chunks = [pending[start:start + size] for start in range(0, len(pending), size)]
+        outcomes = self._call_provider_batches(
+            prompt, [[contexts[i] for i in chunk] for chunk in chunks]
+        )
+        for chunk, outcome in zip(chunks, outcomes):
+            if isinstance(outcome, Exception):
+                error = self._error_response(outcome)
+                for i in chunk:
+                    responses[i] = error
+                continue
+            for i, response in zip(chunk, outcome):
+                responses[i] = response
+                if keys[i] is not None:
+                    self.cache.put(keys[i], prompt, response)
+        return responses
+
+    def _cache_lookup(self, prompt: str, context: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        if not self.cache_enabled or self.provider == "local":
+            return None, None
+        key = cache_key(self.provider, self.model, prompt, context)
+        return key, self.cache.get(key)
+
+    def _error_response(self, e: Exception) -> str:
+        message = str(e)
+        if isinstance(e, asyncio.TimeoutError) and not message:
+            message = f"LLM request timed out after {self.timeout}s"
+        if self.debug:
+            print(f"[LLM ERROR] {message}")
+        return json.dumps({"error": message, "error_type": type(e).__name__, "status": "failed"})
+
+    def _call_provider(self, prompt: str, context: Dict[str, Any]) -> str:
+        if self.provider in LOCAL_PROVIDERS:
+            return self.mock_llm_call(prompt, context)
+        return self.real_llm_call(prompt, context)
+
+    def _call_provider_batches(self, prompt: str, batches: List[List[Dict[str, Any]]]) -> List[Any]:
+        """One result list (or the exception raised) per batch, in order."""
+        if self.provider not in LOCAL_PROVIDERS:
+            return self._run_sync(self._agather_batches(prompt, batches))
+        outcomes: List[Any] = []
+        for batch in batches:
+            try:
+                outcomes.append(self.mock_llm_batch(prompt, batch))
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+
+    async def _agather_batches(self, prompt: str, batches: List[List[Dict[str, Any]]]) -> List[Any]:
+        return list(await asyncio.gather(
+            *(self._bounded(self.real_llm_batch_call, prompt, batch) for batch in batches),
+            return_exceptions=True
+        ))
+
+    async def _bounded(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking provider call on the I/O pool under the semaphore.
+
+        A timeout only stops the wait: the call keeps its thread until its
+        own socket timeout ends it, so its slot is released when the call
+        finishes rather than when the caller gives up on it.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore()
+        await semaphore.acquire()
+        try:
+            future = loop.run_in_executor(self._get_executor(), fn, *args)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def finished(done: asyncio.Future) -> None:
+            semaphore.release()
+            if not done.cancelled():
+                done.exception()  # retrieved, so an abandoned failure is not logged
+
+        future.add_done_callback(finished)
+        return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix="llm-io"
+                )
+            return self._executor
+
+    @property
+    def pool(self) -> HTTPConnectionPool:
+        with self._lock:
+            if self._pool is None:
+                self._pool = HTTPConnectionPool(self.base_url, self.max_concurrency, self.timeout)
+            return self._pool
+
+    @staticmethod
+    def _run_sync(coro: Coroutine[Any, Any, Any]) -> Any:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        # Already inside an event loop (e.g. a notebook): use a helper thread
+        with ThreadPoolExecutor(max_workers=1) as helper:
+            return helper.submit(asyncio.run, coro).result()
+
+    def invalidate_prompt(self, prompt: str) -> int:
+        """Forget cached responses for `prompt`, e.g. after it was edited."""
+        return self.cache.invalidate_prompt(prompt)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
 
     def mock_llm_call(self, prompt: str, context: Dict[str, Any]) -> str:
         """Mock LLM with smart categorization"""
+        return self._mock_handler(prompt)(context)
+
+    def mock_llm_batch(self, prompt: str, contexts: List[Dict[str, Any]]) -> List[str]:
+        """Vectorised mock: pick the branch once, then map it over every context"""
+        handler = self._mock_handler(prompt)
+        if self.provider == "local" and handler == self._mock_categorize:
+            return bulk_categorizer.category_responses(contexts)
+        return [handler(context) for context in contexts]
+
+    def _mock_handler(self, prompt: str) -> Callable[[Dict[str, Any]], str]:
+        if prompt.startswith(FUSED_PROMPT_HEADER):
+            return self._mock_fused
         prompt_lower = prompt.lower()
-        email_body = context.get("email_body", "").lower()
-        email_subject = context.get("email_subject", "").lower()
-
-        # CATEGORIZATION
         if "categorize" in prompt_lower:
-            if any(kw in email_body for kw in ["$", "budget", "payment", "cost", "funding"]):
-                if any(kw in email_body for kw in ["urgent", "asap", "immediately", "confirm"]):
-                    return json.dumps({
-                        "category": "To-Do",
-                        "reason": "Financial matter requiring immediate action"
-                    })
-
-            if any(kw in email_body for kw in ["meeting", "schedule", "calendar", "appointment", "call"]):
-                return json.dumps({
-                    "category": "To-Do",
-                    "reason": "Meeting request requiring response"
-                })
-
-            if any(kw in email_body for kw in ["urgent", "asap", "critical", "immediate", "deadline"]):
-                return json.dumps({
-                    "category": "Important",
-                    "reason": "Marked as urgent or time-sensitive"
-                })
-
-            if any(kw in email_body for kw in ["unsubscribe", "newsletter", "weekly", "digest"]):
-                return json.dumps({
-                    "category": "Newsletter",
-                    "reason": "Newsletter or promotional content"
-                })
-
-            if any(kw in email_body + email_subject for kw in [
-                "click here", "win", "prize", "lottery", "congratulations",
-                "verify account", "limited offer", "act now", "claim"
-            ]):
-                return json.dumps({
-                    "category": "Spam",
-                    "reason": "Contains spam indicators and urgency tactics"
-                })
+            return self._mock_categorize
+        elif "extract" in prompt_lower and "task" in prompt_lower:
+            return self._mock_extract_actions
+        elif "draft" in prompt_lower and "reply" in prompt_lower:
+            return self._mock_reply
+        elif "summarize" in prompt_lower:
+            return self._mock_summarize
+        return self._mock_general
+
+    @staticmethod
+    def _keyword_hits(context: Dict[str, Any]) -> KeywordHits:
+        return keyword_matcher.match_email(
+            context.get("email_body", ""), context.get("email_subject", "")
+        )
+
+    # CATEGORIZATION
+    def _mock_categorize(self, context: Dict[str, Any]) -> str:
+        return _CATEGORY_RESPONSES[self._category(self._keyword_hits(context))]
+
+    @staticmethod
+    def _category(hits: KeywordHits) -> Tuple[str, str]:
+        for groups, category, reason in CATEGORY_RULES:
+            if all(group in hits for group in groups):
+                return category, reason
+        return DEFAULT_CATEGORY
+
+    # CATEGORIZATION + ACTION EXTRACTION
+    def _mock_fused(self, context: Dict[str, Any]) -> str:
+        # Both stages share one hit set: one lowercase and one search per group
+        hits = self._keyword_hits(context)
+        # Same text as json.dumps of the merged dict: splice the actions in
+        return (_CATEGORY_RESPONSES[self._category(hits)][:-1]
+                + ', "actions": ' + self._actions_response(self._actions(hits)) + "}")
+
+    # ACTION EXTRACTION
+    def _mock_extract_actions(self, context: Dict[str, Any]) -> str:
+        return self._actions_response(self._actions(self._keyword_hits(context)))
+
+    @staticmethod
+    def _actions_response(actions: Tuple[Tuple[str, str], ...]) -> str:
+        response = _ACTION_RESPONSES.get(actions)
+        if response is None:
+            response = _ACTION_RESPONSES[actions] = json.dumps(
+                [{"task": task, "deadline": deadline} for task, deadline in actions]
+            )
+        return response
+
+    @staticmethod
+    def _actions(hits: KeywordHits) -> Tuple[Tuple[str, str], ...]:
+        return tuple((task, deadline) for group, task, deadline in ACTION_RULES if group in hits)
+
+    # AUTO-REPLY
+    def _mock_reply(self, context: Dict[str, Any]) -> str:
+        hits = self._keyword_hits(context)
+
+        tone = context.get("tone", "professional")
+
+        if "reply_meeting" in hits:
+            if tone == "friendly":
+                body = "Hi,\n\nThank you for the meeting invite! I'd be happy to join. Could you please share the agenda and meeting details?\n\nLooking forward to it!\n\nBest regards"
+            else:
+                body = "Dear Sir/Madam,\n\nThank you for your email. I confirm my availability for the meeting. Kindly share the agenda and necessary details.\n\nRegards"
 
             return json.dumps({
-                "category": "Important",
-                "reason": "Requires attention"
+                "subject": f"Re: {context.get('email_subject', 'Meeting')}",
+                "body": body,
+                "suggested_follow_ups": [
+                    "Request meeting agenda",
+                    "Confirm calendar availability",
+                    "Ask about other participants"
+                ]
             })
 
-        # ACTION EXTRACTION
-        elif "extract" in prompt_lower and "task" in prompt_lower:
-            actions = []
-
-            if "meeting" in email_body or "schedule" in email_body:
-                actions.append({
-                    "task": "Confirm meeting attendance and schedule",
-                    "deadline": "2025-11-28"
-                })
-
-            if "review" in email_body or "feedback" in email_body:
-                actions.append({
-                    "task": "Review and provide feedback",
-                    "deadline": "2025-11-30"
-                })
-
-            if any(kw in email_body for kw in ["submit", "send", "share", "upload"]):
-                actions.append({
-                    "task": "Complete and submit required items",
-                    "deadline": "2025-11-30"
-                })
-
-            if "rsvp" in email_body.lower():
-                actions.append({
-                    "task": "RSVP for event",
-                    "deadline": "2025-11-27"
-                })
-
-            return json.dumps(actions if actions else [])
-
-        # AUTO-REPLY
-        elif "draft" in prompt_lower and "reply" in prompt_lower:
-            tone = context.get("tone", "professional")
-
-            if "meeting" in email_body or "schedule" in email_body:
-                if tone == "friendly":
-                    body = "Hi,\n\nThank you for the meeting invite! I'd be happy to join. Could you please share the agenda and meeting details?\n\nLooking forward to it!\n\nBest regards"
-                else:
-                    body = "Dear Sir/Madam,\n\nThank you for your email. I confirm my availability for the meeting. Kindly share the agenda and necessary details.\n\nRegards"
-
-                return json.dumps({
-                    "subject": f"Re: {context.get('email_subject', 'Meeting')}",
-                    "body": body,
-                    "suggested_follow_ups": [
-                        "Request meeting agenda",
-                        "Confirm calendar availability",
-                        "Ask about other participants"
-                    ]
-                })
-
-            elif "partnership" in email_body or "collaboration" in email_body:
-                body = "Dear Sir/Madam,\n\nThank you for reaching out. We're interested in exploring this opportunity. Could we schedule a call next week to discuss further?\n\nPlease let me know your availability.\n\nBest regards"
-
-                return json.dumps({
-                    "subject": f"Re: {context.get('email_subject', 'Partnership')}",
-                    "body": body,
-                    "suggested_follow_ups": [
-                        "Schedule introductory call",
-                        "Share company information",
-                        "Discuss terms"
-                    ]
-                })
+        elif "reply_partnership" in hits:
+            body = "Dear Sir/Madam,\n\nThank you for reaching out. We're interested in exploring this opportunity. Could we schedule a call next week to discuss further?\n\nPlease let me know your availability.\n\nBest regards"
 
+            return json.dumps({
+                "subject": f"Re: {context.get('email_subject', 'Partnership')}",
+                "body": body,
+                "suggested_follow_ups": [
+                    "Schedule introductory call",
+                    "Share company information",
+                    "Discuss terms"
+                ]
+            })
+
+        else:
+            if tone == "friendly":
+                greeting = "Hi"
+                closing = "Best regards"
             else:
-                if tone == "friendly":
-                    greeting = "Hi"
-                    closing = "Best regards"
-                else:
-                    greeting = "Dear Sir/Madam"
-                    closing = "Regards"
-
-                body = f"{greeting},\n\nThank you for your email. I have received your message and will review it carefully. I'll get back to you shortly.\n\n{closing}"
-
-                return json.dumps({
-                    "subject": f"Re: {context.get('email_subject', 'Your Email')}",
-                    "body": body,
-                    "suggested_follow_ups": [
-                        "Provide requested information",
-                        "Schedule follow-up"
-                    ]
-                })
-
-        # SUMMARIZATION
-        elif "summarize" in prompt_lower:
-            summary_parts = []
+                greeting = "Dear Sir/Madam"
+                closing = "Regards"
 
-            if "$" in email_body or "budget" in email_body:
-                summary_parts.append("• Contains financial/budget information")
+            body = f"{greeting},\n\nThank you for your email. I have received your message and will review it carefully. I'll get back to you shortly.\n\n{closing}"
 
-            if "meeting" in email_body:
-                summary_parts.append("• Meeting or schedule request")
+            return json.dumps({
+                "subject": f"Re: {context.get('email_subject', 'Your Email')}",
+                "body": body,
+                "suggested_follow_ups": [
+                    "Provide requested information",
+                    "Schedule follow-up"
+                ]
+            })
+
+    # SUMMARIZATION
+    def _mock_summarize(self, context: Dict[str, Any]) -> str:
+        hits = self._keyword_hits(context)
+
+        summary_parts = []
 
-            if "deadline" in email_body or "urgent" in email_body:
-                summary_parts.append("• Time-sensitive matter")
+        if "summary_finance" in hits:
+            summary_parts.append("• Contains financial/budget information")
 
-            summary = "\n".join(summary_parts) if summary_parts else "• General communication"
+        if "summary_meeting" in hits:
+            summary_parts.append("• Meeting or schedule request")
 
-            return f"**Email Summary:**\n\n{summary}\n\n**Action Required:** Review and respond appropriately."
+        if "summary_deadline" in hits:
+            summary_parts.append("• Time-sensitive matter")
 
-        # GENERAL QUERY
-        elif "query" in context:
+        summary = "\n".join(summary_parts) if summary_parts else "• General communication"
+
+        return f"**Email Summary:**\n\n{summary}\n\n**Action Required:** Review and respond appropriately."
+
+    # GENERAL QUERY
+    def _mock_general(self, context: Dict[str, Any]) -> str:
+        if "query" in context:
             user_query = context.get("query", "").lower()
 
             if "urgent" in user_query:
                 return "Found 2 urgent emails in your inbox:\n1. Budget Meeting - $500K allocation\n2. Performance Review - Deadline Nov 30"
             elif "task" in user_query or "todo" in user_query:
                 return "**Your pending tasks:**\n\n1. Meeting confirmation (Due: Nov 28)\n2. Code review feedback (Due: Nov 27)\n3. Performance review (Due: Nov 30)\n4. Speaker presentation (Due: Dec 5)"
+            elif context.get("relevant_emails"):
+                lines = [f"{i}. {e['subject']} - {e['sender']}"
+                         for i, e in enumerate(context["relevant_emails"], 1)]
+                return "Most relevant emails for your question:\n" + "\n".join(lines)
             else:
                 return f"Processed your query. Please provide more details for better assistance."
 
         return json.dumps({"response": "Processing complete"})
 
     def real_llm_call(self, prompt: str, context: Dict[str, Any]) -> str:
-        """Real LLM (uncomment to use)"""
-        raise NotImplementedError("Configure .env for real LLM")
+        """Real LLM: OpenAI-compatible chat completion over the pooled connection"""
+        if not self.api_key and self.base_url == DEFAULT_BASE_URL:
+            raise NotImplementedError("Configure .env for real LLM")
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        data = self.pool.post_json("/chat/completions", {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": json.dumps(context, ensure_ascii=False, default=str)}
+            ],
+            "temperature": 0
+        }, headers, timeout=self.timeout)
+        return data["choices"][0]["message"]["content"]
+
+    def real_llm_batch_call(self, prompt: str, contexts: List[Dict[str, Any]]) -> List[str]:
+        """Pack several contexts into one real LLM request.
+
+        The model is asked for a JSON array with one result per item. If the
+        reply can't be unpacked, the items are sent one request at a time.
+        """
+        if len(contexts) == 1:
+            return [self.real_llm_call(prompt, contexts[0])]
+        packed_prompt = (
+            f"{prompt}\n\nThe input holds {len(contexts)} items in a JSON array "
+            f"under \"items\". Apply the instructions above to each item on its own "
+            f"and respond with a JSON array of exactly {len(contexts)} results, "
+            f"in the same order as the items."
+        )
+        response = self.real_llm_call(packed_prompt, {"items": contexts})
+        try:
+            results = json.loads(response)
+            if not isinstance(results, list) or len(results) != len(contexts):
+                raise ValueError("batch response does not match the number of items")
+        except ValueError:
+            return [self.real_llm_call(prompt, context) for context in contexts]
+        return [r if isinstance(r, str) else json.dumps(r) for r in results]
 
 
 llm_client = LLMClient()
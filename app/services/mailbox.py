@@ -0,0 +1,268 @@
+"""mbox / Maildir ingestion with lazily loaded bodies"""
+import mmap
+import os
+import re
+from email import message_from_bytes, policy
+from email.header import decode_header, make_header
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, ClassVar, Dict, Iterator, List, Optional, Tuple
+from pydantic import PrivateAttr
+from app.models import Email
+
+_HEADER_END = re.compile(rb"\r?\n\r?\n")
+_ESCAPED_FROM = re.compile(rb"(?m)^>(>*From )")
+_FOLD = re.compile(rb"\r?\n[ \t]+")
+_WANTED = (b"message-id", b"from", b"to", b"subject", b"date",
+           b"content-type", b"content-transfer-encoding")
+_CHARSET = re.compile(r'charset="?([\w.:-]+)', re.IGNORECASE)
+
+
+class MailboxEmail(Email):
+    """An Email whose body stays in the mailbox file until it is read.
+
+    Only the headers are kept in memory. `body` is decoded from the source
+    (a memory-mapped mbox or a Maildir file) on every access and not
+    retained, so resident memory does not grow with mailbox size.
+    """
+
+    lazy_body: ClassVar[bool] = True
+    _source: Any = PrivateAttr(default=None)
+    _key: Any = PrivateAttr(default=None)
+    # Set only on the copies made by `with_body`
+    _body: Optional[str] = PrivateAttr(default=None)
+
+    def __getattr__(self, name: str) -> Any:
+        # `body` is left out of __dict__, so attribute lookup falls through here
+        if name == "body":
+            return self._body if self._body is not None else self._source.body(self._key)
+        return super().__getattr__(name)
+
+    def body_stamp(self) -> str:
+        """Changes whenever the body may have, without reading it: the
+        message's offsets in an mbox, its file's size and mtime in a Maildir."""
+        return self._source.stamp(self._key)
+
+    def with_body(self) -> "MailboxEmail":
+        """A detached copy holding the body, read once, for code that reads it
+        several times."""
+        copy = MailboxEmail.model_construct(**{name: getattr(self, name) for name in Email.model_fields
+                                               if name != "body"})
+        copy._source, copy._key, copy._body = self._source, self._key, self.body
+        return copy
+
+    def model_dump(self, **kwargs: Any) -> Dict[str, Any]:
+        data = super().model_dump(**kwargs)
+        include, exclude = kwargs.get("include"), kwargs.get("exclude") or ()
+        if "body" not in data and "body" not in exclude and (include is None or "body" in include):
+            data["body"] = self.body
+        return data
+
+
+def _parse_headers(block: bytes) -> Dict[bytes, str]:
+    """The header fields Email needs, from a raw header block.
+
+    A hand-rolled scan: the stdlib parser builds a full Message per email,
+    which dominates indexing time on large mailboxes.
+    """
+    found: Dict[bytes, str] = {}
+    for line in _FOLD.sub(b" ", block).splitlines():
+        name, sep, value = line.partition(b":")
+        name = name.strip().lower()
+        if sep and name in _WANTED and name not in found:
+            found[name] = _header(value.strip().decode("utf-8", "replace"))
+    return found
+
+
+def _header(value: str) -> str:
+    if "=?" not in value:
+        return value
+    try:
+        return str(make_header(decode_header(value))).strip()
+    except Exception:
+        return value
+
+
+def _timestamp(value: Optional[str]) -> str:
+    try:
+        return parsedate_to_datetime(value).isoformat()
+    except Exception:
+        return value or ""
+
+
+def _body_text(raw: bytes) -> str:
+    """Plain-text body of a raw RFC 822 message (HTML if there is no text part)."""
+    match = _HEADER_END.search(raw)
+    if match:
+        headers = _parse_headers(raw[:match.end()])
+        content_type = headers.get(b"content-type", "text/plain").lower()
+        encoding = headers.get(b"content-transfer-encoding", "7bit").strip().lower()
+        if content_type.startswith("text/") and encoding in ("7bit", "8bit", "binary"):
+            # Single-part, unencoded: skip building a Message (the common case)
+            charset = _CHARSET.search(content_type)
+            try:
+                return raw[match.end():].decode(charset.group(1) if charset else "utf-8", "replace")
+            except LookupError:
+                return raw[match.end():].decode("utf-8", "replace")
+    try:
+        message = message_from_bytes(raw, policy=policy.default)
+        part = message.get_body(preferencelist=("plain", "html"))
+        return part.get_content() if part is not None else ""
+    except Exception:
+        match = _HEADER_END.search(raw)
+        return raw[match.end():].decode("utf-8", "replace") if match else ""
+
+
+def _make_email(source: Any, key: Any, headers: bytes, fallback_id: str) -> MailboxEmail:
+    parsed = _parse_headers(headers)
+    message_id = parsed.get(b"message-id", "").strip("<>")
+    email = MailboxEmail.model_construct(
+        id=message_id or fallback_id,
+        sender=parsed.get(b"from", ""),
+        recipient=parsed.get(b"to", ""),
+        subject=parsed.get(b"subject", ""),
+        timestamp=_timestamp(parsed.get(b"date")),
+    )
+    email._source = source
+    email._key = key
+    return email
+
+
+class MboxSource:
+    """A memory-mapped mbox file with a header index of byte offsets.
+
+    Opening scans the map for "From " separator lines and parses only each
+    message's header block; the index keeps (start, end) offsets per
+    message. Bodies are sliced out of the map and decoded on demand, so
+    the OS page cache, not the Python heap, holds the mailbox.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.offsets: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _messages(self) -> Iterator[Tuple[int, int]]:
+        data = self._map
+        start = 0 if data[:5] == b"From " else data.find(b"\nFrom ")
+        while start != -1 and start < len(data):
+            if data[start:start + 1] == b"\n":
+                start += 1
+            next_start = data.find(b"\nFrom ", start)
+            end = len(data) if next_start == -1 else next_start + 1
+            # Skip the "From " separator line itself
+            line_end = data.find(b"\n", start, end)
+            yield (end if line_end == -1 else line_end + 1), end
+            start = next_start
+
+    def iter_emails(self) -> Iterator[MailboxEmail]:
+        data = self._map
+        for start, end in self._messages():
+            match = _HEADER_END.search(data, start, end)
+            headers = data[start:match.end() if match else end]
+            key = len(self.offsets)
+            self.offsets.append((start, end))
+            yield _make_email(self, key, headers, f"{self.path.name}:{start}")
+
+    def body(self, key: int) -> str:
+        start, end = self.offsets[key]
+        raw = self._map[start:end]
+        if raw.endswith(b"\n\n"):
+            # The blank line before the next "From " belongs to the mbox format
+            raw = raw[:-1]
+        return _body_text(_ESCAPED_FROM.sub(rb"\1", raw))
+
+    def stamp(self, key: int) -> str:
+        start, end = self.offsets[key]
+        return f"{start}-{end}"
+
+    def close(self) -> None:
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+
+class MaildirSource:
+    """A Maildir directory (cur/ and new/); one file per message.
+
+    Only each file's header block is read while indexing; bodies are read
+    from the file when accessed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.files: List[Path] = []
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def iter_emails(self) -> Iterator[MailboxEmail]:
+        for folder in ("cur", "new"):
+            directory = self.path / folder
+            if not directory.is_dir():
+                continue
+            for file in sorted(directory.iterdir()):
+                if not file.is_file() or file.name.startswith("."):
+                    continue
+                headers = self._read_headers(file)
+                key = len(self.files)
+                self.files.append(file)
+                # Maildir flags after ":" change when a message is read
+                yield _make_email(self, key, headers, file.name.split(":", 1)[0])
+
+    @staticmethod
+    def _read_headers(file: Path, block_size: int = 8192) -> bytes:
+        data = b""
+        with open(file, "rb") as f:
+            while True:
+                block = f.read(block_size)
+                data += block
+                match = _HEADER_END.search(data)
+                if match or not block:
+                    return data[:match.end()] if match else data
+
+    def body(self, key: int) -> str:
+        return _body_text(self.files[key].read_bytes())
+
+    def stamp(self, key: int) -> str:
+        try:
+            stat = self.files[key].stat()
+        except OSError:
+            return ""
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def close(self) -> None:
+        pass
+
+
+def is_mailbox(path: Path) -> bool:
+    """Whether `path` is a Maildir directory or an mbox file."""
+    path = Path(path)
+    if path.is_dir():
+        return (path / "cur").is_dir() or (path / "new").is_dir()
+    if path.suffix.lower() == ".mbox":
+        return True
+    with open(path, "rb") as f:
+        return f.read(5) == b"From "
+
+
+def open_mailbox(path: Path):
+    path = Path(path)
+    return MaildirSource(path) if path.is_dir() else MboxSource(path)
+
+
+def iter_mailbox_chunks(path: Path, chunk_size: int = 500) -> Iterator[List[Email]]:
+    """Lazy-body Emails of an mbox file or Maildir, in lists of up to `chunk_size`."""
+    chunk: List[Email] = []
+    for email in open_mailbox(path).iter_emails():
+        chunk.append(email)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
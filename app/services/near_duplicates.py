@@ -0,0 +1,192 @@
+"""Near-duplicate detection"""
+import re
+from itertools import chain
+import threading
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Sequence, Set, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+SIGNATURE_BITS = 64
+# Texts with fewer words have too few bigrams for a meaningful signature
+# (every empty text would hash to 0) and are never matched
+MIN_WORDS = 8
+
+_WORD = re.compile(r"\w+")
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finaliser: spreads every input bit over the whole word."""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the word bigrams of `text`."""
+    return simhash_many([text])[0]
+
+
+def simhash_many(texts: Sequence[str]) -> List[int]:
+    """SimHash of each text, computed for all of them in one pass.
+
+    Texts that share most of their word bigrams get signatures that differ
+    in only a few bits, so the Hamming distance approximates similarity.
+    Words are hashed with Python's `hash`, so signatures are only
+    comparable within one process.
+    """
+    return _simhash_words([_WORD.findall(text.lower()) for text in texts])
+
+
+def _simhash_words(word_lists: List[List[str]]) -> List[int]:
+    counts = np.fromiter(map(len, word_lists), dtype=np.int64, count=len(word_lists))
+    if not counts.sum():
+        return [0] * len(word_lists)
+    words = np.fromiter(map(hash, chain.from_iterable(word_lists)), dtype=np.int64,
+                        count=int(counts.sum())).view(np.uint64)
+    owners = np.repeat(np.arange(len(word_lists)), counts)
+
+    # Features are word bigrams within a text, or the word of a one-word text
+    same = owners[:-1] == owners[1:]
+    bigrams = _mix(words[:-1] * np.uint64(0x9E3779B97F4A7C15) + words[1:])[same]
+    single = counts[owners] == 1
+    features = np.concatenate([bigrams, _mix(words[single])])
+    feature_owners = np.concatenate([owners[:-1][same], owners[single]])
+    order = np.argsort(feature_owners, kind="stable")
+    features, feature_owners = features[order], feature_owners[order]
+
+    bits = np.unpackbits(features.view(np.uint8)).reshape(-1, SIGNATURE_BITS)
+    present, starts, sizes = np.unique(feature_owners, return_index=True, return_counts=True)
+    if sizes.max() < 1 << 16:
+        # Sum four 16-bit bit counters per uint64 add instead of one per add
+        lanes = bits.astype(np.uint16).view(np.uint64)
+        totals = np.add.reduceat(lanes, starts, axis=0).view(np.uint16)
+    else:
+        totals = np.add.reduceat(bits, starts, axis=0, dtype=np.int64)
+    votes = totals.astype(np.int64) * 2 > sizes[:, None]
+    signatures = [0] * len(word_lists)
+    packed = np.packbits(votes, axis=1)
+    for owner, row in zip(present.tolist(), packed):
+        signatures[owner] = int.from_bytes(row.tobytes(), "big")
+    return signatures
+
+
+def max_distance(similarity: float) -> int:
+    """Largest Hamming distance still counted as `similarity` or closer."""
+    return max(0, min(SIGNATURE_BITS - 1, int((1.0 - similarity) * SIGNATURE_BITS)))
+
+
+class SimHashIndex(Generic[T]):
+    """SimHash signatures of texts, searchable by Hamming distance.
+
+    Signatures are split into `max_distance + 1` bands. Two signatures at
+    most `max_distance` bits apart agree exactly on at least one band, so
+    lookups only compare against entries sharing a band value instead of
+    the whole index. Inserts are incremental; re-inserting a key replaces
+    its entry. Each entry carries a payload (e.g. the Email it came from).
+    Texts shorter than MIN_WORDS words are kept but never matched.
+    """
+
+    def __init__(self, similarity: float = 0.95):
+        self.similarity = similarity
+        self.max_distance = max_distance(similarity)
+        bands = self.max_distance + 1
+        width, extra = divmod(SIGNATURE_BITS, bands)
+        self._bands: List[Tuple[int, int]] = []
+        shift = 0
+        for band in range(bands):
+            size = width + (band < extra)
+            self._bands.append((shift, (1 << size) - 1))
+            shift += size
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in self._bands]
+        # Entries keep hash(text), not the text, so bodies are not retained
+        self._entries: Dict[str, Tuple[int, Optional[int], T]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def insert(self, key: str, text: str, payload: T) -> None:
+        """Index `text` under `key`; a no-op if it is already indexed."""
+        self.insert_many([(key, text, payload)])
+
+    def insert_many(self, items: Iterable[Tuple[str, str, T]]) -> None:
+        """Index many (key, text, payload) items, hashing the new texts together."""
+        new = []
+        for key, text, payload in items:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == hash(text):
+                if entry[2] is not payload:
+                    self._entries[key] = (entry[0], entry[1], payload)
+            else:
+                new.append((key, text, payload))
+        if not new:
+            return
+        word_lists = [_WORD.findall(text.lower()) for _, text, _ in new]
+        signatures = _simhash_words(word_lists)
+        with self._lock:
+            for (key, text, payload), words, signature in zip(new, word_lists, signatures):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._unlink(key, entry[1])
+                if len(words) < MIN_WORDS:
+                    # No signature, so no bucket: it neither matches nor is matched
+                    self._entries[key] = (hash(text), None, payload)
+                    continue
+                self._entries[key] = (hash(text), signature, payload)
+                for (shift, mask), buckets in zip(self._bands, self._buckets):
+                    buckets.setdefault((signature >> shift) & mask, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._unlink(key, entry[1])
+
+    def _unlink(self, key: str, signature: Optional[int]) -> None:
+        if signature is None:
+            return
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            band = (signature >> shift) & mask
+            bucket = buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del buckets[band]
+
+    def find(self, key: str, accept: Optional[Callable[[str, T], bool]] = None
+             ) -> Optional[Tuple[str, T]]:
+        """An entry within the threshold of `key`'s text, or None.
+
+        Returns the first (key, payload) found for which `accept` holds,
+        without ranking by distance. Only entries sharing a band with `key`
+        are compared, but a large bucket is scanned until a candidate
+        qualifies; in a blast of near-identical emails that is usually the
+        first one.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[1] is None:
+            return None
+        signature = entry[1]
+        seen = {key}
+        with self._lock:
+            for (shift, mask), buckets in zip(self._bands, self._buckets):
+                for other in buckets.get((signature >> shift) & mask, ()):
+                    if other in seen:
+                        continue
+                    seen.add(other)
+                    _, other_signature, payload = self._entries[other]
+                    if (bin(signature ^ other_signature).count("1") <= self.max_distance
+                            and (accept is None or accept(other, payload))):
+                        return other, payload
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            for buckets in self._buckets:
+                buckets.clear()
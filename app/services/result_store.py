@@ -0,0 +1,111 @@
+"""Processing results store"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+from app.models import Email
+
+
+class ResultStore:
+    """Categories and action items of processed emails, in SQLite (WAL).
+
+    One row per email id holds the content fingerprint the results were
+    computed for, the prompt version that produced them and the results
+    themselves. `restore` copies results back onto freshly loaded emails
+    whose content still matches, so a processed inbox survives restarts
+    without another LLM call. Rows of a prompt version can be dropped with
+    `invalidate`.
+
+    With `source_of`, rows also keep a fingerprint that can be checked
+    without reading the body (e.g. a mailbox email's place in its file);
+    emails it is non-empty for are matched on it instead of their content.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "email_id TEXT PRIMARY KEY, content TEXT NOT NULL, version TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_version ON results (version)")
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(results)")}
+        if "source" not in columns:
+            self._db.execute("ALTER TABLE results ADD COLUMN source TEXT NOT NULL DEFAULT ''")
+        self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def save_many(self, items: Iterable[Tuple[Email, str]], version: str,
+                  source_of: Optional[Callable[[Email], str]] = None) -> None:
+        """Store the results of (email, content fingerprint) pairs in one transaction."""
+        rows = [
+            (email.id, content, source_of(email) if source_of else "", version, json.dumps({
+                "category": email.category,
+                "actions": email.actions,
+                "fingerprints": email.fingerprints,
+                "duplicate_of": email.duplicate_of,
+            }))
+            for email, content in items
+        ]
+        if not rows:
+            return
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO results (email_id, content, source, version, data) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def restore(self, emails: List[Email], content_of: Callable[[Email], str],
+                source_of: Optional[Callable[[Email], str]] = None) -> int:
+        """Copy stored results onto `emails` whose content is unchanged.
+
+        Returns how many emails were restored. Emails already holding
+        results, or whose content differs from the stored row, are left
+        as they are. An email whose `source_of` is non-empty is matched on
+        it alone when the row has one, so its content is never computed.
+        """
+        todo = {email.id: email for email in emails if email.category is None}
+        if not todo:
+            return 0
+        found = []
+        ids = list(todo)
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                found.extend(self._db.execute(
+                    f"SELECT email_id, content, source, data FROM results "
+                    f"WHERE email_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall())
+        restored = 0
+        for email_id, content, source, data in found:
+            email = todo[email_id]
+            current = source_of(email) if source_of else ""
+            if current and source:
+                if current != source:
+                    continue
+            elif content_of(email) != content:
+                continue
+            result = json.loads(data)
+            email.category = result["category"]
+            email.actions = result["actions"]
+            email.fingerprints = result["fingerprints"]
+            email.duplicate_of = result["duplicate_of"]
+            email.processing_error = None
+            restored += 1
+        return restored
+
+    def invalidate(self, version: Optional[str] = None) -> int:
+        """Drop the results of one prompt version, or all of them; returns the row count."""
+        with self._lock, self._db:
+            if version is None:
+                return self._db.execute("DELETE FROM results").rowcount
+            return self._db.execute("DELETE FROM results WHERE version = ?", (version,)).rowcount
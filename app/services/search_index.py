@@ -0,0 +1,248 @@
+"""Full-text search over the inbox"""
+import hashlib
+import math
+import os
+import re
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.models import Email
+
+_WORD = re.compile(r"\w+")
+# Subject words count this many times: a subject match says more than a body one
+SUBJECT_BOOST = 2
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def _terms(email: Email) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for term in tokenize(email.subject) * SUBJECT_BOOST + tokenize(email.sender) + tokenize(email.body):
+        counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+def _key(email: Email) -> int:
+    """Stable fingerprint of the indexed fields (Python's hash is salted per process).
+
+    A lazily loaded body is not read: its place in the mailbox stands in
+    for it, so checking an unchanged mailbox email costs no I/O.
+    """
+    body = email.body_stamp() if getattr(email, "lazy_body", False) else email.body
+    digest = hashlib.blake2b(digest_size=8)
+    for part in (email.subject, email.sender, body):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return int.from_bytes(digest.digest(), "little") >> 1
+
+
+class SearchIndex:
+    """Inverted index over subject, sender and body, ranked with BM25.
+
+    Each term maps to a posting list of (document, term frequency) kept
+    in two compact arrays. Inserting an email whose indexed fields are
+    unchanged is a no-op; a changed or removed email leaves a tombstone
+    that is dropped when tombstones outnumber a quarter of the index.
+    Queries score only the postings of the query terms, vectorised with
+    NumPy, so they stay in milliseconds on large inboxes. `save` and
+    `load` keep the index across restarts.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._docs: List[Optional[str]] = []
+        self._lengths = array("I")
+        self._keys: Dict[str, Tuple[int, int]] = {}
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, email_id: str) -> bool:
+        return email_id in self._keys
+
+    def current(self, email: Email) -> bool:
+        """Whether `email` is indexed as it is now."""
+        known = self._keys.get(email.id)
+        return known is not None and known[1] == _key(email)
+
+    def insert(self, email: Email) -> bool:
+        """Index `email`; returns False if it was already indexed as is."""
+        key = _key(email)
+        known = self._keys.get(email.id)
+        if known is not None and known[1] == key:
+            return False
+        terms = _terms(email)
+        with self._lock:
+            if known is not None:
+                self._unlink(known[0])
+            doc = len(self._docs)
+            self._docs.append(email.id)
+            length = sum(terms.values())
+            self._lengths.append(length)
+            self._total_length += length
+            self._keys[email.id] = (doc, key)
+            for term, count in terms.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = (array("I"), array("H"))
+                posting[0].append(doc)
+                posting[1].append(min(count, 0xFFFF))
+            self._maybe_compact()
+        return True
+
+    def insert_many(self, emails: Iterable[Email]) -> int:
+        return sum(self.insert(email) for email in emails)
+
+    def remove(self, email_id: str) -> None:
+        with self._lock:
+            known = self._keys.pop(email_id, None)
+            if known is not None:
+                self._unlink(known[0])
+                self._maybe_compact()
+
+    def sync(self, emails: Iterable[Email]) -> int:
+        """Make the index match `emails`: add new or changed ones, drop the rest.
+
+        Returns how many emails were (re)indexed or removed.
+        """
+        seen: Set[str] = set()
+        changed = 0
+        for email in emails:
+            seen.add(email.id)
+            changed += self.insert(email)
+        return changed + self.retain(seen)
+
+    def retain(self, email_ids: Set[str]) -> int:
+        """Remove every email not in `email_ids`; returns how many were removed."""
+        gone = [i for i in self._keys if i not in email_ids]
+        for email_id in gone:
+            self.remove(email_id)
+        return len(gone)
+
+    def _unlink(self, doc: int) -> None:
+        self._docs[doc] = None
+        self._total_length -= self._lengths[doc]
+        self._dead += 1
+
+    def _maybe_compact(self) -> None:
+        if self._dead > 1000 and self._dead * 4 > len(self._docs):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Renumber live documents and drop tombstoned postings."""
+        alive = np.array([doc is not None for doc in self._docs], dtype=bool)
+        renumber = np.cumsum(alive, dtype=np.int64) - 1
+        postings = {}
+        for term, (docs, counts) in self._postings.items():
+            docs_np = np.frombuffer(docs, dtype=np.uint32)
+            keep = alive[docs_np]
+            if keep.any():
+                postings[term] = (array("I", renumber[docs_np[keep]].astype(np.uint32).tobytes()),
+                                  array("H", np.frombuffer(counts, dtype=np.uint16)[keep].tobytes()))
+        self._postings = postings
+        self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes())
+        self._docs = [doc for doc in self._docs if doc is not None]
+        self._keys = {email_id: (doc, self._keys[email_id][1]) for doc, email_id in enumerate(self._docs)}
+        self._dead = 0
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """The `k` best (email id, BM25 score) pairs for `query`, best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            live = len(self._keys)
+            if not live or not terms:
+                return []
+            average = self._total_length / live
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * lengths / average)
+            scores = np.zeros(len(self._docs), dtype=np.float32)
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting is None:
+                    continue
+                docs = np.frombuffer(posting[0], dtype=np.uint32)
+                tf = np.frombuffer(posting[1], dtype=np.uint16).astype(np.float32)
+                # Tombstones make df an overestimate until the next compaction
+                df = len(docs)
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+            found = np.flatnonzero(scores)
+            if not len(found):
+                return []
+            # Over-fetch: some of the best may be tombstones
+            need = min(len(found), k + self._dead)
+            top = found[np.argpartition(-scores[found], need - 1)[:need]] if need < len(found) else found
+            results = [(self._docs[doc], float(scores[doc])) for doc in top if self._docs[doc] is not None]
+        results.sort(key=lambda item: -item[1])
+        return results[:k]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def save(self, path: Path) -> None:
+        """Write the index to `path` (NumPy .npz), atomically."""
+        path = Path(path)
+        with self._lock:
+            terms = list(self._postings)
+            sizes = np.fromiter((len(self._postings[t][0]) for t in terms), dtype=np.int64, count=len(terms))
+            docs = b"".join(self._postings[t][0].tobytes() for t in terms)
+            counts = b"".join(self._postings[t][1].tobytes() for t in terms)
+            ids = [doc if doc is not None else "" for doc in self._docs]
+            keys = np.array([self._keys[d][1] if d else 0 for d in self._docs], dtype=np.int64)
+            data = dict(
+                params=np.array([self.k1, self.b]),
+                terms=np.frombuffer("\0".join(terms).encode("utf-8"), dtype=np.uint8),
+                sizes=sizes,
+                docs=np.frombuffer(docs, dtype=np.uint32),
+                counts=np.frombuffer(counts, dtype=np.uint16),
+                ids=np.frombuffer("\0".join(ids).encode("utf-8"), dtype=np.uint8),
+                alive=np.array([d is not None for d in self._docs], dtype=bool),
+                lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+                keys=keys,
+            )
+        temp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        try:
+            np.savez(temp, **data)
+            os.replace(temp, path)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+
+    def load(self, path: Path) -> None:
+        """Replace the index with one written by `save`."""
+        with np.load(Path(path)) as data:
+            k1, b = data["params"].tolist()
+            terms = bytes(data["terms"]).decode("utf-8").split("\0") if len(data["terms"]) else []
+            ids = bytes(data["ids"]).decode("utf-8").split("\0") if len(data["ids"]) else []
+            alive, keys = data["alive"].tolist(), data["keys"].tolist()
+            docs, counts = data["docs"], data["counts"]
+            postings = {}
+            start = 0
+            for term, end in zip(terms, np.cumsum(data["sizes"]).tolist()):
+                postings[term] = (array("I", docs[start:end].tobytes()), array("H", counts[start:end].tobytes()))
+                start = end
+            lengths = array("I", data["lengths"].tobytes())
+        with self._lock:
+            self.k1, self.b = k1, b
+            self._postings = postings
+            self._lengths = lengths
+            self._docs = [email_id if live else None for email_id, live in zip(ids, alive)]
+            self._keys = {email_id: (doc, keys[doc]) for doc, email_id in enumerate(self._docs)
+                          if email_id is not None}
+            self._dead = len(self._docs) - len(self._keys)
+            self._total_length = sum(length for length, live in zip(lengths, alive) if live)
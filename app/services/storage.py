@@ -1,8 +1,17 @@
 """Storage service"""
+import hashlib
 import json
+import os
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from app.models import PromptConfig, Draft, Email
+from app.services.draft_store import DURABILITY_MODES, JSONDraftStore, SQLiteDraftStore, WriteBehindDraftStore
+from app.services.compact_inbox import CompactInbox
+from app.services.inbox_archive import ARCHIVE_SUFFIX, InboxArchive, is_archive, write_archive
+from app.services.inbox_partitions import GRANULARITIES, PartitionedInbox, in_range
+from app.services.inbox_reader import chunked, iter_records
+from app.services.mailbox import is_mailbox, iter_mailbox_chunks
+from app.services.result_store import ResultStore
 
 
 class StorageService:
@@ -10,24 +19,79 @@ class StorageService:
         self.data_dir = Path(data_dir)
         self.prompts_file = self.data_dir / "default_prompts.json"
         self.drafts_file = self.data_dir / "drafts.json"
-        self.inbox_file = self.data_dir / "mock_inbox.json"
+        self.drafts_db = self.data_dir / "drafts.sqlite"
+        self.results_db = self.data_dir / "results.sqlite"
+        self.search_index_file = self.data_dir / "search_index.npz"
+        self.embeddings_file = self.data_dir / "embeddings.npz"
+        self.inbox_file = Path(os.getenv("INBOX_PATH", self.data_dir / "mock_inbox.json"))
+        # month or day, for inboxes laid out as date partitions
+        self.partition_by = os.getenv("INBOX_PARTITION_BY", "month")
+        self.drafts_backend = os.getenv("DRAFTS_BACKEND", "sqlite")
+        self.drafts_durability = os.getenv("DRAFTS_DURABILITY", "balanced")
+        self._draft_store = None
+        self._result_store = None
+        # name -> (file signature, parsed value); see _cached
+        self._cache: Dict[str, Tuple[Any, Any]] = {}
         self.data_dir.mkdir(exist_ok=True)
 
+    @staticmethod
+    def _signature(paths: List[Path]) -> Tuple:
+        """(mtime, size, inode) of each path, None for a missing one."""
+        signature = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _cached(self, name: str, paths: List[Path], load: Callable[[], Any]) -> Any:
+        """The parsed contents of `paths`, re-read only when one of them changed.
+
+        The signature is taken before loading, so a write racing the load
+        is picked up on the next call.
+        """
+        signature = self._signature(paths)
+        hit = self._cache.get(name)
+        if hit is not None and hit[0] == signature:
+            return hit[1]
+        value = load()
+        self._cache[name] = (signature, value)
+        return value
+
+    def _fresh(self, name: str, paths: List[Path]) -> Any:
+        """The cached value if the files are unchanged since it was read, else None."""
+        hit = self._cache.get(name)
+        if hit is not None and hit[0] == self._signature(paths):
+            return hit[1]
+        self._cache.pop(name, None)
+        return None
+
+    def _restamp(self, name: str, paths: List[Path], value: Any) -> None:
+        """Record `value` as the contents of `paths` after our own write."""
+        self._cache[name] = (self._signature(paths), value)
+
     def load_prompts(self) -> PromptConfig:
         try:
-            if self.prompts_file.exists():
-                with open(self.prompts_file, 'r', encoding='utf-8') as f:
-                    return PromptConfig(**json.load(f))
-            return self.get_default_prompts()
+            return self._cached("prompts", [self.prompts_file], self._read_prompts).model_copy()
         except:
             return self.get_default_prompts()
 
+    def _read_prompts(self) -> PromptConfig:
+        if self.prompts_file.exists():
+            with open(self.prompts_file, 'r', encoding='utf-8') as f:
+                return PromptConfig(**json.load(f))
+        return self.get_default_prompts()
+
     def save_prompts(self, prompts: PromptConfig) -> bool:
         try:
             with open(self.prompts_file, 'w', encoding='utf-8') as f:
                 json.dump(prompts.model_dump(), f, indent=2)
+            self._restamp("prompts", [self.prompts_file], prompts.model_copy())
             return True
         except:
+            self._cache.pop("prompts", None)
             return False
 
     def get_default_prompts(self) -> PromptConfig:
@@ -37,40 +101,262 @@ class StorageService:
             auto_reply_prompt="If an email is a meeting request, draft a polite reply asking for an agenda. Otherwise, write a brief, polite reply that acknowledges the email and suggests next steps. Reply in JSON: { \"subject\": \"...\", \"body\": \"...\", \"suggested_follow_ups\": [\"...\"] }."
         )
 
+    @property
+    def draft_store(self):
+        """The drafts backend: SQLite (default) or the JSON file (DRAFTS_BACKEND=json),
+        behind a write-behind queue unless DRAFTS_DURABILITY=strict."""
+        if self._draft_store is None:
+            durability = self.drafts_durability if self.drafts_durability in DURABILITY_MODES else "balanced"
+            fsync = durability != "fast"
+            if self.drafts_backend == "json":
+                store = JSONDraftStore(self.drafts_file, fsync=fsync)
+            else:
+                store = SQLiteDraftStore(self.drafts_db, legacy_json=self.drafts_file, fsync=fsync)
+            if durability != "strict":
+                store = WriteBehindDraftStore(store)
+                store.on_flush = self._drafts_flushed
+            self._draft_store = store
+        return self._draft_store
+
+    def _drafts_flushed(self, changes: Dict[str, Optional[Draft]]) -> None:
+        """A queued draft write reached the files. The cached drafts already
+        hold its changes, so only their signature is brought up to date."""
+        hit = self._cache.get("drafts")
+        if hit is not None:
+            self._restamp("drafts", self._draft_paths, hit[1])
+
+    @property
+    def draft_error(self) -> Optional[Exception]:
+        """The last failed background draft write, if it has not succeeded since."""
+        return getattr(self._draft_store, "last_error", None)
+
+    def flush_drafts(self) -> bool:
+        """Write queued draft changes now; False if that failed."""
+        try:
+            flush = getattr(self.draft_store, "flush", None)
+            if flush is not None:
+                flush()
+            return True
+        except:
+            return False
+
+    @property
+    def result_store(self) -> ResultStore:
+        """Processing results kept across restarts."""
+        if self._result_store is None:
+            self._result_store = ResultStore(self.results_db)
+        return self._result_store
+
+    @property
+    def _draft_paths(self) -> List[Path]:
+        if self.drafts_backend == "json":
+            return [self.drafts_file]
+        # Commits land in the WAL; the main file changes only on checkpoints
+        return [self.drafts_db, self.drafts_db.with_name(self.drafts_db.name + "-wal")]
+
+    def _drafts(self) -> Dict[str, Draft]:
+        """All drafts by id, in save order; cached until the store changes on disk."""
+        store = self.draft_store
+        return self._cached("drafts", self._draft_paths,
+                            lambda: {draft.id: draft for draft in store.load_all()})
+
     def load_drafts(self) -> List[Draft]:
         try:
-            if self.drafts_file.exists():
-                with open(self.drafts_file, 'r', encoding='utf-8') as f:
-                    return [Draft(**d) for d in json.load(f)]
+            return list(self._drafts().values())
+        except:
             return []
+
+    def get_draft(self, draft_id: str) -> Optional[Draft]:
+        try:
+            return self._drafts().get(draft_id)
+        except:
+            return None
+
+    def drafts_for_email(self, email_id: str) -> List[Draft]:
+        try:
+            return [draft for draft in self._drafts().values() if draft.email_id == email_id]
         except:
             return []
 
     def save_draft(self, draft: Draft) -> bool:
         try:
-            drafts = self.load_drafts()
-            drafts = [d for d in drafts if d.id != draft.id] + [draft]
-            with open(self.drafts_file, 'w', encoding='utf-8') as f:
-                json.dump([d.model_dump() for d in drafts], f, indent=2)
+            cached = self._fresh("drafts", self._draft_paths)
+            self.draft_store.save(draft)
+            if cached is not None:
+                # Re-saving moves a draft to the end, as in the stores
+                cached.pop(draft.id, None)
+                cached[draft.id] = draft
+                self._restamp("drafts", self._draft_paths, cached)
             return True
         except:
+            self._cache.pop("drafts", None)
+            return False
+
+    def save_drafts(self, drafts: List[Draft]) -> bool:
+        """Save many drafts with one write to the store."""
+        try:
+            cached = self._fresh("drafts", self._draft_paths)
+            self.draft_store.apply({draft.id: draft for draft in drafts})
+            if cached is not None:
+                for draft in drafts:
+                    cached.pop(draft.id, None)
+                    cached[draft.id] = draft
+                self._restamp("drafts", self._draft_paths, cached)
+            return True
+        except:
+            self._cache.pop("drafts", None)
             return False
 
     def delete_draft(self, draft_id: str) -> bool:
         try:
-            drafts = [d for d in self.load_drafts() if d.id != draft_id]
-            with open(self.drafts_file, 'w', encoding='utf-8') as f:
-                json.dump([d.model_dump() for d in drafts], f, indent=2)
+            cached = self._fresh("drafts", self._draft_paths)
+            self.draft_store.delete(draft_id)
+            if cached is not None:
+                cached.pop(draft_id, None)
+                self._restamp("drafts", self._draft_paths, cached)
             return True
         except:
+            self._cache.pop("drafts", None)
             return False
 
-    def load_inbox(self) -> List[Email]:
+    def _partitions(self) -> Optional[PartitionedInbox]:
+        """The partitioned inbox, if INBOX_PATH is a directory that is not a Maildir."""
+        if not self.inbox_file.is_dir() or is_mailbox(self.inbox_file):
+            return None
+        granularity = self.partition_by if self.partition_by in GRANULARITIES else "month"
+        return PartitionedInbox(self.inbox_file, granularity)
+
+    def _iter_records(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Inbox records with timestamps in [start, end], reading as little as the format allows.
+
+        Partitioned inboxes open only the overlapping partitions and
+        archives only the overlapping blocks; single files are scanned.
+        """
+        partitions = self._partitions()
+        if partitions is not None:
+            return partitions.iter_records(start, end)
+        if start is None and end is None:
+            return iter_records(self.inbox_file)
+        archive = self._archive()
+        if archive is not None:
+            return archive.between(start, end)
+        return (r for r in iter_records(self.inbox_file) if in_range(r.get("timestamp") or "", start, end))
+
+    def _iter_mailbox(self, chunk_size: int, start: Optional[str], end: Optional[str]) -> Iterator[List[Email]]:
+        for chunk in iter_mailbox_chunks(self.inbox_file, chunk_size):
+            if start is not None or end is not None:
+                chunk = [email for email in chunk if in_range(email.timestamp, start, end)]
+            if chunk:
+                yield chunk
+
+    def iter_inbox(self, chunk_size: int = 500, start: Optional[str] = None,
+                   end: Optional[str] = None) -> Iterator[List[Email]]:
+        """Stream the inbox (JSON array, JSON Lines, archive, date partitions, mbox or
+        Maildir) in chunks of Emails, optionally only those with ISO timestamps in
+        [start, end].
+
+        mbox and Maildir inboxes are indexed by their headers only; bodies
+        are read from disk when accessed.
+        """
+        if not self.inbox_file.exists():
+            return iter(())
+        if is_mailbox(self.inbox_file):
+            return self._iter_mailbox(chunk_size, start, end)
+        return ([Email(**record) for record in records]
+                for records in chunked(self._iter_records(start, end), chunk_size))
+
+    def index_files(self, scope: str = "") -> Tuple[Path, Path]:
+        """Where the search and embedding indexes of the inbox loaded for
+        `scope` (e.g. a date range) are saved. Each inbox file and scope has
+        its own pair, so sessions loading different ranges don't keep
+        overwriting each other's indexes."""
+        key = hashlib.sha1(f"{self.inbox_file.resolve()}\0{scope}".encode("utf-8")).hexdigest()[:12]
+        search, embeddings = (path.with_name(f"{path.stem}.{key}{path.suffix}")
+                              for path in (self.search_index_file, self.embeddings_file))
+        return search, embeddings
+
+    def fill_inbox(self, inbox: CompactInbox, chunk_size: int = 500, trusted: bool = True,
+                   start: Optional[str] = None, end: Optional[str] = None) -> Iterator[int]:
+        """Stream the inbox into `inbox`, yielding the number of emails added per chunk.
+
+        `trusted` JSON inboxes are loaded without pydantic validation (see
+        `CompactInbox.extend_records`); mbox and Maildir inboxes always keep
+        their bodies on disk. `start` and `end` bound the timestamps as in
+        `iter_inbox`.
+        """
+        if not self.inbox_file.exists():
+            return
+        if trusted and not is_mailbox(self.inbox_file):
+            for records in chunked(self._iter_records(start, end), chunk_size):
+                inbox.extend_records(records)
+                yield len(records)
+            return
+        for chunk in self.iter_inbox(chunk_size, start, end):
+            inbox.extend(chunk)
+            yield len(chunk)
+
+    def append_emails(self, emails: Iterable[Email]) -> bool:
+        """Add new mail to a partitioned inbox, touching only the partitions it falls in."""
         try:
-            if self.inbox_file.exists():
-                with open(self.inbox_file, 'r', encoding='utf-8') as f:
-                    return [Email(**e) for e in json.load(f)]
+            partitions = self._partitions()
+            if partitions is None:
+                return False
+            partitions.append(email.model_dump(exclude_defaults=True) for email in emails)
+            return True
+        except:
+            return False
+
+    def partition_inbox(self, path: Path, granularity: str = "month") -> Path:
+        """Copy the inbox into a new date-partitioned directory at `path`."""
+        path = Path(path)
+        target = PartitionedInbox(path, granularity)
+        for chunk in self.iter_inbox():
+            target.append((email.model_dump(exclude_defaults=True) for email in chunk), fsync=False)
+        return path
+
+    def archive_inbox(self, path: Optional[Path] = None, codec: str = "zlib") -> Path:
+        """Write the inbox as a compressed block archive (see inbox_archive).
+
+        Point INBOX_PATH at the result to load from it; `get_email` and
+        `emails_between` then decompress only the blocks they need.
+        """
+        path = Path(path) if path is not None else self.inbox_file.with_suffix(ARCHIVE_SUFFIX)
+        records = (email.model_dump(exclude_defaults=True) for chunk in self.iter_inbox() for email in chunk)
+        write_archive(records, path, codec=codec)
+        return path
+
+    def _archive(self) -> Optional[InboxArchive]:
+        """The inbox archive, if the inbox is one; reopened only when the file changes."""
+        if not self.inbox_file.is_file() or not is_archive(self.inbox_file):
+            return None
+        return self._cached("archive", [self.inbox_file], lambda: InboxArchive(self.inbox_file))
+
+    def get_email(self, email_id: str) -> Optional[Email]:
+        """One email by id: a single block read for an archive, a scan otherwise."""
+        try:
+            archive = self._archive()
+            if archive is not None:
+                record = archive.get(email_id)
+                return Email(**record) if record is not None else None
+            for chunk in self.iter_inbox():
+                for email in chunk:
+                    if email.id == email_id:
+                        return email
+            return None
+        except:
+            return None
+
+    def emails_between(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Email]:
+        """Emails with ISO timestamps in [start, end]; archives and partitioned
+        inboxes read only the blocks or partitions that overlap it."""
+        try:
+            return [email for chunk in self.iter_inbox(start=start, end=end) for email in chunk]
+        except:
             return []
+
+    def load_inbox(self) -> List[Email]:
+        try:
+            return [email for chunk in self.iter_inbox() for email in chunk]
         except:
             return []
 
@@ -0,0 +1,115 @@
+"""Conversation threads"""
+import hashlib
+import re
+import threading
+from bisect import insort
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from app.models import Email
+
+# Reply/forward markers, optionally numbered ("Re[2]:") or bracketed tags
+_PREFIX = re.compile(r"^\s*(?:(?:re|fwd?|aw|sv|tr)(?:\[\d+\])?\s*:|\[[^\]]*\])\s*", re.IGNORECASE)
+_ADDRESS = re.compile(r"<([^>]+)>")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_subject(subject: str) -> str:
+    """Subject without Re:/Fwd: prefixes, case or spacing differences."""
+    previous = None
+    while previous != subject:
+        previous, subject = subject, _PREFIX.sub("", subject, count=1)
+    return _SPACES.sub(" ", subject).strip().casefold()
+
+
+def participants(email: Email) -> FrozenSet[str]:
+    """Sender and recipient addresses, so replies in either direction match."""
+    found = set()
+    for field in (email.sender, email.recipient):
+        for part in field.split(","):
+            match = _ADDRESS.search(part)
+            address = (match.group(1) if match else part).strip().lower()
+            if address:
+                found.add(address)
+    return frozenset(found)
+
+
+def thread_key(email: Email) -> str:
+    raw = "\0".join([normalize_subject(email.subject), *sorted(participants(email))])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class ThreadIndex:
+    """Maps thread ids to their emails in time order.
+
+    A thread is the emails sharing a normalised subject and set of
+    participants. Inserting an email only touches its own thread (and its
+    previous one if the subject or participants changed), so the index is
+    kept current incrementally as emails arrive or are edited.
+
+    With `resolve` set (e.g. to a CompactInbox's `get`), only ids are kept
+    and emails are looked up on access instead of being held by the index.
+    """
+
+    def __init__(self):
+        self._threads: Dict[str, List[Tuple[str, str, Optional[Email]]]] = {}
+        self._keys: Dict[str, Tuple[str, Tuple[str, ...], Optional[Email]]] = {}
+        self._lock = threading.Lock()
+        self.resolve: Optional[Callable[[str], Optional[Email]]] = None
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    def insert(self, email: Email) -> str:
+        """Index `email` and set its thread_id; cheap if nothing changed."""
+        fields = (email.subject, email.sender, email.recipient, email.timestamp)
+        known = self._keys.get(email.id)
+        if known is not None and known[1] == fields and known[2] is (None if self.resolve else email):
+            return known[0]
+        tid = thread_key(email)
+        held = None if self.resolve else email
+        with self._lock:
+            if known is not None:
+                self._unlink(email.id, known[0])
+            # Ids are unique within a thread, so the Email is never compared
+            insort(self._threads.setdefault(tid, []), (email.timestamp, email.id, held))
+            self._keys[email.id] = (tid, fields, held)
+        email.thread_id = tid
+        return tid
+
+    def insert_many(self, emails: Iterable[Email]) -> None:
+        for email in emails:
+            self.insert(email)
+
+    def remove(self, email_id: str) -> None:
+        with self._lock:
+            known = self._keys.pop(email_id, None)
+            if known is not None:
+                self._unlink(email_id, known[0])
+
+    def _unlink(self, email_id: str, tid: str) -> None:
+        thread = self._threads.get(tid, [])
+        thread[:] = [entry for entry in thread if entry[1] != email_id]
+        if not thread:
+            self._threads.pop(tid, None)
+
+    def _email(self, email_id: str, email: Optional[Email]) -> Optional[Email]:
+        return email if email is not None else self.resolve(email_id)
+
+    def thread(self, tid: Optional[str]) -> List[Email]:
+        """Emails of a thread, oldest first."""
+        found = (self._email(email_id, email) for _, email_id, email in self._threads.get(tid, ()))
+        return [email for email in found if email is not None]
+
+    def thread_of(self, email: Email) -> List[Email]:
+        return self.thread(self.insert(email))
+
+    def newest(self, email: Email) -> Email:
+        """The latest email of `email`'s thread."""
+        thread = self._threads.get(self.insert(email))
+        newest = self._email(thread[-1][1], thread[-1][2]) if thread else None
+        return newest if newest is not None else email
+
+    def clear(self) -> None:
+        with self._lock:
+            self._threads.clear()
+            self._keys.clear()
@@ -0,0 +1,68 @@
+"""Benchmark: the block-indexed inbox archive against a plain JSON inbox
+
+Writes a synthetic inbox as one JSON array and as .emlz archives (zlib and
+lzma), then times StorageService.get_email for one email near the end and
+emails_between for the last 7 days against the JSON file and the zlib
+archive, checking both return the same emails. Each call is made on a
+fresh StorageService, so archive timings include opening the archive and
+no block is cached.
+
+    python -m scripts.bench_archive [--emails 100000]
+"""
+import argparse
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app.services.inbox_archive import write_archive
+from app.services.storage import StorageService
+from scripts.synthetic import record_list
+
+
+def timed(fn, path: Path, repeat: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        storage = StorageService(str(path.parent))
+        storage.inbox_file = path
+        started = time.perf_counter()
+        result = fn(storage)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--emails", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365, help="days of mail in the inbox")
+    args = parser.parse_args()
+
+    records = record_list(args.emails, days=args.days)
+    wanted = records[-len(records) // 10]["id"]
+    week = (datetime.fromisoformat(records[-1]["timestamp"]) - timedelta(days=7)).isoformat(timespec="seconds")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        plain = tmp / "inbox.json"
+        plain.write_text(json.dumps(records), encoding="utf-8")
+        archives = {codec: tmp / f"inbox.{codec}.emlz" for codec in ("zlib", "lzma")}
+        for codec, path in archives.items():
+            write_archive(iter(records), path, codec=codec)
+        mb = 2 ** 20
+        print(f"{args.emails} emails over {args.days} days: JSON {plain.stat().st_size / mb:.1f} MB, "
+              + ", ".join(f"{codec} archive {path.stat().st_size / mb:.1f} MB" for codec, path in archives.items()))
+
+        print(f"{'inbox':<14} {'get_email':>10}  {'last 7 days':>11}")
+        expected = None
+        for name, path in (("JSON", plain), ("zlib archive", archives["zlib"])):
+            one, email = timed(lambda storage: storage.get_email(wanted), path)
+            recent, emails = timed(lambda storage: storage.emails_between(week), path)
+            found = (email.id if email else None, [e.id for e in emails])
+            if expected is not None and found != expected:
+                raise SystemExit("the archive returned different emails")
+            expected = found
+            print(f"{name:<14} {one * 1e3:>7.2f} ms  {recent * 1e3:>8.2f} ms  ({len(emails)} emails)")
+
+
+if __name__ == "__main__":
+    main()
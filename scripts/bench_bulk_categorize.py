@@ -0,0 +1,49 @@
+"""Benchmark: per-email mock categorization against the bulk categorizer
+
+Categorizes synthetic inboxes once with the mock provider's per-email
+cascade and once with LLM_PROVIDER=local, whose categorization batches
+go through BulkCategorizer, and checks the responses are identical.
+
+    python -m scripts.bench_bulk_categorize [--sizes 10000 100000]
+"""
+import argparse
+import time
+from typing import Callable, List
+
+from app.services.llm_client import llm_client
+from app.services.storage import storage
+from scripts.synthetic import records
+
+
+def timed(fn: Callable[[], List[str]]) -> tuple:
+    started = time.perf_counter()
+    responses = fn()
+    return time.perf_counter() - started, responses
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--words", type=int, default=120, help="average body length in words")
+    args = parser.parse_args()
+
+    prompt = storage.get_default_prompts().categorization_prompt
+    provider = llm_client.provider
+    print(f"{'emails':>9}  {'per-email mock':>14}  {'local (bulk)':>12}  speedup")
+    try:
+        for size in args.sizes:
+            contexts = [{"email_body": r["body"], "email_subject": r["subject"]}
+                        for r in records(size, body_words=args.words)]
+            llm_client.provider = "mock"
+            before, expected = timed(lambda: [llm_client._mock_categorize(c) for c in contexts])
+            llm_client.provider = "local"
+            after, got = timed(lambda: llm_client.mock_llm_batch(prompt, contexts))
+            if got != expected:
+                raise SystemExit(f"responses differ at {size} emails")
+            print(f"{size:>9}  {before:>12.2f} s  {after:>10.2f} s  {before / after:6.2f}x")
+    finally:
+        llm_client.provider = provider
+
+
+if __name__ == "__main__":
+    main()
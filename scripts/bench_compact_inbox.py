@@ -0,0 +1,79 @@
+"""Benchmark: a list of Email models against CompactInbox
+
+Loads a synthetic JSON Lines inbox into a list of validated Email models
+and into a CompactInbox (its trusted extend_records path), and reports
+load time, the memory the loaded inbox holds (tracemalloc, in a second
+pass) and the time to count emails per category.
+
+    python -m scripts.bench_compact_inbox [--emails 100000]
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from app.models import Email
+from app.services.compact_inbox import CompactInbox
+from scripts.synthetic import records
+
+CATEGORIES = ["Important", "Newsletter", "Spam", "To-Do", None]
+
+
+def load_list(path: Path):
+    with open(path, encoding="utf-8") as f:
+        return [Email(**json.loads(line)) for line in f]
+
+
+def load_compact(path: Path):
+    inbox = CompactInbox()
+    with open(path, encoding="utf-8") as f:
+        inbox.extend_records(json.loads(line) for line in f)
+    return inbox
+
+
+def measure(load: Callable[[Path], Any], path: Path) -> Dict[str, float]:
+    started = time.perf_counter()
+    emails = load(path)
+    seconds = time.perf_counter() - started
+    del emails
+    tracemalloc.start()
+    emails = load(path)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {"seconds": seconds, "mb": held / 2 ** 20}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--emails", type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "inbox.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records(args.emails):
+                record["category"] = rng.choice(CATEGORIES)
+                f.write(json.dumps(record) + "\n")
+        print(f"{args.emails} emails, {path.stat().st_size / 2 ** 20:.1f} MB of JSON Lines")
+        print(f"{'':<22} {'load':>8}  {'held':>9}  {'category counts':>15}")
+        for name, load in (("list of Email", load_list), ("CompactInbox", load_compact)):
+            result = measure(load, path)
+            emails = load(path)
+            started = time.perf_counter()
+            if isinstance(emails, CompactInbox):
+                emails.category_counts()
+            else:
+                Counter(email.category for email in emails)
+            counting = time.perf_counter() - started
+            print(f"{name:<22} {result['seconds']:6.2f} s  {result['mb']:6.0f} MB  {counting * 1e3:12.2f} ms")
+            del emails
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark: the hashed n-gram embedding index, flat and IVF
+
+For synthetic inboxes of several sizes, times building an EmbeddingIndex,
+single and batched flat queries, training the IVF coarse quantiser and
+IVF queries, and reports IVF recall@10 against the exact flat results.
+
+    python -m scripts.bench_embeddings [--sizes 10000 100000] [--queries 96] [--nprobe 16]
+"""
+import argparse
+import random
+import time
+from typing import List
+
+from app.models import Email
+from app.services.embeddings import EmbeddingIndex, HashingVectorizer
+from scripts.synthetic import records, words
+
+
+def per_query(fn, queries: List[str]) -> float:
+    started = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - started) / len(queries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=96)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16, help="IVF lists scanned per query")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    queries = [words(rng, 6, keyword_rate=0.3) for _ in range(args.queries)]
+    print(f"{'emails':>8}  {'build':>7}  {'flat':>8}  {'batched':>8}  {'IVF train':>9}  {'IVF':>8}  recall@{args.k}")
+    for size in args.sizes:
+        emails = [Email.model_construct(**record) for record in records(size)]
+        # Never trains on its own: IVF is switched on below, once flat timings are taken
+        index = EmbeddingIndex(HashingVectorizer(256), ivf_min=size + 1, nprobe=args.nprobe)
+        started = time.perf_counter()
+        index.insert_many(emails)
+        build = time.perf_counter() - started
+
+        flat = per_query(lambda q: index.search(q, args.k), queries)
+        started = time.perf_counter()
+        exact = index.search_many(queries, args.k)
+        batched = (time.perf_counter() - started) / len(queries)
+
+        started = time.perf_counter()
+        index.train()
+        train = time.perf_counter() - started
+        ivf = per_query(lambda q: index.search(q, args.k), queries)
+        approximate = index.search_many(queries, args.k)
+        recall = sum(len({i for i, _ in a} & {i for i, _ in e}) for a, e in zip(approximate, exact)) \
+            / sum(len(e) for e in exact)
+        print(f"{size:>8}  {build:>5.1f} s  {flat * 1e3:>5.2f} ms  {batched * 1e3:>5.2f} ms  "
+              f"{train:>7.1f} s  {ivf * 1e3:>5.2f} ms  {recall:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark: the mock LLM's keyword hit sets against per-stage scans
+
+Times categorization plus action extraction per email, first with the
+original any(kw in body) cascade of each stage, then through the mock
+LLM's stages, each with its own keyword hit set, and through the fused
+stage, which shares one hit set. Runs on synthetic bodies of several
+sizes, in keyword-dense text and in text without any keyword (every
+cascade runs to the end). Checks all three agree; timings are the best
+of `--repeat` runs.
+
+    python -m scripts.bench_keywords [--sizes 1024 16384 131072 1048576] [--emails 200]
+"""
+import argparse
+import json
+import random
+import time
+from typing import List, Tuple
+
+from app.services.llm_client import llm_client
+from scripts.synthetic import words
+
+
+def baseline(body: str, subject: str) -> Tuple[str, str]:
+    """The two stages as they ran before the shared keyword pass."""
+    email_body, email_subject = body.lower(), subject.lower()
+    category = ("Important", "Requires attention")
+    if (any(kw in email_body for kw in ["$", "budget", "payment", "cost", "funding"])
+            and any(kw in email_body for kw in ["urgent", "asap", "immediately", "confirm"])):
+        category = ("To-Do", "Financial matter requiring immediate action")
+    elif any(kw in email_body for kw in ["meeting", "schedule", "calendar", "appointment", "call"]):
+        category = ("To-Do", "Meeting request requiring response")
+    elif any(kw in email_body for kw in ["urgent", "asap", "critical", "immediate", "deadline"]):
+        category = ("Important", "Marked as urgent or time-sensitive")
+    elif any(kw in email_body for kw in ["unsubscribe", "newsletter", "weekly", "digest"]):
+        category = ("Newsletter", "Newsletter or promotional content")
+    elif any(kw in email_body + email_subject for kw in [
+        "click here", "win", "prize", "lottery", "congratulations",
+        "verify account", "limited offer", "act now", "claim"
+    ]):
+        category = ("Spam", "Contains spam indicators and urgency tactics")
+
+    email_body = body.lower()
+    actions = []
+    if "meeting" in email_body or "schedule" in email_body:
+        actions.append({"task": "Confirm meeting attendance and schedule", "deadline": "2025-11-28"})
+    if "review" in email_body or "feedback" in email_body:
+        actions.append({"task": "Review and provide feedback", "deadline": "2025-11-30"})
+    if any(kw in email_body for kw in ["submit", "send", "share", "upload"]):
+        actions.append({"task": "Complete and submit required items", "deadline": "2025-11-30"})
+    if "rsvp" in email_body.lower():
+        actions.append({"task": "RSVP for event", "deadline": "2025-11-27"})
+    return json.dumps({"category": category[0], "reason": category[1]}), json.dumps(actions)
+
+
+def stages(body: str, subject: str) -> Tuple[str, str]:
+    context = {"email_body": body, "email_subject": subject}
+    return llm_client._mock_categorize(context), llm_client._mock_extract_actions(context)
+
+
+def fused(body: str, subject: str) -> str:
+    return llm_client._mock_fused({"email_body": body, "email_subject": subject})
+
+
+def as_fused(category: str, actions: str) -> str:
+    return json.dumps({**json.loads(category), "actions": json.loads(actions)})
+
+
+# Share of words taken from the keyword groups
+TEXTS = {"keyword-dense": 0.03, "no keywords": 0.0}
+
+
+def bodies(size: int, count: int, keyword_rate: float, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [words(rng, size // 6, keyword_rate)[:size] for _ in range(count)]
+
+
+def timed(fn, texts: List[str], repeat: int) -> Tuple[float, list]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [fn(text, "Project update") for text in texts]
+        best = min(best, time.perf_counter() - started)
+    return best / len(texts), results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 16384, 131072, 1048576])
+    parser.add_argument("--emails", type=int, default=200,
+                        help="emails per size, fewer for large bodies (at most 16 MB of text)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'text':<14} {'body':>8}  {'per-stage scans':>15}  {'stages':>9}  {'fused':>9}  speedup (fused)")
+    for name, keyword_rate in TEXTS.items():
+        for size in args.sizes:
+            count = max(8, min(args.emails, (16 << 20) // size))
+            texts = bodies(size, count, keyword_rate, args.seed)
+            before, expected = timed(baseline, texts, args.repeat)
+            separate, got = timed(stages, texts, args.repeat)
+            together, got_fused = timed(fused, texts, args.repeat)
+            if got != expected or got_fused != [as_fused(*result) for result in expected]:
+                raise SystemExit(f"results differ: {name}, {size} bytes")
+            print(f"{name:<14} {size:>7}B  {before * 1e3:>12.3f} ms  {separate * 1e3:>6.3f} ms  "
+                  f"{together * 1e3:>6.3f} ms  {before / separate:5.2f}x ({before / together:.2f}x)")
+
+if __name__ == "__main__":
+    main()
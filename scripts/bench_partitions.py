@@ -0,0 +1,76 @@
+"""Benchmark: loading recent mail from a date-partitioned inbox
+
+Writes three years of synthetic mail as one JSON Lines file and as
+monthly partitions (StorageService.partition_inbox), then times loading
+the last 7 days into a CompactInbox through fill_inbox from each, and
+reports how many bytes of inbox files that load had to read. Also times
+appending one email to the partitioned inbox.
+
+    python -m scripts.bench_partitions [--emails 300000]
+"""
+import argparse
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app.models import Email
+from app.services.compact_inbox import CompactInbox
+from app.services.inbox_partitions import PartitionedInbox
+from app.services.storage import StorageService
+from scripts.synthetic import records
+
+
+def load(path: Path, start: str):
+    storage = StorageService(str(path.parent))
+    storage.inbox_file = path
+    inbox = CompactInbox()
+    started = time.perf_counter()
+    for _ in storage.fill_inbox(inbox, start=start):
+        pass
+    return time.perf_counter() - started, inbox
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--emails", type=int, default=300000)
+    parser.add_argument("--days", type=int, default=3 * 365)
+    args = parser.parse_args()
+
+    end = datetime(2025, 11, 25, 9, 30)
+    start = (end - timedelta(days=7)).isoformat(timespec="seconds")
+    with tempfile.TemporaryDirectory() as tmp:
+        single = Path(tmp) / "inbox.jsonl"
+        with open(single, "w", encoding="utf-8") as f:
+            for record in records(args.emails, days=args.days, end=end):
+                f.write(json.dumps(record) + "\n")
+        storage = StorageService(tmp)
+        storage.inbox_file = single
+        partitioned = storage.partition_inbox(Path(tmp) / "partitions")
+        partitions = PartitionedInbox(partitioned)
+        mb = 2 ** 20
+        print(f"{args.emails} emails over {args.days} days, "
+              f"{len(partitions.partitions())} monthly partitions, {single.stat().st_size / mb:.0f} MB")
+
+        single_seconds, expected = load(single, start)
+        part_seconds, got = load(partitioned, start)
+        if [e.id for e in got] != [e.id for e in expected]:
+            raise SystemExit("the partitioned inbox loaded different emails")
+        read = sum(path.stat().st_size for path in partitions.partitions(start))
+        print(f"last 7 days ({len(got)} emails):")
+        print(f"  single file   {single_seconds:7.3f} s  reads {single.stat().st_size / mb:7.1f} MB")
+        print(f"  partitioned   {part_seconds:7.3f} s  reads {read / mb:7.1f} MB")
+
+        storage.inbox_file = partitioned
+        before = {path: path.stat().st_mtime_ns for path in partitions.partitions()}
+        started = time.perf_counter()
+        storage.append_emails([Email(id="new", sender="a@example.com", recipient="me@example.com",
+                                     subject="New", body="Hello", timestamp=end.isoformat())])
+        seconds = time.perf_counter() - started
+        touched = [path.name for path in partitions.partitions() if before.get(path) != path.stat().st_mtime_ns]
+        print(f"append one email: {seconds * 1e3:.1f} ms, changed {touched}")
+
+
+if __name__ == "__main__":
+    main()
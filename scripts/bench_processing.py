@@ -0,0 +1,68 @@
+"""Benchmark: process_emails in serial, threads and processes modes
+
+Categorizes and extracts actions for a synthetic inbox with the mock
+provider in each PROCESSING_MODE and checks every mode produces the same
+results. `--latency` adds a simulated provider round trip to each LLM
+batch (serial and threads modes only: spawned worker processes do not see
+the patch), which is where threads pay off.
+
+    python -m scripts.bench_processing [--emails 10000] [--workers 4] [--latency 0]
+"""
+import argparse
+import os
+import time
+from typing import Dict, List, Tuple
+
+from app.models import Email
+from app.services.email_processing import EmailProcessor
+from app.services.llm_client import llm_client
+from app.services.storage import storage
+from scripts.synthetic import records
+
+
+def run(emails: List[Email], mode: str, workers: int) -> Tuple[float, Dict[str, object]]:
+    for email in emails:
+        email.category, email.actions, email.fingerprints, email.processing_error = None, [], {}, None
+    processor = EmailProcessor()
+    processor.mode, processor.workers, processor.persist, processor.dedupe = mode, workers, False, False
+    started = time.perf_counter()
+    processor.process_emails(emails, storage.get_default_prompts())
+    seconds = time.perf_counter() - started
+    return seconds, {email.id: (email.category, email.actions) for email in emails}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--emails", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="ms added to each LLM batch")
+    parser.add_argument("--modes", nargs="+", default=["serial", "threads", "processes"])
+    args = parser.parse_args()
+
+    llm_client.cache_enabled = False
+    llm_client.debug = False
+    if args.latency:
+        batch = llm_client.mock_llm_batch
+
+        def slow_batch(prompt, contexts):
+            time.sleep(args.latency / 1000)
+            return batch(prompt, contexts)
+
+        llm_client.mock_llm_batch = slow_batch
+    emails = [Email(**record) for record in records(args.emails, body_words=200)]
+    print(f"{args.emails} emails, {args.workers} workers, {os.cpu_count()} CPUs, "
+          f"batch size {llm_client.batch_size}, latency {args.latency:g} ms per batch")
+
+    expected = None
+    for mode in args.modes:
+        if mode == "processes" and args.latency:
+            print(f"{mode:<10} skipped (the simulated latency does not reach worker processes)")
+            continue
+        seconds, results = run(emails, mode, args.workers)
+        same = expected is None or results == expected
+        expected = expected or results
+        print(f"{mode:<10} {seconds:7.2f} s  {'identical results' if same else 'RESULTS DIFFER'}")
+
+
+if __name__ == "__main__":
+    main()
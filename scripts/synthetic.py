@@ -0,0 +1,53 @@
+"""Synthetic inboxes for the benchmark scripts
+
+Everything is generated from a seeded random.Random, so a run is
+reproducible and needs no data beyond this file.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+# Filler vocabulary, plus the words the mock LLM's keyword groups look for
+FILLER = (
+    "the a to of and in for on with this that we our your please team project update quarter "
+    "report plan office customer product release notes numbers thanks regards next week today "
+    "tomorrow friday monday morning afternoon details document draft version status question "
+    "follow up discuss idea proposal contract vendor invoice travel hotel flight lunch kickoff"
+).split()
+KEYWORDS = (
+    "budget payment cost funding urgent asap confirm meeting schedule calendar appointment call "
+    "critical deadline unsubscribe newsletter weekly digest review feedback submit send share "
+    "upload rsvp partnership prize lottery congratulations claim"
+).split()
+SUBJECTS = (
+    "Budget review", "Weekly digest", "Meeting request", "Project update", "Invoice due",
+    "Partnership proposal", "Team offsite", "Feedback needed", "You won a prize", "Release notes",
+)
+
+
+def words(rng: random.Random, count: int, keyword_rate: float = 0.03) -> str:
+    return " ".join(rng.choice(KEYWORDS) if rng.random() < keyword_rate else rng.choice(FILLER)
+                    for _ in range(count))
+
+
+def records(count: int, seed: int = 0, body_words: int = 120, days: int = 30,
+            end: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """`count` inbox records, oldest first, spread evenly over the `days` before `end`."""
+    rng = random.Random(seed)
+    end = end or datetime(2025, 11, 25, 9, 30)
+    step = timedelta(days=days) / max(1, count)
+    start = end - timedelta(days=days)
+    senders = [f"person{i}@example{i % 17}.com" for i in range(max(1, count // 20))]
+    for i in range(count):
+        yield {
+            "id": f"e{i}",
+            "sender": rng.choice(senders),
+            "recipient": "me@example.com",
+            "subject": f"{rng.choice(SUBJECTS)} {rng.randrange(1000)}",
+            "body": words(rng, rng.randint(body_words // 2, body_words * 3 // 2)),
+            "timestamp": (start + step * i).isoformat(timespec="seconds"),
+        }
+
+
+def record_list(count: int, **kwargs: Any) -> List[Dict[str, Any]]:
+    return list(records(count, **kwargs))
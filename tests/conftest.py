@@ -0,0 +1,33 @@
+import pytest
+
+from app.models import Draft, Email
+
+
+@pytest.fixture
+def make_email():
+    def make(email_id, subject="Project update", body="Please send the report by Friday."):
+        return Email(id=email_id, sender="bob@example.com", recipient="me@example.com", subject=subject,
+                     body=body, timestamp="2025-11-25T09:30:00")
+    return make
+
+
+@pytest.fixture
+def make_draft():
+    def make(draft_id, email_id="1"):
+        return Draft(id=draft_id, email_id=email_id, subject="Re: Report", body="Thanks.", metadata={},
+                     created_at="2025-11-25T09:30:00")
+    return make
+
+
+@pytest.fixture
+def write_mbox():
+    """Writes an mbox of `count` emails m0..m{count-1}, each asking to
+    review the budget for quarter i."""
+    def write(path, count):
+        with open(path, "w") as f:
+            for i in range(count):
+                f.write(f"From sender{i}@example.com Mon Nov 24 09:00:00 2025\n"
+                        f"Message-ID: <m{i}@example.com>\nFrom: sender{i}@example.com\nTo: me@example.com\n"
+                        f"Subject: Budget review {i}\nDate: Mon, 24 Nov 2025 09:00:00 +0000\n\n"
+                        f"Please review the budget numbers for quarter {i}.\n\n")
+    return write
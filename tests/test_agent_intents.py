@@ -0,0 +1,49 @@
+import pytest
+
+from app.models import Email
+from app.services.agent import EmailAgent
+from app.services.compact_inbox import CompactInbox
+
+
+@pytest.fixture
+def inbox():
+    emails = CompactInbox()
+    emails.extend([
+        Email(id="1", sender="bob@example.com", recipient="me@example.com", subject="Report",
+              body="Please send the report.", timestamp="2025-11-25T09:30:00", category="Important",
+              actions=[{"task": "Send the report", "deadline": "2025-11-28"}]),
+        Email(id="2", sender="news@example.com", recipient="me@example.com", subject="Weekly digest",
+              body="This week in tech.", timestamp="2025-11-25T10:00:00", category="Newsletter"),
+    ])
+    emails.indexes.aggregates.rebuild(emails)
+    return emails
+
+
+@pytest.mark.parametrize("query", ["What are my tasks?", "how many tasks do I have", "tasks",
+                                   "Show upcoming deadlines", "what action items are pending?"])
+def test_task_questions_are_answered_directly(inbox, query):
+    answer = EmailAgent().answer_directly(query, None, inbox)
+    assert answer is not None and "Send the report" in answer
+
+
+@pytest.mark.parametrize("query", [
+    "Draft a reply saying I'll meet the deadline",
+    "Write to Bob that the task is done",
+    "Reply to the newsletter and unsubscribe",
+    "Is the deadline for the report still Friday?",
+    "Remind me what the project deadline was about",
+    "how many emails did bob send me",
+    "How many urgent emails from Alice?",
+    "Find important emails about the budget",
+    "Which newsletters did Bob send?",
+    "What tasks did Bob give me?",
+])
+def test_other_mentions_are_left_to_the_llm(inbox, query):
+    assert EmailAgent().answer_directly(query, None, inbox) is None
+
+
+def test_category_questions_are_answered_directly(inbox):
+    agent = EmailAgent()
+    assert agent.answer_directly("How many newsletters?", None, inbox) == "You have 1 Newsletter email."
+    assert "Weekly digest" in agent.answer_directly("show newsletters", None, inbox)
+    assert "Newsletter: 1" in agent.answer_directly("How many emails do I have?", None, inbox)
@@ -0,0 +1,51 @@
+import json
+
+from app.services.aggregates import InboxAggregates
+from app.services.compact_inbox import CompactInbox
+from app.services.email_processing import EmailProcessor
+from app.services.llm_client import llm_client
+from app.services.storage import storage
+
+
+def test_malformed_actions_do_not_abort_processing(monkeypatch, make_email):
+    monkeypatch.setattr(llm_client, "cache_enabled", False)
+    monkeypatch.setattr(llm_client, "_mock_extract_actions", lambda context: json.dumps(
+        ["Reply to Bob", 3, None, {"task": "Send the report", "deadline": "2025-11-28"}]
+    ))
+    emails = CompactInbox()
+    emails.extend([make_email("1"), make_email("2", subject="Other")])
+    processor = EmailProcessor()
+    processor.persist = False
+    processor.index_emails(emails)
+    processor.process_emails(emails, storage.get_default_prompts())
+
+    assert all(email.processing_error is None for email in emails)
+    assert emails[0].actions == [{"task": "Reply to Bob", "deadline": None},
+                                 {"task": "Send the report", "deadline": "2025-11-28"}]
+    actions = emails.indexes.aggregates.actions()
+    assert [action["task"] for _, action in actions[:2]] == ["Send the report", "Send the report"]
+    assert len(actions) == 4
+
+
+def test_each_inbox_has_its_own_aggregates(make_email):
+    first, second = CompactInbox(), CompactInbox()
+    first.extend([make_email("1"), make_email("2")])
+    second.extend([make_email("3")])
+    processor = EmailProcessor()
+    processor.index_emails(first)
+    processor.index_emails(second)
+
+    assert first.indexes.aggregates.count(None) == 2
+    assert second.indexes.aggregates.count(None) == 1
+    assert second.indexes.threads.thread_of(second[0]) == [second[0]]
+
+
+def test_aggregates_tolerate_non_dict_actions(make_email):
+    email = make_email("1")
+    email.actions = ["Reply to Bob", {"task": "Pay", "deadline": "2025-01-01"}]
+    aggregates = InboxAggregates()
+    aggregates.update(email)
+    assert aggregates.actions() == [("1", {"task": "Pay", "deadline": "2025-01-01"}),
+                                    ("1", {"task": "Reply to Bob", "deadline": None})]
+    aggregates.remove("1")
+    assert aggregates.action_count() == 0
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services.llm_client import LLMClient
+
+DELAY = 0.05
+
+
+class SlowCompletions(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(DELAY)
+        body = json.dumps({"choices": [{"message": {"content": "ok"}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SlowCompletions)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def client(base_url, concurrency, timeout=5.0):
+    llm = LLMClient()
+    llm.provider, llm.api_key, llm.base_url = "openai", "test", base_url
+    llm.cache_enabled = False
+    llm.max_concurrency = concurrency
+    llm.timeout = timeout
+    return llm
+
+
+def throughput(llm, requests):
+    started = time.perf_counter()
+    responses = llm.run_llm_many("Summarize", [{"i": i} for i in range(requests)])
+    assert responses == ["ok"] * requests
+    return requests / (time.perf_counter() - started)
+
+
+def test_concurrent_requests_share_a_bounded_pool(server):
+    serial = client(server, 1)
+    parallel = client(server, 8)
+    assert throughput(parallel, 32) > 3 * throughput(serial, 8)
+    assert serial.pool.connections_opened == 1
+    assert parallel.pool.connections_opened <= 8
+
+
+def test_a_timed_out_call_keeps_its_slot_until_it_finishes(server):
+    llm = client(server, 1, timeout=0.05)
+    release = threading.Event()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await llm._bounded(release.wait, 5)
+        semaphore = llm._semaphore()
+        assert semaphore.locked()
+        release.set()
+        for _ in range(100):
+            if not semaphore.locked():
+                break
+            await asyncio.sleep(0.01)
+        assert not semaphore.locked()
+
+    asyncio.run(run())
+
+
+def test_a_stalled_server_fails_the_request_within_the_timeout(server):
+    llm = client(server, 1, timeout=DELAY / 5)
+    started = time.perf_counter()
+    response = json.loads(llm.run_llm("Summarize", {"i": 0}))
+    assert response["status"] == "failed"
+    assert time.perf_counter() - started < DELAY * 3
@@ -0,0 +1,31 @@
+from app.services.storage import StorageService
+
+
+def test_drafts_stay_cached_after_a_write_behind_flush(tmp_path, monkeypatch, make_draft):
+    storage = StorageService(str(tmp_path))
+    storage.drafts_durability = "balanced"
+    storage.save_draft(make_draft("a"))
+    storage.flush_drafts()
+    assert [draft.id for draft in storage.load_drafts()] == ["a"]
+
+    loads = []
+    store = storage.draft_store.store
+    load_all = store.load_all
+    monkeypatch.setattr(store, "load_all", lambda: loads.append(1) or load_all())
+    storage.save_draft(make_draft("b"))
+    storage.save_drafts([make_draft("c"), make_draft("d")])
+    storage.delete_draft("a")
+    storage.flush_drafts()
+
+    assert [draft.id for draft in storage.load_drafts()] == ["b", "c", "d"]
+    assert loads == []
+    assert [draft.id for draft in load_all()] == ["b", "c", "d"]
+
+
+def test_a_malformed_legacy_drafts_file_does_not_block_drafts(tmp_path, make_draft):
+    storage = StorageService(str(tmp_path))
+    storage.drafts_durability = "strict"
+    storage.drafts_file.write_text("{broken", encoding="utf-8")
+    assert storage.save_draft(make_draft("a"))
+    assert [draft.id for draft in storage.load_drafts()] == ["a"]
+    assert StorageService(str(tmp_path)).load_drafts()[0].id == "a"
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from app.services.agent import EmailAgent
+from app.services.compact_inbox import CompactInbox
+from app.services.email_processing import EmailProcessor
+from app.services.mailbox import MboxSource, open_mailbox
+from app.services.search_index import SearchIndex
+from app.services.storage import storage
+
+
+def load(path, scope=""):
+    emails = CompactInbox()
+    emails.indexes.scope = scope
+    emails.extend(open_mailbox(path).iter_emails())
+    EmailProcessor().index_emails(emails)
+    EmailAgent().index_emails(emails)
+    return emails
+
+
+def test_mailbox_bodies_are_read_once_on_first_search(tmp_path, monkeypatch, write_mbox):
+    monkeypatch.setattr(storage, "search_index_file", tmp_path / "search_index.npz")
+    monkeypatch.setattr(storage, "embeddings_file", tmp_path / "embeddings.npz")
+    reads = []
+    body = MboxSource.body
+    monkeypatch.setattr(MboxSource, "body", lambda self, key: reads.append(key) or body(self, key))
+    path = tmp_path / "inbox.mbox"
+    write_mbox(path, 50)
+
+    emails = load(path)
+    assert reads == []
+    assert len(emails.indexes.pending) == 50
+
+    agent = EmailAgent()
+    agent._searchable(emails)
+    assert sorted(reads) == list(range(50))
+    assert agent.similar_emails(emails[0], emails)
+    assert len(reads) == 50
+
+    # The next session finds them in the saved indexes, keyed on mailbox offsets
+    emails = load(path)
+    assert not emails.indexes.pending
+    assert emails.indexes.search.search("budget quarter 7", 1)[0][0] == "m7@example.com"
+    assert len(reads) == 50
+
+
+def test_each_loaded_range_keeps_its_own_saved_indexes(tmp_path, monkeypatch, write_mbox):
+    monkeypatch.setattr(storage, "search_index_file", tmp_path / "search_index.npz")
+    monkeypatch.setattr(storage, "embeddings_file", tmp_path / "embeddings.npz")
+    path = tmp_path / "inbox.mbox"
+    monkeypatch.setattr(storage, "inbox_file", path)
+    write_mbox(path, 5)
+
+    for scope in ("Last 7 days", ""):
+        EmailAgent()._searchable(load(path, scope))
+    assert len(list(tmp_path.glob("search_index.*.npz"))) == 2
+    assert len(list(tmp_path.glob("embeddings.*.npz"))) == 2
+    assert not load(path, "Last 7 days").indexes.pending
+
+
+def test_a_failed_index_save_leaves_no_temp_file(tmp_path, monkeypatch):
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        SearchIndex().save(tmp_path / "search_index.npz")
+    assert list(tmp_path.iterdir()) == []
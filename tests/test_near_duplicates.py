@@ -0,0 +1,45 @@
+from app.services.email_processing import EmailProcessor
+from app.services.near_duplicates import SimHashIndex
+from app.services.storage import storage
+
+BODY = "Please review the attached doc and send comments by Friday, thanks a lot"
+
+
+def process(emails):
+    processor = EmailProcessor()
+    processor.dedupe = True
+    processor.persist = False
+    processor.index_emails(emails)
+    processor.process_emails(emails, storage.get_default_prompts())
+    return emails
+
+
+def test_short_texts_are_never_matched():
+    index = SimHashIndex()
+    index.insert_many([("a", "", None), ("b", "", None)])
+    assert index.find("a") is None
+
+
+def test_near_duplicates_are_matched():
+    index = SimHashIndex()
+    index.insert_many([("a", BODY, None), ("b", BODY, None)])
+    assert index.find("b")[0] == "a"
+
+
+def test_empty_bodies_do_not_share_results(make_email):
+    emails = process([make_email("1", "Budget meeting tomorrow", ""),
+                      make_email("2", "You WIN a prize, claim now", "")])
+    assert emails[1].duplicate_of is None
+    assert emails[1].category == "Spam"
+
+
+def test_same_body_under_another_subject_is_not_a_duplicate(make_email):
+    emails = process([make_email("1", "Budget meeting", BODY), make_email("2", "Congratulations you win", BODY)])
+    assert emails[1].duplicate_of is None
+    assert emails[1].category == "Spam"
+
+
+def test_same_sender_and_subject_reuse_results(make_email):
+    emails = process([make_email("1", "Budget meeting", BODY), make_email("2", "Re: Budget meeting", BODY)])
+    assert emails[1].duplicate_of == "1"
+    assert emails[1].category == emails[0].category
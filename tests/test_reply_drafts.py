@@ -0,0 +1,25 @@
+import json
+
+from app.services.agent import EmailAgent
+from app.services.llm_client import LLMError, llm_client
+from app.services.storage import storage
+
+
+def test_error_responses_count_as_failed_drafts(monkeypatch, make_email):
+    error = llm_client._error_response(LLMError("rate limited", "RateLimitError"))
+    monkeypatch.setattr(llm_client, "run_llm_batch", lambda prompt, contexts: [
+        error if i % 2 else json.dumps({"subject": "Re: Question", "body": "Friday works."})
+        for i in range(len(contexts))
+    ])
+    agent = EmailAgent()
+    agent.workers = 1
+    emails = [make_email(str(i), f"Question {i}", "Can we meet on Friday?") for i in range(4)]
+    drafts = agent.generate_reply_drafts(emails, storage.get_default_prompts())
+
+    assert agent.last_bulk_stats["failed"] == 2
+    assert [draft.body for draft in drafts][:2] == ["Friday works.", "Thank you for your email. I will respond shortly."]
+
+
+def test_replies_without_a_body_are_not_accepted():
+    assert EmailAgent._parse_reply(json.dumps({"status": "ok"})) is None
+    assert EmailAgent._parse_reply(json.dumps({"body": "Sure."})) == {"body": "Sure."}
@@ -0,0 +1,35 @@
+from app.services.email_processing import content_fingerprint, source_fingerprint
+from app.services.mailbox import MboxSource, open_mailbox
+from app.services.result_store import ResultStore
+
+
+def test_restore_matches_mailbox_emails_without_reading_bodies(tmp_path, monkeypatch, write_mbox):
+    reads = []
+    body = MboxSource.body
+    monkeypatch.setattr(MboxSource, "body", lambda self, key: reads.append(key) or body(self, key))
+    path = tmp_path / "inbox.mbox"
+    write_mbox(path, 20)
+    store = ResultStore(tmp_path / "results.db")
+    emails = list(open_mailbox(path).iter_emails())
+    for email in emails:
+        email.category = "Important"
+    store.save_many(((email, content_fingerprint(email)) for email in emails), "v1", source_fingerprint)
+
+    reads.clear()
+    emails = list(open_mailbox(path).iter_emails())
+    assert store.restore(emails, content_fingerprint, source_fingerprint) == 20
+    assert reads == []
+    assert all(email.category == "Important" for email in emails)
+
+
+def test_rows_without_a_source_fall_back_to_content(tmp_path, write_mbox):
+    path = tmp_path / "inbox.mbox"
+    write_mbox(path, 3)
+    store = ResultStore(tmp_path / "results.db")
+    emails = list(open_mailbox(path).iter_emails())
+    emails[0].category = "Spam"
+    store.save_many([(emails[0], content_fingerprint(emails[0]))], "v1")
+
+    emails = list(open_mailbox(path).iter_emails())
+    assert store.restore(emails, content_fingerprint, source_fingerprint) == 1
+    assert emails[0].category == "Spam"